@@ -0,0 +1,229 @@
+from collections import Counter
+import numpy as np
+from analisis_whatsapp import Mensaje
+from columnar_whatsapp import DIA_SEMANA_EPOCA, MINUTOS_DIA, LogColumnar, columnas
+import perfil_whatsapp
+
+DIAS_SEMANA = ["L", "M", "X", "J", "V", "S", "D"]
+
+class AgregadoLog:
+    '''
+    Estadísticas de un log de Whatsapp calculadas en una sola pasada y para
+    todos los usuarios a la vez.
+
+    - nombres: lista de usuarios; la fila i de cada matriz corresponde a nombres[i].
+    - mes_base: primer mes del log, en meses transcurridos desde enero de 1970.
+    - por_mes: matriz usuarios x meses con el número de mensajes de cada mes.
+    - por_dia_semana: matriz usuarios x 7 con el número de mensajes por día de la semana.
+    - por_hora: matriz usuarios x 24 con el número de mensajes por hora del día.
+    - primero, ultimo: instante (en minutos) del primer y último mensaje de cada usuario.
+    - primero_total, ultimo_total: instante del primer y último mensaje del log.
+
+    Las funciones cuenta_* de analisis_whatsapp aceptan un AgregadoLog en lugar
+    de un log, de modo que un mismo agregado sirve para todos los informes.
+    '''
+    def __init__(self, nombres: list[str], mes_base: int, por_mes: np.ndarray,
+                 por_dia_semana: np.ndarray, por_hora: np.ndarray,
+                 primero: np.ndarray, ultimo: np.ndarray,
+                 primero_total: int, ultimo_total: int):
+        self.nombres = nombres
+        self.mes_base = mes_base
+        self.por_mes = por_mes
+        self.por_dia_semana = por_dia_semana
+        self.por_hora = por_hora
+        self.primero = primero
+        self.ultimo = ultimo
+        self.primero_total = primero_total
+        self.ultimo_total = ultimo_total
+
+    @classmethod
+    def vacio(cls, nombres: list[str]) -> 'AgregadoLog':
+        n_usuarios = len(nombres)
+        return cls(nombres, 0, np.zeros((n_usuarios, 0), dtype=np.int64),
+                   np.zeros((n_usuarios, 7), dtype=np.int64), np.zeros((n_usuarios, 24), dtype=np.int64),
+                   np.zeros(n_usuarios, dtype=np.int64), np.zeros(n_usuarios, dtype=np.int64), 0, 0)
+
+    @classmethod
+    @perfil_whatsapp.perfilado('agregado')
+    def desde_log(cls, log: 'list[Mensaje] | LogColumnar') -> 'AgregadoLog':
+        '''
+        Calcula el agregado de un log.
+
+        :param log: Lista de mensajes o log columnar
+        :type log: list[Mensaje] | LogColumnar
+        :return: Agregado con las estadísticas de todos los usuarios
+        :rtype: AgregadoLog
+        '''
+        minutos, usuarios, nombres = columnas(log)
+        perfil_whatsapp.cuenta('mensajes', len(minutos))
+        n_usuarios = len(nombres)
+        if len(minutos) == 0:
+            return cls.vacio(nombres)
+
+        usuarios = usuarios.astype(np.int64)
+        dias = minutos // MINUTOS_DIA
+        meses = dias.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        mes_base = int(meses.min())
+        n_meses = int(meses.max()) - mes_base + 1
+
+        def por_usuario(codigos: np.ndarray, n: int) -> np.ndarray:
+            return np.bincount(usuarios * n + codigos, minlength=n_usuarios * n).reshape(n_usuarios, n)
+
+        # Instante del primer y último mensaje de cada usuario, en el orden del log
+        primero = np.zeros(n_usuarios, dtype=np.int64)
+        ultimo = np.zeros(n_usuarios, dtype=np.int64)
+        presentes, posiciones = np.unique(usuarios, return_index=True)
+        primero[presentes] = minutos[posiciones]
+        presentes, posiciones = np.unique(usuarios[::-1], return_index=True)
+        ultimo[presentes] = minutos[::-1][posiciones]
+
+        return cls(nombres, mes_base,
+                   por_usuario(meses - mes_base, n_meses),
+                   por_usuario((dias + DIA_SEMANA_EPOCA) % 7, 7),
+                   por_usuario(minutos % MINUTOS_DIA // 60, 24),
+                   primero, ultimo,
+                   int(minutos[0]), int(minutos[-1]))
+
+    def filtra(self, usuario: str) -> 'AgregadoLog':
+        '''
+        Devuelve el agregado restringido a los mensajes de un usuario.
+
+        :param usuario: Usuario cuyos mensajes se quieren considerar
+        :type usuario: str
+        :return: Agregado con una sola fila
+        :rtype: AgregadoLog
+        '''
+        if usuario not in self.nombres:
+            return AgregadoLog.vacio([])
+        i = self.nombres.index(usuario)
+        fila = slice(i, i + 1)
+        return AgregadoLog([usuario], self.mes_base, self.por_mes[fila], self.por_dia_semana[fila],
+                           self.por_hora[fila], self.primero[fila], self.ultimo[fila],
+                           int(self.primero[i]), int(self.ultimo[i]))
+
+    def combina(self, otro: 'AgregadoLog') -> 'AgregadoLog':
+        '''
+        Devuelve el agregado de la concatenación de dos logs: el de este agregado
+        seguido del de otro.
+
+        :param otro: Agregado de los mensajes posteriores
+        :type otro: AgregadoLog
+        :return: Agregado de todos los mensajes
+        :rtype: AgregadoLog
+        '''
+        posiciones = {nombre: i for i, nombre in enumerate(self.nombres)}
+        for nombre in otro.nombres:
+            posiciones.setdefault(nombre, len(posiciones))
+        nombres = list(posiciones)
+        propias = slice(0, len(self.nombres))
+        ajenas = np.array([posiciones[nombre] for nombre in otro.nombres], dtype=np.intp)
+        n_usuarios = len(nombres)
+
+        intervalos = [(a.mes_base, a.mes_base + a.por_mes.shape[1]) for a in (self, otro) if a.por_mes.shape[1]]
+        mes_base = min(inicio for inicio, _ in intervalos) if intervalos else 0
+        n_meses = max(fin for _, fin in intervalos) - mes_base if intervalos else 0
+        por_mes = np.zeros((n_usuarios, n_meses), dtype=np.int64)
+        for agregado, filas in ((self, propias), (otro, ajenas)):
+            if agregado.por_mes.shape[1]:
+                inicio = agregado.mes_base - mes_base
+                por_mes[filas, inicio:inicio + agregado.por_mes.shape[1]] += agregado.por_mes
+
+        por_dia_semana = np.zeros((n_usuarios, 7), dtype=np.int64)
+        por_hora = np.zeros((n_usuarios, 24), dtype=np.int64)
+        por_dia_semana[propias] += self.por_dia_semana
+        por_dia_semana[ajenas] += otro.por_dia_semana
+        por_hora[propias] += self.por_hora
+        por_hora[ajenas] += otro.por_hora
+
+        # El primer mensaje de cada usuario es el de este agregado, salvo que no tenga
+        # ninguno; el último es el del otro, salvo que no tenga ninguno
+        primero = np.zeros(n_usuarios, dtype=np.int64)
+        ultimo = np.zeros(n_usuarios, dtype=np.int64)
+        primero[propias] = self.primero
+        ultimo[propias] = self.ultimo
+        en_otro = otro.por_hora.sum(axis=1) > 0
+        ultimo[ajenas[en_otro]] = otro.ultimo[en_otro]
+        sin_propios = np.ones(n_usuarios, dtype=bool)
+        sin_propios[propias] = self.por_hora.sum(axis=1) == 0
+        solo_en_otro = en_otro & sin_propios[ajenas]
+        primero[ajenas[solo_en_otro]] = otro.primero[solo_en_otro]
+
+        return AgregadoLog(nombres, mes_base, por_mes, por_dia_semana, por_hora, primero, ultimo,
+                           self.primero_total if len(self) else otro.primero_total,
+                           otro.ultimo_total if len(otro) else self.ultimo_total)
+
+    def a_dict(self) -> dict:
+        '''
+        Devuelve el agregado como un diccionario serializable en JSON.
+
+        :return: Diccionario con los datos del agregado
+        :rtype: dict
+        '''
+        return {'nombres': self.nombres, 'mes_base': self.mes_base, 'n_meses': self.por_mes.shape[1],
+                'por_mes': self.por_mes.tolist(), 'por_dia_semana': self.por_dia_semana.tolist(),
+                'por_hora': self.por_hora.tolist(), 'primero': self.primero.tolist(),
+                'ultimo': self.ultimo.tolist(), 'primero_total': self.primero_total,
+                'ultimo_total': self.ultimo_total}
+
+    @classmethod
+    def desde_dict(cls, datos: dict) -> 'AgregadoLog':
+        '''
+        Reconstruye un agregado a partir del diccionario devuelto por a_dict.
+
+        :param datos: Diccionario con los datos del agregado
+        :type datos: dict
+        :return: Agregado
+        :rtype: AgregadoLog
+        '''
+        n_usuarios = len(datos['nombres'])
+
+        def matriz(clave: str, columnas: int) -> np.ndarray:
+            return np.array(datos[clave], dtype=np.int64).reshape(n_usuarios, columnas)
+
+        return cls(datos['nombres'], datos['mes_base'], matriz('por_mes', datos['n_meses']),
+                   matriz('por_dia_semana', 7), matriz('por_hora', 24),
+                   np.array(datos['primero'], dtype=np.int64), np.array(datos['ultimo'], dtype=np.int64),
+                   datos['primero_total'], datos['ultimo_total'])
+
+    def __len__(self) -> int:
+        return int(self.por_hora.sum())
+
+    def usuarios(self) -> list[str]:
+        return sorted(nombre for nombre, n in zip(self.nombres, self.por_hora.sum(axis=1)) if n)
+
+    def mensajes_por_usuario(self) -> Counter:
+        return Counter({nombre: int(n) for nombre, n in zip(self.nombres, self.por_hora.sum(axis=1)) if n})
+
+    def mensajes_por_meses(self) -> Counter:
+        conteos = self.por_mes.sum(axis=0)
+        return Counter({f"{(self.mes_base + i) % 12 + 1}/{1970 + (self.mes_base + i) // 12}": int(n)
+                        for i, n in enumerate(conteos) if n})
+
+    def mensajes_por_dia_semana(self) -> Counter:
+        return Counter(dict(zip(DIAS_SEMANA, map(int, self.por_dia_semana.sum(axis=0)))))
+
+    def mensajes_por_momento_del_dia(self) -> Counter:
+        horas = self.por_hora.sum(axis=0)
+        return Counter({"MAÑANA": int(horas[7:14].sum()),
+                        "TARDE": int(horas[14:21].sum()),
+                        "NOCHE": int(horas[:7].sum() + horas[21:].sum())})
+
+    def media_horas_entre_mensajes(self) -> float:
+        # La suma de las diferencias entre mensajes consecutivos es la diferencia
+        # entre el último y el primero. Con menos de dos mensajes no hay diferencias
+        if len(self) < 2:
+            return float('nan')
+        return (self.ultimo_total - self.primero_total) / (len(self) - 1) / 60
+
+def agregado_de(log: 'list[Mensaje] | LogColumnar | AgregadoLog') -> AgregadoLog:
+    '''
+    Devuelve el agregado de un log, calculándolo sólo si no se ha recibido ya uno.
+
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: list[Mensaje] | LogColumnar | AgregadoLog
+    :return: Agregado del log
+    :rtype: AgregadoLog
+    '''
+    if isinstance(log, AgregadoLog):
+        return log
+    return AgregadoLog.desde_log(log)
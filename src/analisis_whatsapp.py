@@ -1,16 +1,296 @@
 from collections import Counter, defaultdict
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, time
+from itertools import chain, islice
+import io
 import re
-import matplotlib.pyplot as plt
-from typing import NamedTuple
+from typing import Callable, Iterable, Iterator, NamedTuple, TextIO
+import perfil_whatsapp
 
-SO = "android"
+SO = "auto"
 
-ANDROID_RE = r'(\d\d?/\d\d?/\d\d?), (\d\d?:\d\d) - ([^:]+): (.+)'
-IOS_RE = r'\[(\d\d?/\d\d?/\d\d?), (\d\d?:\d\d):\d\d\] ([^:]+): (.+)'
+ANDROID_RE = re.compile(r'(\d\d?/\d\d?/\d\d?), (\d\d?:\d\d) - ([^:]+): (.+)')
+IOS_RE = re.compile(r'\[(\d\d?/\d\d?/\d\d?),? (\d\d?:\d\d):\d\d\] ([^:]+): (.+)')
+
+# Prefijos con los que empieza cualquier línea nueva del log (mensajes de usuario
+# y también avisos del sistema, como "Se añadió a ..."). Una línea que no empieza
+# así es la continuación de un mensaje de varias líneas.
+ANDROID_INICIO_RE = re.compile(r'\d\d?/\d\d?/\d\d?, \d\d?:\d\d - ')
+IOS_INICIO_RE = re.compile(r'\[\d\d?/\d\d?/\d\d?,? \d\d?:\d\d:\d\d\] ')
+
+FORMATOS = {
+    'android': (ANDROID_RE, ANDROID_INICIO_RE),
+    'ios': (IOS_RE, IOS_INICIO_RE),
+}
+
+# Número de líneas que se examinan para detectar automáticamente el formato
+LINEAS_DETECCION = 50
+
+# Cada cuántas líneas se informa del progreso de la lectura de un log
+LINEAS_PROGRESO = 10000
+
+SIGNOS_PUNTUACION = ".,:();¿?¡!"
+
+# Primeros bytes de los contenedores de los que se puede leer un log directamente
+CONTENEDORES = {b'PK\x03\x04': 'zip', b'\x1f\x8b': 'gzip', b'\xfd7zXZ\x00': 'xz', b'BZh': 'bz2'}
+
+# Bytes que se leen de cada vez al completar el resumen de un fichero (véase abre_log)
+TAM_BLOQUE_RESUMEN = 1 << 20
 
 Mensaje = NamedTuple('Mensaje', [('fecha', datetime.date), ('hora', datetime.time), ('usuario', str), ('texto', str)])
 
+def detecta_so(lineas: Iterable[str]) -> str:
+    '''
+    Detecta si unas líneas de log proceden de un export de Android o de iOS.
+
+    :param lineas: Primeras líneas del log
+    :type lineas: Iterable[str]
+    :return: 'android' o 'ios'. Si ninguna línea tiene un formato reconocible, 'android'
+    :rtype: str
+    '''
+    for linea in lineas:
+        if ANDROID_INICIO_RE.match(linea):
+            return 'android'
+        if IOS_INICIO_RE.match(linea):
+            return 'ios'
+    return 'android'
+
+def parsea_lineas(lineas: Iterable[str], os: str = SO) -> Iterator[Mensaje]:
+    '''
+    Genera los mensajes contenidos en una secuencia de líneas de log.
+
+    :param lineas: Líneas del log, en el orden del fichero
+    :type lineas: Iterable[str]
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :return: Iterador de mensajes
+    :rtype: Iterator[Mensaje]
+
+    Las líneas que no empiezan por una fecha se consideran continuación del mensaje
+    anterior y se añaden a su texto separadas por saltos de línea. Los avisos del
+    sistema (líneas con fecha pero sin usuario) se descartan.
+
+    Como en un log hay miles de mensajes con la misma fecha y la misma hora,
+    las conversiones de cadena a date y time se memorizan. Del mismo modo, todos
+    los mensajes de un usuario comparten la misma cadena con su nombre.
+    '''
+    lineas = iter(lineas)
+    if os == 'auto':
+        cabecera = list(islice(lineas, LINEAS_DETECCION))
+        os = detecta_so(cabecera)
+        lineas = chain(cabecera, lineas)
+    if os not in FORMATOS:
+        raise Exception('OS no permitido') # Lanza una excepción
+    regex, inicio = FORMATOS[os]
+    coincide = regex.match
+    es_inicio = inicio.match
+
+    fechas = {}
+    horas = {}
+    usuarios = {}
+    pendiente = None
+    continuaciones = None
+    for linea in lineas:
+        m = coincide(linea)
+        if m:
+            if pendiente is not None:
+                if continuaciones:
+                    pendiente = _une_continuaciones(pendiente, continuaciones)
+                    continuaciones = None
+                yield pendiente
+            fecha_str, hora_str, usuario, texto = m.groups()
+            fecha = fechas.get(fecha_str)
+            if fecha is None:
+                fecha = fechas[fecha_str] = datetime.strptime(fecha_str, '%d/%m/%y').date()
+            hora = horas.get(hora_str)
+            if hora is None:
+                hora = horas[hora_str] = datetime.strptime(hora_str, '%H:%M').time()
+            usuario = usuarios.setdefault(usuario, usuario)
+            pendiente = Mensaje(fecha, hora, usuario, texto)
+        elif pendiente is not None:
+            if es_inicio(linea):
+                # Aviso del sistema: cierra el mensaje anterior
+                if continuaciones:
+                    pendiente = _une_continuaciones(pendiente, continuaciones)
+                    continuaciones = None
+                yield pendiente
+                pendiente = None
+            elif continuaciones is None:
+                continuaciones = [linea.rstrip('\r\n')]
+            else:
+                continuaciones.append(linea.rstrip('\r\n'))
+
+    if pendiente is not None:
+        if continuaciones:
+            pendiente = _une_continuaciones(pendiente, continuaciones)
+        yield pendiente
+
+def _une_continuaciones(mensaje: Mensaje, continuaciones: list[str]) -> Mensaje:
+    # Las líneas en blanco al final de un mensaje no forman parte de su texto
+    texto = '\n'.join([mensaje.texto, *continuaciones]).rstrip('\n')
+    return mensaje._replace(texto=texto)
+
+def itera_log(fichero: str, os: str = SO, progreso: Callable[[int], None] | None = None,
+              resumen=None) -> Iterator[Mensaje]:
+    '''
+    Lee un log de Whatsapp de forma perezosa, generando los mensajes uno a uno.
+
+    :param fichero: Nombre del fichero del que se quieren leer los datos
+    :type fichero: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param progreso: Si no es None, se llama cada LINEAS_PROGRESO líneas con el número
+        de bytes leídos del fichero, por defecto None
+    :type progreso: Callable[[int], None] | None
+    :param resumen: Si no es None, objeto de hashlib al que se añaden los bytes del
+        fichero según se leen (véase abre_log), por defecto None
+    :type resumen: hashlib._Hash | None
+    :return: Iterador de mensajes
+    :rtype: Iterator[Mensaje]
+
+    Al no construir la lista completa, permite recorrer logs de millones de líneas
+    con memoria constante. Si la función progreso lanza una excepción, la lectura
+    se interrumpe con esa excepción; así puede cancelarse una carga en curso.
+
+    El fichero puede ser el .txt del export o estar comprimido (véase abre_log).
+    En ese caso el progreso se mide en bytes del fichero comprimido.
+    '''
+    with abre_log(fichero, resumen) as (f, posicion):
+        lineas = f if progreso is None else _con_progreso(f, posicion, progreso)
+        if perfil_whatsapp.activo():
+            yield from _con_contadores(lineas, posicion, os)
+        else:
+            yield from parsea_lineas(lineas, os)
+
+def tipo_contenedor(fichero: str) -> str | None:
+    '''
+    Indica si un fichero está comprimido, según sus primeros bytes.
+
+    :param fichero: Nombre del fichero
+    :type fichero: str
+    :return: 'zip', 'gzip', 'xz' o 'bz2', o None si es un fichero de texto
+    :rtype: str | None
+    '''
+    with open(fichero, 'rb') as f:
+        cabecera = f.read(6)
+    for magia, tipo in CONTENEDORES.items():
+        if cabecera.startswith(magia):
+            return tipo
+    return None
+
+@contextmanager
+def abre_log(fichero: str, resumen=None) -> Iterator[tuple[TextIO, Callable[[], int]]]:
+    '''
+    Abre el texto de un log para leerlo línea a línea, descomprimiéndolo al vuelo si hace falta.
+
+    :param fichero: Nombre del fichero: el .txt del export, el .zip que genera
+        Whatsapp al exportar un chat, o un .txt comprimido con gzip, xz o bzip2
+    :type fichero: str
+    :param resumen: Si no es None, objeto de hashlib (por ejemplo, hashlib.blake2b())
+        al que se añaden los bytes del fichero, por defecto None
+    :type resumen: hashlib._Hash | None
+    :return: Gestor de contexto que da el texto del log y una función que devuelve
+        los bytes leídos del fichero
+    :rtype: Iterator[tuple[TextIO, Callable[[], int]]]
+
+    El tipo se reconoce por los primeros bytes, no por la extensión. Nunca se
+    descomprime nada en disco: el texto se lee directamente del contenedor. De un
+    .zip se lee el .txt más grande (el chat) y se ignoran los ficheros multimedia.
+
+    Con resumen, los bytes se resumen a medida que se leen del disco para parsearlos,
+    sin leer el fichero dos veces. Al salir del with se resume lo que no se haya
+    leído, así que el resultado es el del fichero completo. Un .zip no se lee en
+    orden, y se resume entero al salir.
+    '''
+    tipo = tipo_contenedor(fichero)
+    if tipo is None and resumen is None:
+        with open(fichero, encoding='utf-8-sig') as f:
+            yield f, f.buffer.tell
+        return
+
+    # Los módulos de compresión sólo se importan si hacen falta
+    with (open(fichero, 'rb') if resumen is None or tipo == 'zip' else _LectorConResumen(fichero, resumen)) as crudo:
+        if tipo is None:
+            yield io.TextIOWrapper(io.BufferedReader(crudo), encoding='utf-8-sig'), crudo.tell
+        elif tipo == 'zip':
+            import zipfile
+            with zipfile.ZipFile(crudo) as zf:
+                chats = [info for info in zf.infolist()
+                         if info.filename.lower().endswith('.txt') and not info.filename.startswith('__MACOSX/')]
+                if not chats:
+                    raise ValueError(f'{fichero} no contiene ningún chat (.txt)')
+                with zf.open(max(chats, key=lambda info: info.file_size)) as binario:
+                    yield io.TextIOWrapper(binario, encoding='utf-8-sig'), crudo.tell
+        else:
+            if tipo == 'gzip':
+                import gzip
+                binario = gzip.GzipFile(fileobj=crudo)
+            elif tipo == 'xz':
+                import lzma
+                binario = lzma.LZMAFile(crudo)
+            else:
+                import bz2
+                binario = bz2.BZ2File(crudo)
+            with binario:
+                yield io.TextIOWrapper(binario, encoding='utf-8-sig'), crudo.tell
+        if resumen is not None:
+            if tipo == 'zip':
+                crudo.seek(0)
+                while bloque := crudo.read(TAM_BLOQUE_RESUMEN):
+                    resumen.update(bloque)
+            else:
+                # _LectorConResumen añade al resumen lo que quede por leer
+                while crudo.read(TAM_BLOQUE_RESUMEN):
+                    pass
+
+class _LectorConResumen(io.FileIO):
+    # Fichero binario que añade a un resumen de hashlib los bytes según se leen
+    def __init__(self, fichero: str, resumen):
+        super().__init__(fichero, 'rb')
+        self.resumen = resumen
+
+    def readinto(self, b) -> int | None:
+        n = super().readinto(b)
+        if n:
+            self.resumen.update(memoryview(b)[:n])
+        return n
+
+    def read(self, n: int = -1) -> bytes | None:
+        # FileIO.read no pasa por readinto
+        datos = super().read(n)
+        if datos:
+            self.resumen.update(datos)
+        return datos
+
+    def readall(self) -> bytes:
+        datos = super().readall()
+        self.resumen.update(datos)
+        return datos
+
+def _con_progreso(f, posicion: Callable[[], int], progreso: Callable[[int], None]) -> Iterator[str]:
+    # La posición del fichero va algo por delante de la última línea leída,
+    # pero basta para mostrar el avance
+    for i, linea in enumerate(f):
+        if i % LINEAS_PROGRESO == 0:
+            progreso(posicion())
+        yield linea
+    progreso(posicion())
+
+def _con_contadores(lineas: Iterable[str], posicion: Callable[[], int], os: str) -> Iterator[Mensaje]:
+    # Sólo con la instrumentación activa: cuenta las líneas leídas y las que son
+    # mensajes, y los suma a la etapa en curso al terminar
+    n_lineas = 0
+    def cuenta_lineas():
+        nonlocal n_lineas
+        for n_lineas, linea in enumerate(lineas, 1):
+            yield linea
+    n_mensajes = 0
+    for n_mensajes, mensaje in enumerate(parsea_lineas(cuenta_lineas(), os), 1):
+        yield mensaje
+    perfil_whatsapp.cuenta('lineas_leidas', n_lineas)
+    perfil_whatsapp.cuenta('mensajes', n_mensajes)
+    perfil_whatsapp.cuenta('bytes_leidos', posicion())
+
 # Esta función se da implementada
 def carga_log(fichero: str, os: str = SO, debug: bool = False) -> list[Mensaje]:
     '''
@@ -18,7 +298,7 @@ def carga_log(fichero: str, os: str = SO, debug: bool = False) -> list[Mensaje]:
 
     :param fichero: Nombre del fichero del que se quieren leer los datos
     :type fichero: str
-    :param os: Tipo de sistema operativo del log, por defecto 'android'
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
     :type os: str
     :param debug: Indica si se desea obtener información sobre la carga, por defecto False
     :type debug: bool
@@ -30,44 +310,54 @@ def carga_log(fichero: str, os: str = SO, debug: bool = False) -> list[Mensaje]:
         3779 mensajes leídos.
         Usuarios: {'Penny', 'Sheldon', 'Howard', 'Raj', 'Lesley', 'Leonard'}
         Intervalo de fechas: 2016-02-25 -> 2017-03-04
+    seguidos del tiempo de la carga y de sus contadores (líneas leídas, mensajes,
+    mensajes por segundo...), medidos con perfil_whatsapp.
     
     La función devuelve una lista de tuplas, cada una de ellas conteniendo la fecha,
     la hora, el usuario y el texto de un mensaje. El orden de las tuplas en la lista
     es el mismo que el que aparece en el fichero, es decir, cronológico.
+
+    Con os='auto' el formato (Android o iOS) se detecta a partir de las primeras
+    líneas del fichero.
     '''
-    if os=='android':
-        regex = ANDROID_RE
-    elif os=='ios':
-        regex = IOS_RE
-    else:
-        raise Exception('OS no permitido') # Lanza una excepción
-        
-    log = []
-    with open(fichero, encoding='utf8') as f:        
-        for linea in f:
-            # Aplicamos la expresión regular sobre cada línea
-            matches = re.findall(regex, linea)
-            if matches:  # Si se encuentran coincidencias para los patrones
-                fecha_str, hora_str, usuario, texto = matches[0]
-                fecha = datetime.strptime(fecha_str, '%d/%m/%y').date()
-                hora = datetime.strptime(hora_str, '%H:%M').time()
-                log.append(Mensaje(fecha,hora,usuario, texto))
-            
+    if not debug:
+        with perfil_whatsapp.etapa('carga_log'):
+            return list(itera_log(fichero, os))
+
+    with perfil_whatsapp.perfilando() as perfil:
+        log = carga_log(fichero, os)
+    print(f"{len(log)} mensajes leídos.")
+    print("Usuarios:", {m.usuario for m in log})
+    if log:
+        print(f"Intervalo de fechas: {min(m.fecha for m in log)} -> {max(m.fecha for m in log)}")
+    print(perfil.texto())
     return log
 
+def _agregado(log):
+    # Import diferido: agregados_whatsapp depende de este módulo
+    from agregados_whatsapp import agregado_de
+    return agregado_de(log)
+
+def _indice(log):
+    # Import diferido: palabras_whatsapp depende de este módulo
+    from palabras_whatsapp import indice_de
+    return indice_de(log)
+
 def calcula_usuarios(log: list[Mensaje]) -> list[str]:
     '''
     Devuelve una lista ordenada con los usuarios que aparecen en el log, sin duplicados.
 
-    :param log: Lista de mensajes
-    :type log: list[Mensaje]
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: list[Mensaje] | LogColumnar | AgregadoLog
     :return: Lista de usuarios
     :rtype: list[str]
     '''
-    nombres = set()
-    for l in log:
-        nombres.add(l.usuario)
-    return sorted(nombres)
+    return _agregado(log).usuarios()
+    
+    #nombres = set()
+    #for l in log:
+    #    nombres.add(l.usuario)
+    #return sorted(nombres)
     
     #por comprension
     #return sorted({l.usuario for l in log})
@@ -76,12 +366,13 @@ def cuenta_mensajes_por_usuario(log: list[Mensaje]) -> dict[str, int]:
     '''
     Devuelve un diccionario en el que las claves son los usuarios y los valores son el número de mensajes de cada usuario.
 
-    :param log: Lista de mensajes
-    :type log: list[Mensaje]
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: list[Mensaje] | LogColumnar | AgregadoLog
     :return: Diccionario de número de mensajes por usuario
     :rtype: dict[str, int]
     '''
-    return Counter(l.usuario for l in log)
+    return _agregado(log).mensajes_por_usuario()
+    #return Counter(l.usuario for l in log)
     #res = defaultdict(int)
     #for l in log:
     #   res[l.usuario] += 1
@@ -110,6 +401,8 @@ def muestra_numero_mensajes_por_usuario(log: list[Mensaje]) -> None:
         num_mensajes.append(conteo)
     
     
+    # matplotlib tarda en importarse: sólo se carga si se dibuja algo
+    import matplotlib.pyplot as plt
     plt.barh(usuarios, num_mensajes)
     plt.show()
 
@@ -118,12 +411,13 @@ def cuenta_mensajes_por_meses(log: list[Mensaje]) -> dict[str, int]:
     Devuelve un diccionario en el que las claves son los meses a lo largo de los años 
     (por ejemplo, "2/2016", "3/2016",...) y los valores son el número de mensajes de cada mes/año.
 
-    :param log: Lista de mensajes
-    :type log: list[Mensaje]
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: list[Mensaje] | LogColumnar | AgregadoLog
     :return: Diccionario de número de mensajes por mes/año
     :rtype: dict[str, int]
     '''
-    return Counter(str(l.fecha.month) + "/" + str(l.fecha.year) for l in log)
+    return _agregado(log).mensajes_por_meses()
+    #return Counter(str(l.fecha.month) + "/" + str(l.fecha.year) for l in log)
     #return Counter(l.fecha.strftime("%m/%Y") for l in log)  
     # la f de strftime es de formatear
     
@@ -139,12 +433,13 @@ def cuenta_mensajes_por_dia_semana(log: list[Mensaje]) -> dict[str, int]:
     ("L", "M", "X", "J", "V", "S" y "D") y los valores son el número de mensajes de cada día.
     Usa el método weekday() del tipo date para determinar el día de la semana.
 
-    :param log: Lista de mensajes
-    :type log: list[Mensaje]
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: list[Mensaje] | LogColumnar | AgregadoLog
     :return: Diccionario de número de mensajes por día de la semana
     :rtype: dict[str, int]
     '''
-    pass
+    return _agregado(log).mensajes_por_dia_semana()
+    #return Counter("LMXJVSD"[l.fecha.weekday()] for l in log)
 
 def cuenta_mensajes_por_momento_del_dia(log: list[Mensaje]) -> dict[str, int]:
     '''
@@ -155,27 +450,29 @@ def cuenta_mensajes_por_momento_del_dia(log: list[Mensaje]) -> dict[str, int]:
     - "TARDE": de 14 a 20 horas
     - "NOCHE": de 21 a 6 horas
 
-    :param log: Lista de mensajes
-    :type log: list[Mensaje]
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: list[Mensaje] | LogColumnar | AgregadoLog
     :return: Diccionario de número de mensajes para cada momento del día
     :rtype: dict[str, int]
     '''
-    res = defaultdict(int)
-    for l in log:
-        if 7 <= l.fecha.hour <=13:
-            res["MAÑANA"] +=1
-        elif 14 <= l.fecha.hour <= 20:
-            res["TARDE"] += 1
-        else:
-            res["NOCHE"] += 1
-    return res
+    return _agregado(log).mensajes_por_momento_del_dia()
+    
+    #res = defaultdict(int)
+    #for l in log:
+    #    if 7 <= l.hora.hour <=13:
+    #        res["MAÑANA"] +=1
+    #    elif 14 <= l.hora.hour <= 20:
+    #        res["TARDE"] += 1
+    #    else:
+    #        res["NOCHE"] += 1
+    #return res
 
     #return Counter(momento_dia(l.hora) for l in log)
 
 def momento_dia(hora: time) -> str:
-            if 7 <= fecha.hour <=13:
+            if 7 <= hora.hour <=13:
                 return "MAÑANA"
-            elif 14 <= fecha.hour <= 20:
+            elif 14 <= hora.hour <= 20:
                 return "TARDE"
             else:
                 return"NOCHE"
@@ -188,27 +485,28 @@ def calcula_media_horas_entre_mensajes(log: list[Mensaje]) -> float:
     Para calcular el número de horas entre dos objetos datetime d1 y d2, se utiliza la expresión: 
     (d1-d2).total_seconds() / 3600
 
-    :param log: Lista de mensajes
-    :type log: list[Mensaje]
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: list[Mensaje] | LogColumnar | AgregadoLog
     :return: Media de horas entre mensajes consecutivos
     :rtype: float
     '''
+    return _agregado(log).media_horas_entre_mensajes()
     
-    diferencias = []
-    for l1, l2 in zip(log, log[1:]):
-        fecha_hora1 = datetime.combine(l1.fecha, l1.hora)
-        fecha_hora2 = datetime.combine(l2.fecha, l2.hora)
-        horas = (fecha_hora2- fecha_hora1).total_seconds()/3600
-        diferencias.append(horas)
-    return sum(diferencias) / len(diferencias)
+    #diferencias = []
+    #for l1, l2 in zip(log, log[1:]):
+    #    fecha_hora1 = datetime.combine(l1.fecha, l1.hora)
+    #    fecha_hora2 = datetime.combine(l2.fecha, l2.hora)
+    #    horas = (fecha_hora2- fecha_hora1).total_seconds()/3600
+    #    diferencias.append(horas)
+    #return sum(diferencias) / len(diferencias)
         
 def genera_conteos_palabras_usuario_y_resto(log: list[Mensaje], usuario: str) -> tuple[dict[str, int], dict[str, int]]:
     '''
     Genera dos diccionarios, uno con el conteo de las palabras usadas por el usuario,
     y otro con el conteo de palabras usadas por el resto de usuarios.
 
-    :param log: Lista de mensajes
-    :type log: list[Mensaje]
+    :param log: Lista de mensajes, log columnar o índice de palabras
+    :type log: list[Mensaje] | LogColumnar | IndicePalabras
     :param usuario: Usuario específico para el conteo de palabras
     :type usuario: str
     :return: Tupla conteniendo dos diccionarios, uno para el usuario y otro para el resto
@@ -216,27 +514,88 @@ def genera_conteos_palabras_usuario_y_resto(log: list[Mensaje], usuario: str) ->
 
     Para dividir el texto en palabras, se usa split. Para cada palabra,
     se utiliza la instrucción palabra.strip(".,:();¿?¡!") para eliminar signos de puntuación.
+    Si se recibe un IndicePalabras ya calculado, no se vuelve a recorrer el log.
     '''
-    pass
+    return _indice(log).conteos_usuario_y_resto(usuario)
+    #conteo_usuario = Counter()
+    #conteo_resto = Counter()
+    #for l in log:
+    #    palabras = [palabra.strip(SIGNOS_PUNTUACION) for palabra in l.texto.split()]
+    #    if l.usuario == usuario:
+    #        conteo_usuario.update(palabras)
+    #    else:
+    #        conteo_resto.update(palabras)
+    #return conteo_usuario, conteo_resto
 
-def genera_palabras_caracteristicas_usuario(log: list[Mensaje], usuario: str, umbral: int = 2) -> dict[str, float]:
+@perfil_whatsapp.perfilado('cuenta_palabras_por_usuario')
+def cuenta_palabras_por_usuario(log: list[Mensaje], minusculas: bool = False,
+                                sin_tildes: bool = False) -> dict[str, Counter]:
     '''
-    Genera un diccionario con la importancia de las palabras usadas por un usuario.
+    Genera, en una sola pasada, el conteo de las palabras usadas por cada usuario.
 
     :param log: Lista de mensajes
     :type log: list[Mensaje]
+    :param minusculas: Si es True las palabras se pasan a minúsculas, por defecto False
+    :type minusculas: bool
+    :param sin_tildes: Si es True se quitan las tildes, por defecto False
+    :type sin_tildes: bool
+    :return: Diccionario que asocia a cada usuario el conteo de sus palabras
+    :rtype: dict[str, Counter]
+
+    Las palabras se obtienen igual que en genera_conteos_palabras_usuario_y_resto,
+    con cuenta_palabras de tokenizador_whatsapp.
+    '''
+    # Import diferido: tokenizador_whatsapp depende de este módulo
+    from tokenizador_whatsapp import cuenta_palabras
+    textos = defaultdict(list)
+    for l in log:
+        textos[l.usuario].append(l.texto)
+    return {usuario: cuenta_palabras(t, minusculas, sin_tildes) for usuario, t in textos.items()}
+    #res = defaultdict(Counter)
+    #for l in log:
+    #    res[l.usuario].update(palabra.strip(SIGNOS_PUNTUACION) for palabra in l.texto.split())
+    #return dict(res)
+
+def genera_palabras_caracteristicas_usuario(log: list[Mensaje], usuario: str, umbral: int = 2,
+                                            max_palabras: int | None = None) -> dict[str, float]:
+    '''
+    Genera un diccionario con la importancia de las palabras usadas por un usuario.
+
+    :param log: Lista de mensajes, log columnar o índice de palabras
+    :type log: list[Mensaje] | LogColumnar | IndicePalabras
     :param usuario: Usuario del que se calculará la importancia de las palabras
     :type usuario: str
     :param umbral: Frecuencia mínima para tener en cuenta una palabra, por defecto 2
     :type umbral: int
+    :param max_palabras: Si no es None, sólo se devuelven las max_palabras más importantes, por defecto None
+    :type max_palabras: int | None
     :return: Diccionario de importancia de las palabras del usuario
     :rtype: dict[str, float]
 
     El diccionario contiene palabras con su respectiva importancia, calculada en base 
     a su frecuencia de uso por el usuario indicado, considerando solo aquellas palabras 
     con una frecuencia igual o superior al umbral especificado.
+    Si se recibe un IndicePalabras ya calculado, el coste depende del tamaño del
+    vocabulario y no del log.
     '''
-    pass
+    return _indice(log).palabras_caracteristicas(usuario, umbral, max_palabras)
 
+def genera_palabras_caracteristicas_usuarios(log: list[Mensaje], umbral: int = 2,
+                                             max_palabras: int | None = None) -> dict[str, dict[str, float]]:
+    '''
+    Genera, para cada usuario del log, el diccionario de importancia de sus palabras.
 
+    :param log: Lista de mensajes, log columnar o índice de palabras
+    :type log: list[Mensaje] | LogColumnar | IndicePalabras
+    :param umbral: Frecuencia mínima para tener en cuenta una palabra, por defecto 2
+    :type umbral: int
+    :param max_palabras: Si no es None, sólo se devuelven las max_palabras más importantes
+        de cada usuario, por defecto None
+    :type max_palabras: int | None
+    :return: Diccionario que asocia a cada usuario la importancia de sus palabras
+    :rtype: dict[str, dict[str, float]]
 
+    Equivale a llamar a genera_palabras_caracteristicas_usuario para cada usuario,
+    pero calcula todas las importancias de una vez sobre la matriz de conteos.
+    '''
+    return _indice(log).palabras_caracteristicas_todos(umbral, max_palabras)
@@ -1,7 +1,26 @@
+import os as so
+import queue
+import tempfile
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 from analisis_whatsapp import *
 from graficas_whatsapp import *
+from agregados_whatsapp import AgregadoLog
+from palabras_whatsapp import IndicePalabras
+from cache_whatsapp import carga_log_cacheado
+from renderizado_whatsapp import (CacheRender, clave_informe, clave_nube, huella_log, muestra_png, prerenderiza,
+                                  renderiza_informe, renderiza_nube, titulo_informe)
+
+# Milisegundos entre cada consulta de la cola de resultados del hilo de carga
+PERIODO_CONSULTA = 100
+# Palabras que se precalculan para la nube de cada usuario
+MAX_PALABRAS_NUBE = 150
+# Directorio donde se guardan las imágenes renderizadas, para reutilizarlas entre sesiones
+DIRECTORIO_RENDER = so.path.join(tempfile.gettempdir(), 'analisis_whatsapp_render')
+
+class CargaCancelada(Exception):
+    pass
 
 class AnalisisWhatsappGUI:
     def __init__(self, root):
@@ -13,6 +32,14 @@ class AnalisisWhatsappGUI:
         self.boton_seleccionar = tk.Button(root, text="Seleccionar Archivo", command=self.seleccionar_archivo)
         self.boton_seleccionar.pack(pady=10)
 
+        # Barra de progreso y botón de cancelar, visibles sólo durante la carga
+        self.barra_progreso = ttk.Progressbar(root, mode='determinate', length=300)
+        self.barra_progreso.pack(pady=5)
+        self.barra_progreso.pack_forget()
+        self.boton_cancelar = tk.Button(root, text="Cancelar", command=self.cancelar_carga)
+        self.boton_cancelar.pack(pady=5)
+        self.boton_cancelar.pack_forget()
+
         # Etiqueta para la lista desplegable
         self.etiqueta_usuario = tk.Label(root, text="Usuario")
         self.etiqueta_usuario.pack(pady=5)
@@ -36,23 +63,107 @@ class AnalisisWhatsappGUI:
 
         # Variables de instancia para almacenar datos
         self.datos_log = [] 
+        self.agregado = None
+        self.indice_palabras = None
+        self.palabras_caracteristicas = {}
         self.usuarios = []
+        self.huella = None
+        self.cache_render = CacheRender(DIRECTORIO_RENDER)
+
+        # Comunicación con el hilo que carga y analiza el log
+        self.cola = queue.Queue()
+        self.cancelacion = threading.Event()
+        # Se activa para parar el prerenderizado del log anterior al cargar otro
+        self.fin_prerenderizado = threading.Event()
+        # Imágenes que los hilos de renderizado devuelven para mostrarlas en el hilo de Tk
+        self.cola_render = queue.Queue()
+        self.renders_pendientes = 0
 
     def seleccionar_archivo(self):
         archivo = filedialog.askopenfilename(title="Seleccionar archivo de log")
         if archivo:
-            self.datos_log = carga_log(archivo)
-            self.usuarios = calcula_usuarios(self.datos_log)
-            self.lista_usuarios['values'] = ["TODOS"] + self.usuarios
-
-             # Mostrar lista desplegable y etiqueta
-            self.etiqueta_usuario.pack()
-            self.lista_usuarios.pack()
-            self.boton_informe.pack()
-            self.boton_nube.pack()
-
-            messagebox.showinfo("Log cargado", f"Se han leído {len(self.datos_log)} mensajes.")
-    
+            # La carga y el análisis se hacen en otro hilo para no bloquear la ventana;
+            # el resultado se recoge periódicamente con root.after
+            self.cancelacion.clear()
+            self.fin_prerenderizado.set()
+            self.boton_seleccionar['state'] = tk.DISABLED
+            tamaño = so.path.getsize(archivo)
+            self.barra_progreso['maximum'] = max(1, tamaño)
+            self.barra_progreso['value'] = 0
+            self.barra_progreso.pack(after=self.boton_seleccionar)
+            self.boton_cancelar.pack(after=self.barra_progreso)
+            threading.Thread(target=self.cargar_en_segundo_plano, args=(archivo, tamaño), daemon=True).start()
+            self.root.after(PERIODO_CONSULTA, self.consultar_cola)
+
+    def cargar_en_segundo_plano(self, archivo, tamaño):
+        # Se ejecuta en el hilo de carga: no puede tocar los widgets, sólo la cola
+        def progreso(leidos):
+            if self.cancelacion.is_set():
+                raise CargaCancelada()
+            self.cola.put(('progreso', leidos))
+
+        try:
+            datos_log = carga_log_cacheado(archivo, progreso=progreso)
+            progreso(tamaño)
+            # Estadísticas y palabras de todos los usuarios, calculadas una sola vez por log
+            agregado = AgregadoLog.desde_log(datos_log)
+            progreso(tamaño)
+            indice_palabras = IndicePalabras.desde_log(datos_log)
+            progreso(tamaño)
+            palabras = indice_palabras.palabras_caracteristicas_todos(max_palabras=MAX_PALABRAS_NUBE)
+            huella = huella_log(datos_log)
+            progreso(tamaño)
+            self.cola.put(('fin', (datos_log, agregado, indice_palabras, palabras, huella)))
+        except CargaCancelada:
+            self.cola.put(('cancelado', None))
+        except Exception as e:
+            self.cola.put(('error', e))
+
+    def consultar_cola(self):
+        try:
+            while True:
+                tipo, valor = self.cola.get_nowait()
+                if tipo == 'progreso':
+                    self.barra_progreso['value'] = valor
+                else:
+                    self.terminar_carga(tipo, valor)
+                    return
+        except queue.Empty:
+            self.root.after(PERIODO_CONSULTA, self.consultar_cola)
+
+    def terminar_carga(self, tipo, valor):
+        self.barra_progreso.pack_forget()
+        self.boton_cancelar.pack_forget()
+        self.boton_seleccionar['state'] = tk.NORMAL
+        if tipo == 'error':
+            messagebox.showerror("Error", f"No se pudo cargar el log: {valor}")
+            return
+        if tipo == 'cancelado':
+            return
+
+        self.datos_log, self.agregado, self.indice_palabras, self.palabras_caracteristicas, self.huella = valor
+        self.usuarios = calcula_usuarios(self.agregado)
+        self.lista_usuarios['values'] = ["TODOS"] + self.usuarios
+
+         # Mostrar lista desplegable y etiqueta
+        self.etiqueta_usuario.pack()
+        self.lista_usuarios.pack()
+        self.boton_informe.pack()
+        self.boton_nube.pack()
+
+        # Los informes y nubes de los usuarios más activos se renderizan mientras tanto,
+        # para que se muestren al instante cuando se pidan
+        self.fin_prerenderizado = threading.Event()
+        threading.Thread(target=prerenderiza, daemon=True,
+                         args=(self.cache_render, self.huella, self.agregado, self.palabras_caracteristicas,
+                               MAX_PALABRAS_NUBE),
+                         kwargs={'cancelado': self.fin_prerenderizado.is_set}).start()
+
+        messagebox.showinfo("Log cargado", f"Se han leído {len(self.datos_log)} mensajes.")
+
+    def cancelar_carga(self):
+        self.cancelacion.set()
+
     def usuario_seleccionado(self, event):
         # Activar el botón de informe cuando un usuario es seleccionado
         self.boton_informe['state'] = tk.NORMAL
@@ -60,16 +171,47 @@ class AnalisisWhatsappGUI:
     def generar_informe(self):
         usuario_seleccionado = self.lista_usuarios.get()
         if usuario_seleccionado:
-            if usuario_seleccionado == "TODOS":
-                genera_informe(self.datos_log, titulo = "Informe completo")
-            else:
-                genera_informe(self.datos_log, titulo = "Informe " + usuario_seleccionado, usuario = usuario_seleccionado)
+            usuario = None if usuario_seleccionado == "TODOS" else usuario_seleccionado
+            agregado = self.agregado
+            self.renderizar_en_segundo_plano(
+                clave_informe(self.huella, usuario),
+                lambda: renderiza_informe(agregado, titulo_informe(usuario), usuario), TAMAÑO_INFORME)
 
     def generar_nube(self):
         usuario_seleccionado = self.lista_usuarios.get()
         if usuario_seleccionado and usuario_seleccionado != "TODOS":
-            muestra_word_cloud(self.datos_log, usuario_seleccionado)
-            
+            palabras = self.palabras_caracteristicas.get(usuario_seleccionado, {})
+            self.renderizar_en_segundo_plano(
+                clave_nube(self.huella, usuario_seleccionado, MAX_PALABRAS_NUBE),
+                lambda: renderiza_nube(palabras, MAX_PALABRAS_NUBE))
+
+    def renderizar_en_segundo_plano(self, clave, renderiza, tamaño=None):
+        # Si la imagen no está en la caché se renderiza (o se espera a quien la esté
+        # renderizando) en otro hilo; se muestra al recogerla de la cola con root.after
+        def renderizar():
+            try:
+                self.cola_render.put(('imagen', (self.cache_render.obtiene_o_renderiza(clave, renderiza), tamaño)))
+            except Exception as e:
+                self.cola_render.put(('error', e))
+
+        threading.Thread(target=renderizar, daemon=True).start()
+        self.renders_pendientes += 1
+        if self.renders_pendientes == 1:
+            self.root.after(PERIODO_CONSULTA, self.consultar_cola_render)
+
+    def consultar_cola_render(self):
+        try:
+            while True:
+                tipo, valor = self.cola_render.get_nowait()
+                self.renders_pendientes -= 1
+                if tipo == 'error':
+                    messagebox.showerror("Error", f"No se pudo generar la imagen: {valor}")
+                else:
+                    muestra_png(*valor)
+        except queue.Empty:
+            pass
+        if self.renders_pendientes > 0:
+            self.root.after(PERIODO_CONSULTA, self.consultar_cola_render)
 
 # Crear ventana principal
 root = tk.Tk()
@@ -19,6 +19,57 @@ def test_carga_log() -> list[Mensaje]:
     # Devolvemos los mensajes leídos para usarlos en el resto de los tests
     return mensajes 
 
+def test_itera_log_con_progreso() -> None:
+    print("---> Test de itera_log con progreso:")
+    avances = []
+    n = sum(1 for _ in itera_log(FICHERO, progreso=avances.append))
+    print(f"{n} mensajes leídos; progreso: {avances}")
+    print("="*40)
+    print()
+
+def test_carga_log_comprimido(mensajes: list[Mensaje]) -> None:
+    import gzip
+    import os
+    import tempfile
+    import zipfile
+    print("---> Test de carga_log con exports comprimidos:")
+    with tempfile.TemporaryDirectory() as directorio:
+        zip_ = os.path.join(directorio, 'export.zip')
+        with zipfile.ZipFile(zip_, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.write(FICHERO, '_chat.txt')
+            zf.writestr('IMG-20160301-WA0001.jpg', bytes(1000))
+        gz = os.path.join(directorio, 'chat.txt.gz')
+        with open(FICHERO, 'rb') as f, gzip.open(gz, 'wb') as g:
+            g.write(f.read())
+        for fichero in (zip_, gz):
+            print(f"{os.path.basename(fichero)} ({tipo_contenedor(fichero)}): mismos mensajes:",
+                  carga_log(fichero) == mensajes)
+    print("="*40)
+    print()
+
+def test_perfil() -> None:
+    import perfil_whatsapp
+    from agregados_whatsapp import AgregadoLog
+    print("---> Test de carga_log con debug y de perfil_whatsapp:")
+    mensajes = carga_log(FICHERO, debug=True)
+    with perfil_whatsapp.perfilando() as perfil:
+        AgregadoLog.desde_log(mensajes)
+        cuenta_palabras_por_usuario(mensajes)
+    print(perfil.texto())
+    print("Activo fuera del with:", perfil_whatsapp.activo())
+    print("="*40)
+    print()
+
+def test_parsea_lineas() -> None:
+    print("---> Test de parsea_lineas:")
+    lineas = ["[26/2/16, 09:16:25] Leonard: De acuerdo,\n",
+              "¿cuál es tu punto?\n",
+              "[26/2/16, 16:16:54] Sheldon: No tiene sentido.\n"]
+    for m in parsea_lineas(lineas):
+        print("\t", m)
+    print("="*40)
+    print()
+
 def test_calcula_usuarios(mensajes: list[Mensaje]) -> None:
     print("---> Test de cuenta_mensajes_por_usuario:")
     print("Los usuarios del log son:", calcula_usuarios(mensajes))
@@ -91,15 +142,180 @@ def test_genera_palabras_caracteristicas_usuario(mensajes: list[Mensaje]) -> Non
     print()
 
 
+def test_log_columnar(mensajes: list[Mensaje]) -> None:
+    from columnar_whatsapp import LogColumnar
+    print("---> Test de LogColumnar:")
+    log = LogColumnar.desde_mensajes(mensajes)
+    print("Mismos mensajes:", list(log) == mensajes)
+    for funcion in [cuenta_mensajes_por_usuario, cuenta_mensajes_por_meses,
+                    cuenta_mensajes_por_dia_semana, cuenta_mensajes_por_momento_del_dia,
+                    calcula_media_horas_entre_mensajes]:
+        print(f"{funcion.__name__}: {funcion(log) == funcion(mensajes)}")
+    print("="*40)
+    print()
+
+
+def test_agregado_log(mensajes: list[Mensaje]) -> None:
+    from agregados_whatsapp import AgregadoLog
+    print("---> Test de AgregadoLog:")
+    agregado = AgregadoLog.desde_log(mensajes)
+    for usuario in calcula_usuarios(agregado):
+        print(f"{usuario}: {calcula_media_horas_entre_mensajes(agregado.filtra(usuario)):.2f} horas entre mensajes")
+    print("="*40)
+    print()
+
+def test_carga_log_cacheado() -> None:
+    from time import perf_counter
+    from cache_whatsapp import carga_log_cacheado
+    print("---> Test de carga_log_cacheado:")
+    for intento in range(2):
+        inicio = perf_counter()
+        log = carga_log_cacheado(FICHERO)
+        print(f"Carga {intento + 1}: {len(log)} mensajes en {(perf_counter() - inicio) * 1000:.1f} ms")
+    print("Mismos mensajes:", list(log) == carga_log(FICHERO))
+    print("="*40)
+    print()
+
+def test_analiza_log_incremental() -> None:
+    from incremental_whatsapp import analiza_log_incremental
+    print("---> Test de analiza_log_incremental:")
+    estado = analiza_log_incremental(FICHERO)
+    print(f"{estado.offset} bytes analizados, {len(estado.agregado)} mensajes.")
+    print("Palabras por usuario:", {usuario: sum(conteo.values()) for usuario, conteo in sorted(estado.palabras.items())})
+    print("="*40)
+    print()
+
+def test_indice_palabras(mensajes: list[Mensaje]) -> None:
+    from palabras_whatsapp import IndicePalabras
+    print("---> Test de IndicePalabras:")
+    indice = IndicePalabras.desde_log(mensajes)
+    print(f"{len(indice.vocabulario)} palabras distintas.")
+    for usuario in calcula_usuarios(mensajes):
+        iguales = genera_conteos_palabras_usuario_y_resto(indice, usuario) == genera_conteos_palabras_usuario_y_resto(mensajes, usuario)
+        print(f"{usuario}: mismos conteos {iguales}")
+    print("="*40)
+    print()
+
+def test_genera_palabras_caracteristicas_usuarios(mensajes: list[Mensaje]) -> None:
+    print("---> Test de genera_palabras_caracteristicas_usuarios:")
+    todas = genera_palabras_caracteristicas_usuarios(mensajes, max_palabras=3)
+    for usuario, importancias in todas.items():
+        iguales = importancias == genera_palabras_caracteristicas_usuario(mensajes, usuario, max_palabras=3)
+        print(f"{usuario}: {list(importancias)} (igual que por usuario: {iguales})")
+    print("="*40)
+    print()
+
+def test_indice_consultas(mensajes: list[Mensaje]) -> None:
+    from datetime import date
+    from consultas_whatsapp import IndiceConsultas
+    print("---> Test de IndiceConsultas:")
+    indice = IndiceConsultas(mensajes)
+    usuario = mensajes[0].usuario
+    vista = indice.consulta(usuario, date(2016, 3, 1), date(2016, 4, 1))
+    esperados = [m for m in mensajes if m.usuario == usuario and date(2016, 3, 1) <= m.fecha < date(2016, 4, 1)]
+    print(f"{usuario}, marzo de 2016: {len(vista)} mensajes (iguales: {list(vista) == esperados})")
+    print("Por día de la semana:", dict(cuenta_mensajes_por_dia_semana(vista)))
+    print("Mensajes de noche:", len(indice.consulta(hora_desde=21, hora_hasta=7)))
+    print("="*40)
+    print()
+
+def test_indice_invertido(mensajes: list[Mensaje]) -> None:
+    from busqueda_whatsapp import IndiceInvertido, carga_indice_invertido
+    print("---> Test de IndiceInvertido:")
+    indice = carga_indice_invertido(FICHERO)
+    print(f"{len(indice)} palabras distintas, {indice.datos.nbytes} bytes de listas.")
+    # Los mismos mensajes que recorriendo el log con las palabras de tokeniza
+    palabras = lambda m: {palabra.strip(".,:();¿?¡!") for palabra in m.texto.split()}
+    esperados = [m for m in mensajes if 'física' in palabras(m)]
+    print(f"física: {len(indice.mensajes('física'))} mensajes (iguales: {list(indice.mensajes('física')) == esperados})")
+    esperados = [m for m in mensajes if {'Sheldon', 'Penny'} <= palabras(m)]
+    print(f"Sheldon y Penny: {len(indice.mensajes(['Sheldon', 'Penny']))} mensajes "
+          f"(iguales: {list(indice.mensajes(['Sheldon', 'Penny'])) == esperados})")
+    print("física o Física, por usuario:", dict(indice.por_usuario(['física', 'Física'], todas=False)))
+    print("física, por meses:", dict(indice.linea_temporal('física')))
+    # Un texto con caracteres raros (NUL, espacios Unicode) no desplaza los mensajes siguientes
+    raros = [mensajes[0]._replace(texto=texto) for texto in ['hola \x00 mundo', 'mundo', 'x\u3000mundo']]
+    print("mundo:", IndiceInvertido.desde_log(raros).busca('mundo').tolist(), "(esperados: [0, 1, 2])")
+    print("="*40)
+    print()
+
+def test_estadisticas_tiempos() -> None:
+    from estadisticas_whatsapp import calcula_estadisticas_tiempos
+    print("---> Test de calcula_estadisticas_tiempos:")
+    # Se recorre el fichero con itera_log, sin cargar el log completo
+    estadisticas = calcula_estadisticas_tiempos(itera_log(FICHERO))
+    print("Horas entre mensajes:", {clave: round(valor, 2) for clave, valor in estadisticas.resumen_huecos().items()})
+    for usuario, resumen in sorted(estadisticas.resumen_respuestas().items()):
+        print(f"{usuario} responde en {resumen['media']:.2f} horas de media (mediana {resumen['p50']:.2f})")
+    print("Media con un solo mensaje:", calcula_media_horas_entre_mensajes(carga_log(FICHERO)[:1]))
+    print("="*40)
+    print()
+
+def test_carga_log_paralelo() -> None:
+    import paralelo_whatsapp
+    print("---> Test de carga_log_paralelo:")
+    # Con el log de ejemplo no se llegaría al tamaño mínimo para repartir el trabajo
+    paralelo_whatsapp.TAM_MINIMO_PARALELO = 0
+    log = paralelo_whatsapp.carga_log_paralelo(FICHERO, procesos=4)
+    print(f"{len(log)} mensajes leídos.")
+    print("Mismos mensajes:", log == carga_log(FICHERO))
+    print("="*40)
+    print()
+
+def test_cache_render(mensajes: list[Mensaje]) -> None:
+    from time import perf_counter
+    from agregados_whatsapp import AgregadoLog
+    from columnar_whatsapp import carga_log_columnar
+    from renderizado_whatsapp import CacheRender, clave_informe, huella_log, renderiza_informe
+    print("---> Test de CacheRender:")
+    cache = CacheRender()
+    huella = huella_log(mensajes)
+    agregado = AgregadoLog.desde_log(mensajes)
+    for vez in ('primera', 'segunda'):
+        inicio = perf_counter()
+        png = cache.obtiene_o_renderiza(clave_informe(huella, 'Penny'),
+                                        lambda: renderiza_informe(agregado, "Informe Penny", 'Penny'))
+        print(f"Informe de Penny, {vez} vez: {len(png)} bytes en {perf_counter() - inicio:.3f} s")
+    print("Misma huella con el log columnar:", huella == huella_log(carga_log_columnar(FICHERO)))
+    print("="*40)
+    print()
+
+def test_arranque() -> None:
+    from benchmark_whatsapp import MODULOS_ARRANQUE, mide_arranque
+    print("---> Test del tiempo de importación:")
+    # Ningún módulo debe cargar matplotlib ni wordcloud hasta que se dibuje algo
+    for modulo in MODULOS_ARRANQUE:
+        medida = mide_arranque(modulo, repeticiones=1)
+        print(f"{modulo}: {medida['segundos']:.3f} s, {medida['modulos']} módulos, "
+              f"pesados: {medida['modulos_pesados'] or 'ninguno'}")
+        assert not medida['modulos_pesados'], f"{modulo} importa {medida['modulos_pesados']}"
+    print("="*40)
+    print()
+
 if __name__ == '__main__':
+    test_arranque()
     mensajes = test_carga_log()
+    test_parsea_lineas()
+    test_itera_log_con_progreso()
+    test_perfil()
+    test_carga_log_comprimido(mensajes)
     test_calcula_usuarios(mensajes)
     test_cuenta_mensajes_por_usuario(mensajes)
     #test_muestra_numero_mensajes_por_usuario(mensajes)
     test_cuenta_mensajes_por_meses(mensajes)
-    # test_cuenta_mensajes_por_dia_semana(mensajes)    
-    # test_cuenta_mensajes_por_momento_del_dia(mensajes)
-    # test_calcula_media_horas_entre_mensajes(mensajes)
-    # test_genera_conteos_palabras_usuario_y_resto(mensajes)
-    # test_genera_palabras_caracteristicas_usuario(mensajes)
-    
\ No newline at end of file
+    test_cuenta_mensajes_por_dia_semana(mensajes)    
+    test_cuenta_mensajes_por_momento_del_dia(mensajes)
+    test_calcula_media_horas_entre_mensajes(mensajes)
+    test_estadisticas_tiempos()
+    test_log_columnar(mensajes)
+    test_agregado_log(mensajes)
+    test_indice_consultas(mensajes)
+    test_indice_invertido(mensajes)
+    test_carga_log_cacheado()
+    test_analiza_log_incremental()
+    test_carga_log_paralelo()
+    test_cache_render(mensajes)
+    test_genera_conteos_palabras_usuario_y_resto(mensajes)
+    test_indice_palabras(mensajes)
+    test_genera_palabras_caracteristicas_usuario(mensajes)
+    test_genera_palabras_caracteristicas_usuarios(mensajes)
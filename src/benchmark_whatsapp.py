@@ -0,0 +1,237 @@
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable
+import gc
+import json
+import os as so
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from analisis_whatsapp import *
+from columnar_whatsapp import carga_log_columnar
+from graficas_whatsapp import genera_informe
+from sintetico_whatsapp import genera_log
+
+# Cambia cuando cambia el formato del fichero de resultados
+VERSION_RESULTADOS = 1
+TAMAÑOS = [10_000, 1_000_000, 10_000_000]
+# Módulos cuyo tiempo de importación se mide, y dependencias que no deberían
+# cargar: sólo hacen falta para dibujar
+MODULOS_ARRANQUE = ['analisis_whatsapp', 'columnar_whatsapp', 'agregados_whatsapp', 'graficas_whatsapp']
+MODULOS_PESADOS = ['matplotlib', 'wordcloud', 'PIL', 'tkinter']
+# Módulos que además no deben cargar numpy: leer un log no lo necesita
+PESADOS_POR_MODULO = {'analisis_whatsapp': MODULOS_PESADOS + ['numpy']}
+
+def mide(funcion: Callable[[], Any], memoria: bool = True) -> dict:
+    '''
+    Mide el tiempo y, opcionalmente, la memoria que usa una llamada a una función.
+
+    :param funcion: Función sin parámetros que se quiere medir
+    :type funcion: Callable[[], Any]
+    :param memoria: Si es True se mide también el pico de memoria, por defecto True
+    :type memoria: bool
+    :return: Diccionario con los segundos y, si se pidió, el pico de memoria en bytes
+    :rtype: dict
+
+    El tiempo se mide en una llamada sin tracemalloc, que ralentiza mucho el código,
+    y la memoria en una segunda llamada.
+    '''
+    gc.collect()
+    inicio = perf_counter()
+    funcion()
+    resultado = {'segundos': perf_counter() - inicio}
+    if memoria:
+        gc.collect()
+        tracemalloc.start()
+        funcion()
+        resultado['memoria_pico'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return resultado
+
+def mide_arranque(modulo: str, repeticiones: int = 5) -> dict:
+    '''
+    Mide el tiempo de importación de un módulo en un intérprete nuevo, con python -X importtime.
+
+    :param modulo: Nombre del módulo
+    :type modulo: str
+    :param repeticiones: Veces que se mide; se guarda la más rápida, por defecto 5
+    :type repeticiones: int
+    :return: Diccionario con los segundos, el número de módulos importados y los pesados
+        que se cargaron (los de PESADOS_POR_MODULO o, si no aparece, los de MODULOS_PESADOS)
+    :rtype: dict
+
+    El tiempo es el acumulado que informa -X importtime para el módulo, así que no
+    incluye el arranque del propio intérprete.
+    '''
+    entorno = dict(so.environ, PYTHONPATH=so.path.dirname(so.path.abspath(__file__)))
+    mejor = None
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'], env=entorno,
+                                capture_output=True, text=True, check=True).stderr
+        importados = []
+        segundos = 0.0
+        for linea in salida.splitlines():
+            # import time: self [us] | cumulative | imported package
+            campos = linea.split('|')
+            if not linea.startswith('import time:') or not campos[1].strip().isdigit():
+                continue
+            nombre = campos[2].strip()
+            importados.append(nombre)
+            if nombre == modulo:
+                segundos = int(campos[1]) / 1e6
+        if mejor is None or segundos < mejor['segundos']:
+            pesados = sorted({nombre.split('.')[0] for nombre in importados}
+                             & set(PESADOS_POR_MODULO.get(modulo, MODULOS_PESADOS)))
+            mejor = {'segundos': segundos, 'modulos': len(importados), 'modulos_pesados': pesados}
+    return mejor
+
+def _dibuja_informe(log) -> None:
+    # matplotlib se importa aquí para que importar este módulo (por ejemplo, desde
+    # los tests de arranque) no cargue pyplot ni cambie el backend
+    import matplotlib
+    matplotlib.use('Agg') # Las gráficas se dibujan sin abrir ventanas
+    import matplotlib.pyplot as plt
+    genera_informe(log)
+    plt.gcf().canvas.draw()
+    plt.close('all')
+
+def operaciones(fichero: str, log: list[Mensaje]) -> dict[str, Callable[[], Any]]:
+    '''
+    Devuelve las operaciones que se miden para un log.
+
+    :param fichero: Nombre del fichero del log
+    :type fichero: str
+    :param log: Log ya cargado, que usan las operaciones de análisis
+    :type log: list[Mensaje]
+    :return: Diccionario que asocia a cada nombre de operación una función sin parámetros
+    :rtype: dict[str, Callable[[], Any]]
+    '''
+    usuario = log[0].usuario if log else ''
+    return {
+        'carga_log': lambda: carga_log(fichero),
+        'carga_log_columnar': lambda: carga_log_columnar(fichero),
+        'calcula_usuarios': lambda: calcula_usuarios(log),
+        'cuenta_mensajes_por_usuario': lambda: cuenta_mensajes_por_usuario(log),
+        'cuenta_mensajes_por_meses': lambda: cuenta_mensajes_por_meses(log),
+        'cuenta_mensajes_por_dia_semana': lambda: cuenta_mensajes_por_dia_semana(log),
+        'cuenta_mensajes_por_momento_del_dia': lambda: cuenta_mensajes_por_momento_del_dia(log),
+        'calcula_media_horas_entre_mensajes': lambda: calcula_media_horas_entre_mensajes(log),
+        'cuenta_palabras_por_usuario': lambda: cuenta_palabras_por_usuario(log),
+        'genera_conteos_palabras_usuario_y_resto': lambda: genera_conteos_palabras_usuario_y_resto(log, usuario),
+        'genera_palabras_caracteristicas_usuario': lambda: genera_palabras_caracteristicas_usuario(log, usuario),
+        'genera_informe': lambda: _dibuja_informe(log),
+    }
+
+def ejecuta(tamaños: list[int], os: str = 'android', usuarios: int = 5, memoria: bool = True,
+            filtro: list[str] | None = None, directorio: str | None = None) -> dict:
+    '''
+    Ejecuta el benchmark sobre logs sintéticos de varios tamaños.
+    También mide la importación de MODULOS_ARRANQUE, con 0 mensajes.
+
+    :param tamaños: Números de mensajes de los logs
+    :type tamaños: list[int]
+    :param os: Formato de los logs ('android' o 'ios'), por defecto 'android'
+    :type os: str
+    :param usuarios: Número de participantes de los logs, por defecto 5
+    :type usuarios: int
+    :param memoria: Si es True se mide también el pico de memoria, por defecto True
+    :type memoria: bool
+    :param filtro: Si no es None, sólo se miden las operaciones con estos nombres
+    :type filtro: list[str] | None
+    :param directorio: Directorio donde se generan los logs; si es None, uno temporal
+    :type directorio: str | None
+    :return: Resultados, con la descripción del entorno y una entrada por operación y tamaño
+    :rtype: dict
+    '''
+    resultados = []
+    for modulo in MODULOS_ARRANQUE:
+        nombre = f'importa_{modulo}'
+        if filtro and nombre not in filtro:
+            continue
+        medida = dict(operacion=nombre, mensajes=0, **mide_arranque(modulo))
+        print(_describe(medida))
+        resultados.append(medida)
+    with tempfile.TemporaryDirectory() as temporal:
+        directorio = directorio or temporal
+        for n in tamaños:
+            fichero = so.path.join(directorio, f'sintetico_{os}_{n}.txt')
+            if not so.path.exists(fichero):
+                genera_log(fichero, n, usuarios, os)
+            log = carga_log(fichero, os)
+            for nombre, funcion in operaciones(fichero, log).items():
+                if filtro and nombre not in filtro:
+                    continue
+                medida = dict(operacion=nombre, mensajes=n, **mide(funcion, memoria))
+                print(_describe(medida))
+                resultados.append(medida)
+            del log
+    return {'version': VERSION_RESULTADOS, 'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit_actual(), 'python': platform.python_version(),
+            'plataforma': platform.platform(), 'nucleos': so.cpu_count(), 'os_log': os,
+            'usuarios': usuarios, 'resultados': resultados}
+
+def compara(actual: dict, anterior: dict) -> list[str]:
+    '''
+    Compara dos ficheros de resultados del benchmark.
+
+    :param actual: Resultados nuevos
+    :type actual: dict
+    :param anterior: Resultados con los que se comparan
+    :type anterior: dict
+    :return: Una línea de texto por cada medida presente en ambos, con el cociente de tiempos
+    :rtype: list[str]
+    '''
+    previas = {(r['operacion'], r['mensajes']): r for r in anterior['resultados']}
+    lineas = []
+    for r in actual['resultados']:
+        previa = previas.get((r['operacion'], r['mensajes']))
+        if previa is not None and previa['segundos'] > 0:
+            lineas.append(f"{r['operacion']} ({r['mensajes']} mensajes): "
+                          f"{previa['segundos']:.3f} s -> {r['segundos']:.3f} s "
+                          f"(x{r['segundos'] / previa['segundos']:.2f})")
+    return lineas
+
+def _describe(medida: dict) -> str:
+    texto = f"{medida['operacion']} ({medida['mensajes']} mensajes): {medida['segundos']:.3f} s"
+    if 'memoria_pico' in medida:
+        texto += f", pico de {medida['memoria_pico'] / (1 << 20):.1f} MB"
+    if medida.get('modulos_pesados'):
+        texto += f", importa {', '.join(medida['modulos_pesados'])}"
+    return texto
+
+def _commit_actual() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    # Ejemplo: python src/benchmark_whatsapp.py --mensajes 10000 1000000 --salida antes.json
+    #          python src/benchmark_whatsapp.py --mensajes 10000 1000000 --compara antes.json
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark del análisis de logs de Whatsapp')
+    parser.add_argument('--mensajes', type=int, nargs='+', default=TAMAÑOS)
+    parser.add_argument('--os', choices=['android', 'ios'], default='android')
+    parser.add_argument('--usuarios', type=int, default=5)
+    parser.add_argument('--operaciones', nargs='+', help='sólo mide estas operaciones')
+    parser.add_argument('--sin-memoria', action='store_true', help='no mide la memoria (más rápido)')
+    parser.add_argument('--directorio', help='directorio donde generar (y reutilizar) los logs')
+    parser.add_argument('--salida', default='benchmark.json', help='fichero JSON de resultados')
+    parser.add_argument('--compara', help='fichero JSON de resultados anteriores')
+    args = parser.parse_args()
+
+    resultados = ejecuta(args.mensajes, args.os, args.usuarios, not args.sin_memoria,
+                         args.operaciones, args.directorio)
+    with open(args.salida, 'w', encoding='utf8') as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+    if args.compara:
+        with open(args.compara, encoding='utf8') as f:
+            for linea in compara(resultados, json.load(f)):
+                print(linea)
+    pesados = [r['operacion'] for r in resultados['resultados'] if r.get('modulos_pesados')]
+    if pesados:
+        sys.exit(f"Importan módulos pesados: {', '.join(pesados)}")
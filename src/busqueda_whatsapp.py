@@ -0,0 +1,424 @@
+from collections import Counter
+from typing import Callable, Iterable
+import os as so
+import numpy as np
+from analisis_whatsapp import SO, Mensaje
+from cache_whatsapp import carga_log_cacheado_con_huella, guarda_bloques, lee_bloques, ruta_cache
+from columnar_whatsapp import MINUTOS_DIA, LogColumnar, VistaLog
+from tokenizador_whatsapp import normaliza, tokeniza
+import perfil_whatsapp
+
+MAGIA_INDICE = b'TEOIDX\x00\x01'
+# Se incrementa cuando cambia el formato del fichero o la forma de tokenizar
+VERSION_INDICE = 2
+EXTENSION_INDICE = '.teoindice'
+# Mensajes que se tokenizan de una vez al construir el índice
+TAM_BLOQUE = 1 << 16
+# Caracteres por los que divide str.split (todos son menores que U+3001)
+_ESPACIOS = np.array([chr(c).isspace() for c in range(0x3001)])
+_VACIA = -1
+
+class IndiceInvertido:
+    '''
+    Índice invertido de las palabras de un log, para buscar los mensajes que las contienen.
+
+    - log: log columnar indexado.
+    - vocabulario: lista de palabras; la palabra i corresponde a vocabulario[i].
+    - punteros: array con la posición en datos de la lista de cada palabra (una más
+      que palabras, la última es el final).
+    - frecuencias: array con el número de mensajes que contienen cada palabra.
+    - datos: array de bytes con las listas de mensajes de todas las palabras.
+    - minusculas, sin_tildes: opciones con las que se normalizaron las palabras.
+
+    Las palabras son las de genera_conteos_palabras_usuario_y_resto (tokeniza, con
+    las mismas opciones). La lista de cada palabra son las posiciones en el log de
+    los mensajes que la contienen, en orden, guardadas como diferencias con la
+    anterior en un entero de longitud variable (7 bits por byte): las palabras
+    frecuentes, que son las que ocupan, casi siempre necesitan un solo byte por mensaje.
+
+    Cada consulta descomprime sólo las listas de sus palabras, con operaciones de
+    numpy, y no vuelve a recorrer los textos del log.
+    '''
+    def __init__(self, log: LogColumnar, vocabulario: list[str], punteros: np.ndarray, frecuencias: np.ndarray,
+                 datos: np.ndarray, minusculas: bool = False, sin_tildes: bool = False):
+        self.log = log
+        self.vocabulario = vocabulario
+        self.punteros = punteros
+        self.frecuencias = frecuencias
+        self.datos = datos
+        self.minusculas = minusculas
+        self.sin_tildes = sin_tildes
+        self._ids = dict(zip(vocabulario, range(len(vocabulario))))
+        self._meses = None
+
+    @classmethod
+    @perfil_whatsapp.perfilado('indice_invertido')
+    def desde_log(cls, log: 'list[Mensaje] | LogColumnar', minusculas: bool = False, sin_tildes: bool = False,
+                  tam_bloque: int = TAM_BLOQUE) -> 'IndiceInvertido':
+        '''
+        Construye el índice de un log.
+
+        :param log: Lista de mensajes o log columnar
+        :type log: list[Mensaje] | LogColumnar
+        :param minusculas: Si es True las palabras se pasan a minúsculas, por defecto False
+        :type minusculas: bool
+        :param sin_tildes: Si es True se quitan las tildes, por defecto False
+        :type sin_tildes: bool
+        :param tam_bloque: Mensajes que se tokenizan de una vez, por defecto TAM_BLOQUE
+        :type tam_bloque: int
+        :return: Índice del log
+        :rtype: IndiceInvertido
+
+        Como en cuenta_palabras, cada bloque de textos se divide con un solo split y
+        cada palabra distinta se normaliza una sola vez. El mensaje de cada palabra
+        se obtiene de la posición en que empieza, así que no depende de ningún
+        separador que pudiera aparecer en los textos. Los pares (palabra, mensaje)
+        de cada bloque se ordenan y se eliminan los repetidos con numpy.
+        '''
+        if not isinstance(log, LogColumnar):
+            log = LogColumnar.desde_mensajes(log)
+        n = len(log)
+        ids = {}
+        codigos = {}
+        pares = []
+        for inicio in range(0, n, tam_bloque):
+            fin = min(inicio + tam_bloque, n)
+            texto, inicios = _texto_bloque(log, inicio, fin)
+            crudas = texto.split()
+            # Las palabras nuevas se numeran en orden alfabético, para que el fichero
+            # del índice no dependa del orden de iteración del conjunto
+            for cruda in sorted(set(crudas).difference(codigos)):
+                palabra = normaliza(cruda, minusculas, sin_tildes)
+                codigos[cruda] = ids.setdefault(palabra, len(ids)) if palabra else _VACIA
+            palabras = np.fromiter(map(codigos.__getitem__, crudas), dtype=np.int64, count=len(crudas))
+            mensajes = inicio + np.searchsorted(inicios, _inicios_palabras(texto), side='right') - 1
+            validas = palabras >= 0
+            claves = np.sort(palabras[validas] * n + mensajes[validas])
+            # Se quita cada palabra repetida en un mismo mensaje
+            pares.append(claves[np.concatenate([[True], claves[1:] != claves[:-1]])])
+            perfil_whatsapp.cuenta('tokens', len(crudas))
+
+        pares = np.concatenate(pares) if pares else np.zeros(0, dtype=np.int64)
+        # Cada bloque ya está ordenado por (palabra, mensaje) y los bloques van en el
+        # orden del log: una ordenación estable por palabra deja los mensajes en orden
+        orden = np.argsort(pares // max(n, 1), kind='stable')
+        palabras, mensajes = np.divmod(pares[orden], max(n, 1))
+        frecuencias = np.bincount(palabras, minlength=len(ids)).astype(np.int64)
+        primeros = np.concatenate([[0], np.cumsum(frecuencias)])
+        diferencias = mensajes.copy()
+        diferencias[1:] -= mensajes[:-1]
+        diferencias[primeros[:-1][frecuencias > 0]] = mensajes[primeros[:-1][frecuencias > 0]]
+        datos, longitudes = _codifica(diferencias)
+        punteros = np.concatenate([[0], np.cumsum(longitudes)])[primeros]
+        perfil_whatsapp.cuenta('palabras_distintas', len(ids))
+        return cls(log, list(ids), punteros, frecuencias, datos, minusculas, sin_tildes)
+
+    def __len__(self) -> int:
+        return len(self.vocabulario)
+
+    def _normaliza(self, terminos: 'str | Iterable[str]') -> list[str]:
+        # Cada término se divide y normaliza como los textos; un término con espacios son varias palabras
+        if isinstance(terminos, str):
+            terminos = [terminos]
+        return [palabra for termino in terminos for palabra in tokeniza(termino, self.minusculas, self.sin_tildes)
+                if palabra]
+
+    def frecuencia(self, palabra: str) -> int:
+        '''
+        Devuelve el número de mensajes que contienen una palabra, sin descomprimir su lista.
+        '''
+        palabras = self._normaliza(palabra)
+        if len(palabras) != 1 or palabras[0] not in self._ids:
+            return 0
+        return int(self.frecuencias[self._ids[palabras[0]]])
+
+    def posiciones(self, palabra: str) -> np.ndarray:
+        '''
+        Devuelve las posiciones en el log de los mensajes que contienen una palabra.
+
+        :param palabra: Palabra, que se normaliza como los textos del log
+        :type palabra: str
+        :return: Array ordenado de posiciones; vacío si la palabra no aparece
+        :rtype: np.ndarray
+        '''
+        palabras = self._normaliza(palabra)
+        if len(palabras) != 1:
+            return self.busca(palabras)
+        i = self._ids.get(palabras[0])
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.cumsum(_decodifica(self.datos[self.punteros[i]:self.punteros[i + 1]]))
+
+    @perfil_whatsapp.perfilado('busqueda')
+    def busca(self, terminos: 'str | Iterable[str]', todas: bool = True) -> np.ndarray:
+        '''
+        Devuelve las posiciones de los mensajes que contienen todas (o alguna) de las palabras.
+
+        :param terminos: Palabra o palabras a buscar
+        :type terminos: str | Iterable[str]
+        :param todas: Si es True los mensajes deben contener todas las palabras (AND);
+            si es False, basta con una (OR). Por defecto True
+        :type todas: bool
+        :return: Array ordenado de posiciones en el log
+        :rtype: np.ndarray
+
+        Con todas=True las listas se intersecan de la palabra menos frecuente a la más
+        frecuente, con búsquedas binarias, así que el resultado intermedio nunca crece.
+        '''
+        palabras = list(dict.fromkeys(self._normaliza(terminos)))
+        if not palabras:
+            return np.zeros(0, dtype=np.int64)
+        if todas:
+            if any(palabra not in self._ids for palabra in palabras):
+                return np.zeros(0, dtype=np.int64)
+            palabras.sort(key=lambda palabra: self.frecuencias[self._ids[palabra]])
+            res = self.posiciones(palabras[0])
+            for palabra in palabras[1:]:
+                if len(res) == 0:
+                    break
+                lista = self.posiciones(palabra)
+                i = np.minimum(np.searchsorted(lista, res), len(lista) - 1)
+                res = res[lista[i] == res]
+            return res
+        listas = [self.posiciones(palabra) for palabra in palabras if palabra in self._ids]
+        if not listas:
+            return np.zeros(0, dtype=np.int64)
+        return listas[0] if len(listas) == 1 else np.unique(np.concatenate(listas))
+
+    def mensajes(self, terminos: 'str | Iterable[str]', todas: bool = True) -> VistaLog:
+        '''
+        Devuelve los mensajes que contienen todas (o alguna) de las palabras, como en busca.
+
+        :return: Vista de los mensajes, en el orden del log
+        :rtype: VistaLog
+        '''
+        return VistaLog(self.log, self.busca(terminos, todas))
+
+    def linea_temporal(self, terminos: 'str | Iterable[str]', todas: bool = True,
+                       usuario: str | None = None) -> Counter:
+        '''
+        Cuenta, para cada mes del log, los mensajes que contienen las palabras.
+
+        :param terminos: Palabra o palabras a buscar, como en busca
+        :type terminos: str | Iterable[str]
+        :param todas: Si es True los mensajes deben contener todas las palabras, por defecto True
+        :type todas: bool
+        :param usuario: Si no es None, sólo se cuentan los mensajes de este usuario
+        :type usuario: str | None
+        :return: Counter con claves "mes/año" como las de cuenta_mensajes_por_meses
+        :rtype: Counter
+
+        Aparecen todos los meses entre el primer y el último mensaje del log, también
+        los que no tienen ningún mensaje con las palabras, así que puede dibujarse
+        directamente con grafica_linea_temporal.
+        '''
+        posiciones = self._de_usuario(self.busca(terminos, todas), usuario)
+        meses = self._meses_mensajes()
+        if len(meses) == 0:
+            return Counter()
+        primero = int(meses.min())
+        conteos = np.bincount(meses[posiciones] - primero, minlength=int(meses.max()) - primero + 1)
+        return Counter({f"{(primero + i) % 12 + 1}/{1970 + (primero + i) // 12}": int(n)
+                        for i, n in enumerate(conteos)})
+
+    def por_usuario(self, terminos: 'str | Iterable[str]', todas: bool = True) -> Counter:
+        '''
+        Cuenta, para cada usuario, los mensajes que contienen las palabras, como en busca.
+
+        :return: Counter que asocia a cada usuario su número de mensajes con las palabras
+        :rtype: Counter
+        '''
+        conteos = np.bincount(self.log.usuarios[self.busca(terminos, todas)], minlength=len(self.log.nombres))
+        return Counter({nombre: int(n) for nombre, n in zip(self.log.nombres, conteos) if n})
+
+    def _de_usuario(self, posiciones: np.ndarray, usuario: str | None) -> np.ndarray:
+        if usuario is None:
+            return posiciones
+        if usuario not in self.log.nombres:
+            return posiciones[:0]
+        return posiciones[self.log.usuarios[posiciones] == self.log.nombres.index(usuario)]
+
+    def _meses_mensajes(self) -> np.ndarray:
+        # Mes (desde enero de 1970) de cada mensaje del log; se calcula en la primera línea temporal
+        if self._meses is None:
+            dias = (np.asarray(self.log.minutos) // MINUTOS_DIA).astype('datetime64[D]')
+            self._meses = dias.astype('datetime64[M]').astype(np.int64)
+        return self._meses
+
+def _texto_bloque(log: LogColumnar, inicio: int, fin: int) -> tuple[str, np.ndarray]:
+    # Textos de los mensajes [inicio, fin) separados por un espacio, insertado
+    # directamente en los bytes (sin crear una cadena por mensaje), y posición
+    # (en caracteres) en que empieza cada uno
+    offsets = np.asarray(log.offsets[inicio:fin + 1])
+    texto = np.frombuffer(log.texto, dtype=np.uint8)[offsets[0]:offsets[-1]]
+    texto = np.insert(texto, offsets[1:-1] - offsets[0], ord(' '))
+    inicios = offsets[:-1] - offsets[0] + np.arange(len(offsets) - 1)
+    # Cada carácter empieza en un byte que no es de continuación (10xxxxxx)
+    continuaciones = np.concatenate([[0], np.cumsum((texto & 0xc0) == 0x80)])
+    return str(texto.tobytes(), 'utf8'), inicios - continuaciones[inicios]
+
+def _inicios_palabras(texto: str) -> np.ndarray:
+    # Posición (en caracteres) en que empieza cada palabra de texto.split()
+    caracteres = np.frombuffer(texto.encode('utf-32-le'), dtype=np.uint32)
+    espacio = (caracteres < len(_ESPACIOS)) & _ESPACIOS[np.minimum(caracteres, len(_ESPACIOS) - 1)]
+    return np.flatnonzero(~espacio & np.concatenate([[True], espacio[:-1]]))
+
+def _codifica(valores: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Codifica enteros no negativos en 7 bits por byte, de menor a mayor peso; el bit
+    # alto indica que el número sigue en el byte siguiente. Devuelve los bytes y la
+    # longitud de cada número
+    valores = valores.astype(np.uint64)
+    longitudes = np.ones(len(valores), dtype=np.int64)
+    desplazamiento = 7
+    while len(valores) and desplazamiento < 64 and int(valores.max()) >> desplazamiento:
+        longitudes += valores >= (1 << desplazamiento)
+        desplazamiento += 7
+    repetidos = np.repeat(valores, longitudes)
+    ultimos = np.cumsum(longitudes) - 1
+    orden = np.arange(len(repetidos)) - np.repeat(ultimos - longitudes + 1, longitudes)
+    datos = (repetidos >> (7 * orden).astype(np.uint64)) & np.uint64(0x7f)
+    sigue = np.ones(len(repetidos), dtype=bool)
+    sigue[ultimos] = False
+    datos[sigue] |= np.uint64(0x80)
+    return datos.astype(np.uint8), longitudes
+
+def _decodifica(datos: np.ndarray) -> np.ndarray:
+    # Inversa de _codifica
+    if len(datos) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ultimos = np.flatnonzero(datos < 0x80)
+    primeros = np.concatenate([[0], ultimos[:-1] + 1])
+    numero = np.repeat(np.arange(len(ultimos)), ultimos - primeros + 1)
+    orden = np.arange(len(datos)) - primeros[numero]
+    return np.add.reduceat((datos & 0x7f).astype(np.int64) << (7 * orden), primeros)
+
+def guarda_indice(indice: IndiceInvertido, ruta: str, cabecera: dict) -> None:
+    '''
+    Escribe un índice invertido en un fichero binario que puede proyectarse en memoria.
+
+    :param indice: Índice a guardar
+    :type indice: IndiceInvertido
+    :param ruta: Ruta del fichero del índice
+    :type ruta: str
+    :param cabecera: Datos adicionales a guardar en la cabecera (huella, formato...)
+    :type cabecera: dict
+
+    El fichero tiene el formato de guarda_bloques; el log no se guarda, está en su caché.
+    '''
+    bloques = {'vocabulario': np.frombuffer('\n'.join(indice.vocabulario).encode('utf8'), dtype=np.uint8),
+               'punteros': np.ascontiguousarray(indice.punteros, dtype='<i8'),
+               'frecuencias': np.ascontiguousarray(indice.frecuencias, dtype='<i8'),
+               'datos': np.ascontiguousarray(indice.datos, dtype=np.uint8)}
+    guarda_bloques(ruta, MAGIA_INDICE, dict(cabecera, version=VERSION_INDICE, minusculas=indice.minusculas,
+                                            sin_tildes=indice.sin_tildes, mensajes=len(indice.log)), bloques)
+
+def lee_indice(ruta: str, log: LogColumnar) -> tuple[dict, IndiceInvertido]:
+    '''
+    Lee un fichero de índice proyectándolo en memoria; sólo se copia el vocabulario.
+
+    :param ruta: Ruta del fichero del índice
+    :type ruta: str
+    :param log: Log al que corresponde el índice
+    :type log: LogColumnar
+    :return: Tupla con la cabecera y el índice
+    :rtype: tuple[dict, IndiceInvertido]
+    '''
+    cabecera, bloques = lee_bloques(ruta, MAGIA_INDICE)
+    vocabulario = str(bloques['vocabulario'].tobytes(), 'utf8').split('\n') if len(bloques['punteros']) > 1 else []
+    indice = IndiceInvertido(log, vocabulario, bloques['punteros'], bloques['frecuencias'], bloques['datos'],
+                             cabecera['minusculas'], cabecera['sin_tildes'])
+    return cabecera, indice
+
+@perfil_whatsapp.perfilado('carga_indice_invertido')
+def carga_indice_invertido(fichero: str, os: str = SO, directorio: str | None = None, minusculas: bool = False,
+                           sin_tildes: bool = False,
+                           progreso: Callable[[int], None] | None = None) -> IndiceInvertido:
+    '''
+    Carga un log con carga_log_cacheado y su índice invertido, que se guarda junto
+    a la caché del log (o en el directorio indicado).
+
+    :param fichero: Nombre del fichero del que se quieren leer los datos
+    :type fichero: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param directorio: Directorio de cachés; si es None, el índice se guarda junto al log
+    :type directorio: str | None
+    :param minusculas: Si es True las palabras se pasan a minúsculas, por defecto False
+    :type minusculas: bool
+    :param sin_tildes: Si es True se quitan las tildes, por defecto False
+    :type sin_tildes: bool
+    :param progreso: Función a la que se informa de los bytes leídos si hay que
+        parsear el log, como en itera_log
+    :type progreso: Callable[[int], None] | None
+    :return: Índice invertido, con el log en su atributo log
+    :rtype: IndiceInvertido
+
+    El índice guardado se reutiliza si se construyó con las mismas opciones y para
+    el mismo contenido del log, según el resumen que da carga_log_cacheado_con_huella
+    (el fichero no se vuelve a leer); si no, se construye y se reescribe. Si no
+    puede escribirse, el índice se devuelve igualmente.
+    '''
+    actual, log = carga_log_cacheado_con_huella(fichero, os, directorio, progreso)
+    ruta = ruta_cache(fichero, directorio, EXTENSION_INDICE)
+    opciones = {'os': os, 'minusculas': minusculas, 'sin_tildes': sin_tildes}
+
+    cabecera = indice = None
+    if so.path.exists(ruta):
+        try:
+            cabecera, indice = lee_indice(ruta, log)
+        except (OSError, ValueError, KeyError):
+            cabecera = indice = None
+    if cabecera is not None and cabecera.get('version') == VERSION_INDICE and cabecera.get('mensajes') == len(log) \
+            and all(cabecera.get(clave) == valor for clave, valor in opciones.items()):
+        guardada = cabecera['huella']
+        if guardada == actual:
+            perfil_whatsapp.cuenta('indice_aciertos')
+            return indice
+        if all(guardada.get(clave) == actual[clave] for clave in ('ruta', 'tamaño', 'hash')):
+            _guarda_si_se_puede(indice, ruta, dict(opciones, huella=actual))
+            perfil_whatsapp.cuenta('indice_aciertos')
+            return indice
+
+    perfil_whatsapp.cuenta('indice_fallos')
+    indice = IndiceInvertido.desde_log(log, minusculas, sin_tildes)
+    _guarda_si_se_puede(indice, ruta, dict(opciones, huella=actual))
+    return indice
+
+def _guarda_si_se_puede(indice: IndiceInvertido, ruta: str, cabecera: dict) -> None:
+    try:
+        guarda_indice(indice, ruta, cabecera)
+    except OSError:
+        pass
+
+if __name__ == '__main__':
+    # Ejemplo: python src/busqueda_whatsapp.py data/bigbangtheory_es.txt física --minusculas --grafica fisica.png
+    import argparse
+    from time import perf_counter
+    from graficas_whatsapp import muestra_linea_temporal
+
+    parser = argparse.ArgumentParser(description='Busca palabras en un log de Whatsapp con un índice invertido')
+    parser.add_argument('fichero')
+    parser.add_argument('palabras', nargs='+')
+    parser.add_argument('--os', choices=['auto', 'android', 'ios'], default=SO)
+    parser.add_argument('--alguna', action='store_true', help='basta con que el mensaje contenga una palabra')
+    parser.add_argument('--minusculas', action='store_true', help='no distingue mayúsculas y minúsculas')
+    parser.add_argument('--sin-tildes', action='store_true', help='no distingue vocales con y sin tilde')
+    parser.add_argument('--usuario', help='línea temporal de un solo usuario')
+    parser.add_argument('--mensajes', type=int, default=10, help='mensajes encontrados que se muestran')
+    parser.add_argument('--grafica', help='fichero donde guardar la línea temporal; "-" la muestra')
+    args = parser.parse_args()
+
+    inicio = perf_counter()
+    indice = carga_indice_invertido(args.fichero, args.os, minusculas=args.minusculas, sin_tildes=args.sin_tildes)
+    print(f"Índice de {len(indice)} palabras y {len(indice.log)} mensajes en {perf_counter() - inicio:.3f} s")
+    inicio = perf_counter()
+    encontrados = indice.mensajes(args.palabras, not args.alguna)
+    print(f"{len(encontrados)} mensajes en {(perf_counter() - inicio) * 1000:.2f} ms")
+    for m in encontrados[:args.mensajes]:
+        print(f"{m.fecha:%d/%m/%Y} {m.hora:%H:%M} {m.usuario}: {m.texto}")
+    for usuario, n in indice.por_usuario(args.palabras, not args.alguna).most_common():
+        print(f"{usuario}: {n}")
+    if args.grafica:
+        linea = indice.linea_temporal(args.palabras, not args.alguna, args.usuario)
+        muestra_linea_temporal(linea, f"Mensajes con {' '.join(args.palabras)}",
+                               None if args.grafica == '-' else args.grafica)
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import mmap
+import os as so
+from typing import Callable
+import numpy as np
+from analisis_whatsapp import SO
+from columnar_whatsapp import LogColumnar, carga_log_columnar
+import perfil_whatsapp
+
+MAGIA = b'TEOLOG\x00\x01'
+# Se incrementa cuando cambia el formato del fichero o la forma de parsear los logs
+VERSION_CACHE = 1
+EXTENSION_CACHE = '.teocache'
+TAM_BLOQUE = 1 << 20
+ALINEACION = 8
+
+def huella(fichero: str) -> dict:
+    '''
+    Calcula la huella de un fichero: ruta absoluta, tamaño, fecha de modificación
+    y resumen BLAKE2 de su contenido.
+
+    :param fichero: Nombre del fichero
+    :type fichero: str
+    :return: Diccionario con las claves 'ruta', 'tamaño', 'mtime_ns' y 'hash'
+    :rtype: dict
+    '''
+    estado = so.stat(fichero)
+    return {'ruta': so.path.abspath(fichero), 'tamaño': estado.st_size,
+            'mtime_ns': estado.st_mtime_ns, 'hash': hash_contenido(fichero)}
+
+def hash_contenido(fichero: str, progreso: Callable[[int], None] | None = None) -> str:
+    '''
+    Devuelve el resumen BLAKE2 del contenido de un fichero.
+
+    :param fichero: Nombre del fichero
+    :type fichero: str
+    :param progreso: Si no es None, se llama tras cada bloque con los bytes leídos, por defecto None
+    :type progreso: Callable[[int], None] | None
+    :return: Resumen en hexadecimal
+    :rtype: str
+    '''
+    resumen = nuevo_resumen()
+    leidos = 0
+    with open(fichero, 'rb') as f:
+        while bloque := f.read(TAM_BLOQUE):
+            resumen.update(bloque)
+            leidos += len(bloque)
+            if progreso is not None:
+                progreso(leidos)
+    return resumen.hexdigest()
+
+def nuevo_resumen():
+    '''
+    Crea el objeto de hashlib con el que se resume el contenido de los logs.
+
+    :return: Resumen BLAKE2 vacío, como el de hash_contenido
+    :rtype: hashlib.blake2b
+    '''
+    return hashlib.blake2b(digest_size=16)
+
+def ruta_cache(fichero: str, directorio: str | None = None, extension: str = EXTENSION_CACHE) -> str:
+    '''
+    Devuelve la ruta del fichero de caché de un log.
+
+    :param fichero: Nombre del fichero de log
+    :type fichero: str
+    :param directorio: Directorio de cachés; si es None, la caché se guarda junto al log
+    :type directorio: str | None
+    :param extension: Extensión del fichero de caché, por defecto '.teocache'
+    :type extension: str
+    :return: Ruta del fichero de caché
+    :rtype: str
+    '''
+    if directorio is None:
+        return fichero + extension
+    ruta = so.path.abspath(fichero)
+    nombre = hashlib.blake2b(ruta.encode('utf8'), digest_size=8).hexdigest()
+    return so.path.join(directorio, so.path.basename(fichero) + '.' + nombre + extension)
+
+def guarda_cache(log: LogColumnar, ruta: str, cabecera: dict) -> None:
+    '''
+    Escribe un log columnar en un fichero binario que puede proyectarse en memoria.
+
+    :param log: Log a guardar
+    :type log: LogColumnar
+    :param ruta: Ruta del fichero de caché
+    :type ruta: str
+    :param cabecera: Datos adicionales a guardar en la cabecera (huella, formato...)
+    :type cabecera: dict
+
+    El fichero tiene el formato de guarda_bloques, con los arrays del log y el
+    buffer de textos.
+    '''
+    bloques = {'minutos': np.ascontiguousarray(log.minutos, dtype='<i8'),
+               'usuarios': np.ascontiguousarray(log.usuarios, dtype='<i4'),
+               'offsets': np.ascontiguousarray(log.offsets - log.offsets[0], dtype='<i8'),
+               'texto': np.frombuffer(log.texto, dtype=np.uint8)[log.offsets[0]:log.offsets[-1]]}
+    guarda_bloques(ruta, MAGIA, dict(cabecera, version=VERSION_CACHE, nombres=log.nombres), bloques)
+
+def lee_cache(ruta: str) -> tuple[dict, LogColumnar]:
+    '''
+    Lee un fichero de caché proyectándolo en memoria, sin copiar sus datos.
+
+    :param ruta: Ruta del fichero de caché
+    :type ruta: str
+    :return: Tupla con la cabecera y el log columnar
+    :rtype: tuple[dict, LogColumnar]
+    '''
+    cabecera, bloques = lee_bloques(ruta, MAGIA)
+    log = LogColumnar(bloques['minutos'], bloques['usuarios'], cabecera['nombres'],
+                      memoryview(bloques['texto']), bloques['offsets'])
+    return cabecera, log
+
+def guarda_bloques(ruta: str, magia: bytes, cabecera: dict, bloques: dict[str, np.ndarray]) -> None:
+    '''
+    Escribe una cabecera y varios arrays en un fichero binario que puede proyectarse en memoria.
+
+    :param ruta: Ruta del fichero
+    :type ruta: str
+    :param magia: Marca del tipo de fichero (por ejemplo, MAGIA)
+    :type magia: bytes
+    :param cabecera: Datos a guardar en la cabecera, que deben poder escribirse en JSON
+    :type cabecera: dict
+    :param bloques: Diccionario que asocia a cada nombre un array de una dimensión
+    :type bloques: dict[str, np.ndarray]
+
+    El fichero contiene la marca, la longitud de la cabecera (8 bytes), la cabecera
+    en JSON y, alineados a 8 bytes, los arrays. Se escribe en un fichero temporal
+    que luego sustituye al anterior, para que un fichero a medio escribir nunca
+    llegue a leerse.
+    '''
+    cabecera = dict(cabecera, bloques={})
+    # La cabecera guarda la posición de cada bloque, que depende de su propia longitud:
+    # se calcula con posiciones provisionales y se recalcula hasta que no cambia
+    inicio = 0
+    while True:
+        posicion = inicio
+        for nombre, datos in bloques.items():
+            cabecera['bloques'][nombre] = [posicion, len(datos), datos.dtype.str]
+            posicion = _alinea(posicion + datos.nbytes)
+        json_cabecera = json.dumps(cabecera, ensure_ascii=False).encode('utf8')
+        nuevo_inicio = _alinea(len(magia) + 8 + len(json_cabecera))
+        if nuevo_inicio == inicio:
+            break
+        inicio = nuevo_inicio
+
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(magia)
+        f.write(len(json_cabecera).to_bytes(8, 'little'))
+        f.write(json_cabecera)
+        for nombre, datos in bloques.items():
+            f.seek(cabecera['bloques'][nombre][0])
+            f.write(datos.tobytes())
+    so.replace(temporal, ruta)
+
+def lee_bloques(ruta: str, magia: bytes) -> tuple[dict, dict[str, np.ndarray]]:
+    '''
+    Lee un fichero escrito con guarda_bloques proyectándolo en memoria, sin copiar sus datos.
+
+    :param ruta: Ruta del fichero
+    :type ruta: str
+    :param magia: Marca que debe tener el fichero
+    :type magia: bytes
+    :return: Tupla con la cabecera y el diccionario de arrays, de sólo lectura
+    :rtype: tuple[dict, dict[str, np.ndarray]]
+    '''
+    with open(ruta, 'rb') as f:
+        memoria = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if memoria[:len(magia)] != magia:
+        raise ValueError(f'{ruta} no tiene el formato esperado')
+    longitud = int.from_bytes(memoria[len(magia):len(magia) + 8], 'little')
+    cabecera = json.loads(memoria[len(magia) + 8:len(magia) + 8 + longitud].decode('utf8'))
+    bloques = {nombre: np.frombuffer(memoria, dtype=tipo, count=n, offset=posicion)
+               for nombre, (posicion, n, tipo) in cabecera['bloques'].items()}
+    return cabecera, bloques
+
+def carga_log_cacheado(fichero: str, os: str = SO, directorio: str | None = None,
+                       progreso: Callable[[int], None] | None = None) -> LogColumnar:
+    '''
+    Carga un log de Whatsapp usando una caché binaria que se guarda junto al log
+    (o en el directorio indicado).
+
+    :param fichero: Nombre del fichero del que se quieren leer los datos
+    :type fichero: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param directorio: Directorio de cachés; si es None, la caché se guarda junto al log
+    :type directorio: str | None
+    :param progreso: Función a la que se informa de los bytes leídos si hay que
+        parsear o resumir el log, como en itera_log
+    :type progreso: Callable[[int], None] | None
+    :return: Log columnar
+    :rtype: LogColumnar
+
+    La caché es válida si coinciden la ruta, el tamaño y la fecha de modificación
+    del log. Si sólo cambia la fecha de modificación, se compara además el resumen
+    del contenido, y si coincide se reutiliza la caché. En cualquier otro caso se
+    vuelve a parsear el log y se reescribe la caché. Si la caché no puede escribirse
+    (por ejemplo, por falta de permisos) el log se carga igualmente. Al parsear el
+    log, el resumen se calcula con los mismos bytes que lee el parser, sin volver
+    a leer el fichero.
+    '''
+    return carga_log_cacheado_con_huella(fichero, os, directorio, progreso)[1]
+
+@perfil_whatsapp.perfilado('carga_log_cacheado')
+def carga_log_cacheado_con_huella(fichero: str, os: str = SO, directorio: str | None = None,
+                                  progreso: Callable[[int], None] | None = None) -> tuple[dict, LogColumnar]:
+    '''
+    Como carga_log_cacheado, pero devuelve también la huella del log (véase huella)
+    con la que se validó o se guardó la caché.
+
+    :param fichero: Nombre del fichero del que se quieren leer los datos
+    :type fichero: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param directorio: Directorio de cachés; si es None, la caché se guarda junto al log
+    :type directorio: str | None
+    :param progreso: Función a la que se informa de los bytes leídos, como en carga_log_cacheado
+    :type progreso: Callable[[int], None] | None
+    :return: Tupla con la huella y el log columnar
+    :rtype: tuple[dict, LogColumnar]
+
+    Así, las cachés que dependen del log (por ejemplo, el índice invertido) pueden
+    validarse con su resumen sin volver a leer el fichero.
+    '''
+    ruta = ruta_cache(fichero, directorio)
+    estado = so.stat(fichero)
+    actual = {'ruta': so.path.abspath(fichero), 'tamaño': estado.st_size, 'mtime_ns': estado.st_mtime_ns}
+
+    cabecera = log = None
+    if so.path.exists(ruta):
+        try:
+            cabecera, log = lee_cache(ruta)
+        except (OSError, ValueError, KeyError):
+            cabecera = log = None
+    if cabecera is not None and cabecera.get('version') == VERSION_CACHE and cabecera.get('os') == os:
+        guardada = cabecera['huella']
+        if all(guardada[clave] == actual[clave] for clave in actual):
+            perfil_whatsapp.cuenta('cache_aciertos')
+            return dict(actual, hash=guardada['hash']), log
+        if guardada['ruta'] == actual['ruta'] and guardada['tamaño'] == actual['tamaño'] \
+                and guardada['hash'] == hash_contenido(fichero, progreso):
+            actual['hash'] = guardada['hash']
+            _guarda_si_se_puede(log, ruta, {'os': os, 'huella': actual})
+            perfil_whatsapp.cuenta('cache_aciertos')
+            return actual, log
+
+    perfil_whatsapp.cuenta('cache_fallos')
+    resumen = nuevo_resumen()
+    log = carga_log_columnar(fichero, os, progreso, resumen)
+    actual['hash'] = resumen.hexdigest()
+    _guarda_si_se_puede(log, ruta, {'os': os, 'huella': actual})
+    return actual, log
+
+def _guarda_si_se_puede(log: LogColumnar, ruta: str, cabecera: dict) -> None:
+    try:
+        guarda_cache(log, ruta, cabecera)
+    except OSError:
+        pass
+
+def _alinea(posicion: int) -> int:
+    return (posicion + ALINEACION - 1) // ALINEACION * ALINEACION
@@ -0,0 +1,269 @@
+from array import array
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+from typing import Callable, Iterable, Iterator
+import numpy as np
+from analisis_whatsapp import Mensaje, SO, itera_log
+import perfil_whatsapp
+
+# Los instantes se guardan como minutos transcurridos desde esta fecha
+EPOCA = datetime(1970, 1, 1)
+MINUTOS_DIA = 24 * 60
+# El 1 de enero de 1970 fue jueves (weekday() == 3)
+DIA_SEMANA_EPOCA = 3
+
+class LogColumnar:
+    '''
+    Log de Whatsapp almacenado por columnas en arrays de NumPy.
+
+    - minutos: array int64 con el instante de cada mensaje, en minutos desde 1/1/1970.
+    - usuarios: array int32 con el código de usuario de cada mensaje.
+    - nombres: lista de nombres de usuario; el código i corresponde a nombres[i].
+    - texto: textos de todos los mensajes, concatenados y codificados en UTF-8
+      (bytes, o un memoryview si el log se ha leído de una caché).
+    - offsets: array int64 de longitud n+1; el texto del mensaje i es
+      texto[offsets[i]:offsets[i+1]].
+
+    Ocupa una fracción de la memoria de una lista de Mensaje y permite calcular
+    las estadísticas del log con operaciones vectorizadas. Al iterar o indexar
+    se obtienen objetos Mensaje, como en la lista devuelta por carga_log.
+    '''
+    def __init__(self, minutos: np.ndarray, usuarios: np.ndarray, nombres: list[str],
+                 texto: bytes | memoryview, offsets: np.ndarray):
+        self.minutos = minutos
+        self.usuarios = usuarios
+        self.nombres = nombres
+        self.texto = texto
+        self.offsets = offsets
+
+    @classmethod
+    def desde_mensajes(cls, mensajes: Iterable[Mensaje]) -> 'LogColumnar':
+        '''
+        Construye un log columnar a partir de una secuencia de mensajes.
+
+        :param mensajes: Mensajes en orden cronológico
+        :type mensajes: Iterable[Mensaje]
+        :return: Log columnar
+        :rtype: LogColumnar
+        '''
+        minutos = array('q')
+        usuarios = array('i')
+        codigos = {}
+        textos = []
+        dias = {}
+        for m in mensajes:
+            dia = dias.get(m.fecha)
+            if dia is None:
+                dia = dias[m.fecha] = (m.fecha.toordinal() - EPOCA.toordinal()) * MINUTOS_DIA
+            minutos.append(dia + m.hora.hour * 60 + m.hora.minute)
+            codigo = codigos.get(m.usuario)
+            if codigo is None:
+                codigo = codigos[m.usuario] = len(codigos)
+            usuarios.append(codigo)
+            textos.append(m.texto.encode('utf8'))
+        offsets = np.fromiter(accumulate(map(len, textos), initial=0), dtype=np.int64,
+                              count=len(textos) + 1)
+        return cls(np.frombuffer(minutos, dtype=np.int64), np.frombuffer(usuarios, dtype=np.int32),
+                   list(codigos), b''.join(textos), offsets)
+
+    def __len__(self) -> int:
+        return len(self.minutos)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            inicio, fin, paso = indice.indices(len(self))
+            if paso != 1:
+                return [self[i] for i in range(inicio, fin, paso)]
+            fin = max(inicio, fin)
+            return LogColumnar(self.minutos[inicio:fin], self.usuarios[inicio:fin], self.nombres,
+                               self.texto, self.offsets[inicio:fin + 1])
+        if indice < 0:
+            indice += len(self)
+        instante = EPOCA + timedelta(minutes=int(self.minutos[indice]))
+        return Mensaje(instante.date(), instante.time(), self.nombres[self.usuarios[indice]],
+                       self.texto_de(indice))
+
+    def __iter__(self) -> Iterator[Mensaje]:
+        # Como en parsea_lineas, las fechas y horas repetidas se construyen una sola vez
+        fechas = {}
+        horas = {}
+        nombres = self.nombres
+        texto = self.texto
+        offsets = self.offsets.tolist()
+        for i, (minuto, codigo) in enumerate(zip(self.minutos.tolist(), self.usuarios.tolist())):
+            dia, minuto_dia = divmod(minuto, MINUTOS_DIA)
+            fecha = fechas.get(dia)
+            if fecha is None:
+                fecha = fechas[dia] = date.fromordinal(EPOCA.toordinal() + dia)
+            hora = horas.get(minuto_dia)
+            if hora is None:
+                hora = horas[minuto_dia] = time(*divmod(minuto_dia, 60))
+            yield Mensaje(fecha, hora, nombres[codigo], str(texto[offsets[i]:offsets[i + 1]], 'utf8'))
+
+    @classmethod
+    def concatena(cls, logs: Iterable['LogColumnar']) -> 'LogColumnar':
+        '''
+        Une varios logs columnares en uno, en el orden recibido.
+
+        :param logs: Logs a unir
+        :type logs: Iterable[LogColumnar]
+        :return: Log con los mensajes de todos ellos
+        :rtype: LogColumnar
+
+        Los códigos de usuario se renumeran por orden de primera aparición, así que
+        el resultado es igual al que se obtendría construyendo el log de una vez.
+        '''
+        codigos = {}
+        minutos, usuarios, textos, offsets = [], [], [], []
+        base = 0
+        for log in logs:
+            traduccion = np.array([codigos.setdefault(nombre, len(codigos)) for nombre in log.nombres],
+                                  dtype=np.int32)
+            minutos.append(log.minutos)
+            usuarios.append(traduccion[log.usuarios] if len(log) else log.usuarios.astype(np.int32))
+            textos.append(bytes(log.texto[log.offsets[0]:log.offsets[-1]]))
+            offsets.append(log.offsets[:-1] - log.offsets[0] + base)
+            base += int(log.offsets[-1] - log.offsets[0])
+        offsets.append(np.array([base], dtype=np.int64))
+        return cls(np.concatenate(minutos) if minutos else np.zeros(0, dtype=np.int64),
+                   np.concatenate(usuarios) if usuarios else np.zeros(0, dtype=np.int32),
+                   list(codigos), b''.join(textos), np.concatenate(offsets))
+
+    def texto_de(self, indice: int) -> str:
+        '''
+        Devuelve el texto del mensaje que ocupa la posición indicada.
+
+        :param indice: Posición del mensaje
+        :type indice: int
+        :return: Texto del mensaje
+        :rtype: str
+        '''
+        return str(self.texto[self.offsets[indice]:self.offsets[indice + 1]], 'utf8')
+
+class VistaLog:
+    '''
+    Subconjunto de los mensajes de un LogColumnar, sin copiar sus datos.
+
+    - log: log columnar completo.
+    - posiciones: array con las posiciones en log de los mensajes de la vista, en orden.
+
+    Se itera e indexa como una lista de Mensaje, y las funciones de análisis la
+    aceptan igual que un log.
+    '''
+    def __init__(self, log: LogColumnar, posiciones: np.ndarray):
+        self.log = log
+        self.posiciones = posiciones
+
+    def __len__(self) -> int:
+        return len(self.posiciones)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return VistaLog(self.log, self.posiciones[indice])
+        return self.log[int(self.posiciones[indice])]
+
+    def __iter__(self) -> Iterator[Mensaje]:
+        log = self.log
+        for posicion in self.posiciones.tolist():
+            yield log[posicion]
+
+@perfil_whatsapp.perfilado('carga_log_columnar')
+def carga_log_columnar(fichero: str, os: str = SO, progreso: Callable[[int], None] | None = None,
+                       resumen=None) -> LogColumnar:
+    '''
+    Carga un log de Whatsapp directamente en formato columnar.
+
+    :param fichero: Nombre del fichero del que se quieren leer los datos
+    :type fichero: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param progreso: Función a la que se informa de los bytes leídos, como en itera_log
+    :type progreso: Callable[[int], None] | None
+    :param resumen: Objeto de hashlib al que se añaden los bytes leídos, como en itera_log
+    :type resumen: hashlib._Hash | None
+    :return: Log columnar
+    :rtype: LogColumnar
+    '''
+    return LogColumnar.desde_mensajes(itera_log(fichero, os, progreso, resumen))
+
+def columnas(log: 'list[Mensaje] | LogColumnar | VistaLog') -> tuple[np.ndarray, np.ndarray, list[str]]:
+    '''
+    Devuelve las columnas de instantes y usuarios de un log, sin los textos.
+
+    :param log: Lista de mensajes, log columnar o vista
+    :type log: list[Mensaje] | LogColumnar | VistaLog
+    :return: Tupla con los minutos de cada mensaje, los códigos de usuario y los nombres
+    :rtype: tuple[np.ndarray, np.ndarray, list[str]]
+
+    Si el log ya es columnar se devuelven sus arrays sin copiarlos. De una vista
+    sólo se copian las columnas de sus mensajes.
+    '''
+    if isinstance(log, LogColumnar):
+        return log.minutos, log.usuarios, log.nombres
+    if isinstance(log, VistaLog):
+        return log.log.minutos[log.posiciones], log.log.usuarios[log.posiciones], log.log.nombres
+    minutos = array('q')
+    usuarios = array('i')
+    codigos = {}
+    dias = {}
+    for m in log:
+        dia = dias.get(m.fecha)
+        if dia is None:
+            dia = dias[m.fecha] = (m.fecha.toordinal() - EPOCA.toordinal()) * MINUTOS_DIA
+        minutos.append(dia + m.hora.hour * 60 + m.hora.minute)
+        codigo = codigos.get(m.usuario)
+        if codigo is None:
+            codigo = codigos[m.usuario] = len(codigos)
+        usuarios.append(codigo)
+    return np.frombuffer(minutos, dtype=np.int64), np.frombuffer(usuarios, dtype=np.int32), list(codigos)
+
+if __name__ == '__main__':
+    # Benchmark de memoria: lista de Mensaje frente a log columnar, parseado o leído de la caché
+    import argparse
+    import gc
+    import os as so
+    import tempfile
+    import tracemalloc
+    from analisis_whatsapp import carga_log
+    from cache_whatsapp import carga_log_cacheado, ruta_cache
+    parser = argparse.ArgumentParser(description='Benchmark de memoria de las representaciones de un log')
+    parser.add_argument('fichero', nargs='?', default='data/bigbangtheory_es.txt')
+    parser.add_argument('--repeticiones', type=int, default=20,
+                        help='veces que se repite el log para aumentar su tamaño')
+    args = parser.parse_args()
+
+    def memoria(carga):
+        # Bytes que siguen reservados mientras el resultado de carga() está vivo
+        gc.collect()
+        tracemalloc.start()
+        resultado = carga()
+        actual, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return resultado, actual
+
+    with tempfile.TemporaryDirectory() as directorio:
+        sintetico = so.path.join(directorio, 'sintetico.txt')
+        with open(args.fichero, 'rb') as f:
+            datos = f.read().removeprefix(b'\xef\xbb\xbf')
+        # Si el export no acaba en salto de línea, el último mensaje de cada copia
+        # se uniría al primero de la siguiente
+        if not datos.endswith(b'\n'):
+            datos += b'\n'
+        with open(sintetico, 'wb') as f:
+            f.write(datos * args.repeticiones)
+        carga_log_cacheado(sintetico)
+
+        # tracemalloc no ve la memoria proyectada de la caché: se suma el tamaño del
+        # fichero proyectado, que es lo que ocupa en memoria una vez leído entero
+        proyectado = so.path.getsize(ruta_cache(sintetico))
+        print(f"Log: {so.path.getsize(sintetico) / (1 << 20):.1f} MB")
+        for nombre, carga, bytes_proyectados in [
+                ('list[Mensaje]', lambda: carga_log(sintetico), 0),
+                ('LogColumnar', lambda: carga_log_columnar(sintetico), 0),
+                ('LogColumnar (caché en mmap)', lambda: carga_log_cacheado(sintetico), proyectado)]:
+            log, bytes_reservados = memoria(carga)
+            total = bytes_reservados + bytes_proyectados
+            print(f"{nombre}: {len(log)} mensajes, {bytes_reservados / (1 << 20):.1f} MB reservados + "
+                  f"{bytes_proyectados / (1 << 20):.1f} MB proyectados = {total / (1 << 20):.1f} MB, "
+                  f"{total / len(log):.0f} bytes por mensaje")
+            del log
@@ -0,0 +1,108 @@
+from datetime import date, datetime
+import numpy as np
+from analisis_whatsapp import Mensaje
+from columnar_whatsapp import EPOCA, MINUTOS_DIA, LogColumnar, VistaLog
+import perfil_whatsapp
+
+class IndiceConsultas:
+    '''
+    Índice para consultar los mensajes de un log por usuario, fechas y horas.
+
+    - log: log columnar indexado.
+    - orden: None si el log está en orden cronológico; si no, las posiciones de
+      sus mensajes ordenadas por instante.
+    - minutos_ordenados: instantes de los mensajes en orden cronológico.
+    - posiciones: diccionario que asocia a cada usuario las posiciones de sus
+      mensajes, en orden cronológico.
+    - minutos_usuario: diccionario que asocia a cada usuario los instantes de sus
+      mensajes, en el mismo orden que posiciones.
+
+    Se construye una vez al cargar el log. Cada consulta hace búsquedas binarias
+    (np.searchsorted) en lugar de recorrer el log, y devuelve una vista de los
+    mensajes, no una copia.
+    '''
+    @perfil_whatsapp.perfilado('indice_consultas')
+    def __init__(self, log: 'list[Mensaje] | LogColumnar'):
+        if not isinstance(log, LogColumnar):
+            log = LogColumnar.desde_mensajes(log)
+        self.log = log
+        minutos = log.minutos
+        self.orden = None
+        self.minutos_ordenados = minutos
+        if np.any(minutos[1:] < minutos[:-1]):
+            self.orden = np.argsort(minutos, kind='stable')
+            self.minutos_ordenados = minutos[self.orden]
+        por_instante = self.orden if self.orden is not None else np.arange(len(log))
+        agrupadas = por_instante[np.argsort(log.usuarios[por_instante], kind='stable')]
+        cortes = np.cumsum(np.bincount(log.usuarios, minlength=len(log.nombres)))[:-1]
+        self.posiciones = dict(zip(log.nombres, np.split(agrupadas, cortes)))
+        self.minutos_usuario = {nombre: minutos[posiciones] for nombre, posiciones in self.posiciones.items()}
+
+    def consulta(self, usuario: str | None = None, desde: date | None = None, hasta: date | None = None,
+                 hora_desde: int | None = None, hora_hasta: int | None = None) -> 'LogColumnar | VistaLog':
+        '''
+        Devuelve los mensajes que cumplen todas las condiciones indicadas.
+
+        :param usuario: Si no es None, sólo los mensajes de este usuario
+        :type usuario: str | None
+        :param desde: Si no es None, sólo los mensajes a partir de esta fecha (o instante)
+        :type desde: date | None
+        :param hasta: Si no es None, sólo los mensajes anteriores a esta fecha (o instante)
+        :type hasta: date | None
+        :param hora_desde: Si no es None, sólo los mensajes a partir de esta hora del día (0-23)
+        :type hora_desde: int | None
+        :param hora_hasta: Si no es None, sólo los mensajes anteriores a esta hora del día (1-24)
+        :type hora_hasta: int | None
+        :return: Mensajes seleccionados, en orden cronológico
+        :rtype: LogColumnar | VistaLog
+
+        El intervalo de fechas incluye desde y excluye hasta; por ejemplo, marzo de 2016
+        es desde=date(2016, 3, 1), hasta=date(2016, 4, 1). Lo mismo ocurre con las horas,
+        y si hora_desde es mayor que hora_hasta el intervalo pasa por la medianoche
+        (hora_desde=21, hora_hasta=7 son los mensajes de la noche).
+
+        Sin horas, la consulta sólo hace búsquedas binarias y el resultado comparte los
+        arrays del log. Las horas exigen recorrer los mensajes del intervalo ya acotado.
+        '''
+        inicio = _a_minutos(desde)
+        fin = _a_minutos(hasta)
+        if usuario is not None:
+            minutos = self.minutos_usuario.get(usuario, np.zeros(0, dtype=np.int64))
+            posiciones = self.posiciones.get(usuario, np.zeros(0, dtype=np.intp))
+            vista = VistaLog(self.log, posiciones[self._intervalo(minutos, inicio, fin)])
+        elif self.orden is not None:
+            vista = VistaLog(self.log, self.orden[self._intervalo(self.minutos_ordenados, inicio, fin)])
+        else:
+            intervalo = self._intervalo(self.minutos_ordenados, inicio, fin)
+            vista = self.log[intervalo]
+
+        if hora_desde is None and hora_hasta is None:
+            return vista
+        hora_desde = 0 if hora_desde is None else hora_desde
+        hora_hasta = 24 if hora_hasta is None else hora_hasta
+        if isinstance(vista, VistaLog):
+            posiciones = vista.posiciones
+        else:
+            posiciones = np.arange(intervalo.start, intervalo.stop)
+        horas = self.log.minutos[posiciones] % MINUTOS_DIA // 60
+        if hora_desde <= hora_hasta:
+            elegidos = (horas >= hora_desde) & (horas < hora_hasta)
+        else:
+            elegidos = (horas >= hora_desde) | (horas < hora_hasta)
+        return VistaLog(self.log, posiciones[elegidos])
+
+    @staticmethod
+    def _intervalo(minutos: np.ndarray, inicio: int | None, fin: int | None) -> slice:
+        # Posiciones de minutos (ordenado) que caen en [inicio, fin)
+        i = 0 if inicio is None else int(np.searchsorted(minutos, inicio, side='left'))
+        j = len(minutos) if fin is None else int(np.searchsorted(minutos, fin, side='left'))
+        return slice(i, max(i, j))
+
+def _a_minutos(instante: date | None) -> int | None:
+    # Minutos desde EPOCA de una fecha (a las 00:00) o de un datetime
+    if instante is None:
+        return None
+    minutos = (instante.toordinal() - EPOCA.toordinal()) * MINUTOS_DIA
+    if isinstance(instante, datetime):
+        minutos += instante.hour * 60 + instante.minute
+    return minutos
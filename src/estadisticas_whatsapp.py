@@ -0,0 +1,232 @@
+from array import array
+from typing import Iterable
+import numpy as np
+from analisis_whatsapp import Mensaje
+from columnar_whatsapp import EPOCA, MINUTOS_DIA, LogColumnar, VistaLog, columnas
+import perfil_whatsapp
+
+# Bordes (en minutos) de las clases del histograma: una por minuto durante la
+# primera hora, que es exacta porque los instantes del log van en minutos, y
+# después clases de anchura creciente hasta diez años (error relativo < 6 %)
+BORDES = np.concatenate([np.arange(60), np.geomspace(60, 10 * 365 * MINUTOS_DIA, 200)])
+# Mensajes que se procesan de una vez al recorrer un log
+TAM_BLOQUE = 1 << 16
+PERCENTILES = (50, 90, 99)
+
+class Distribucion:
+    '''
+    Estadísticas de una o varias series de valores, calculadas en streaming.
+
+    - n: array con el número de valores de cada serie.
+    - media: array con la media de cada serie.
+    - m2: array con la suma de los cuadrados de las desviaciones respecto a la media.
+    - histograma: matriz series x clases con los conteos de cada clase de BORDES.
+
+    La memoria no depende del número de valores. Los valores se añaden por bloques
+    y la media y la varianza de cada bloque se combinan con las acumuladas
+    (algoritmo de Chan), sin perder precisión con logs enormes. Los percentiles
+    son aproximados y se obtienen del histograma.
+    '''
+    def __init__(self, n_series: int = 1):
+        self.n = np.zeros(n_series, dtype=np.int64)
+        self.media = np.zeros(n_series)
+        self.m2 = np.zeros(n_series)
+        self.histograma = np.zeros((n_series, len(BORDES)), dtype=np.int64)
+
+    def añade(self, valores: np.ndarray, series: np.ndarray | None = None) -> None:
+        '''
+        Añade un bloque de valores.
+
+        :param valores: Valores a añadir
+        :type valores: np.ndarray
+        :param series: Serie a la que pertenece cada valor; si es None, todos a la serie 0
+        :type series: np.ndarray | None
+        '''
+        if len(valores) == 0:
+            return
+        if series is None:
+            series = np.zeros(len(valores), dtype=np.intp)
+        n_series = max(len(self.n), int(series.max()) + 1)
+        self._amplia(n_series)
+        valores = valores.astype(np.float64)
+
+        n_bloque = np.bincount(series, minlength=n_series)
+        con_valores = n_bloque > 0
+        media_bloque = np.zeros(n_series)
+        media_bloque[con_valores] = np.bincount(series, valores, n_series)[con_valores] / n_bloque[con_valores]
+        m2_bloque = np.bincount(series, (valores - media_bloque[series]) ** 2, n_series)
+
+        n_total = self.n + n_bloque
+        delta = media_bloque - self.media
+        with np.errstate(divide='ignore', invalid='ignore'):
+            peso = np.where(n_total > 0, n_bloque / n_total, 0)
+        self.m2 += m2_bloque + delta ** 2 * self.n * peso
+        self.media += delta * peso
+        self.n = n_total
+
+        clases = np.clip(np.searchsorted(BORDES, valores, side='right') - 1, 0, len(BORDES) - 1)
+        self.histograma += np.bincount(series * len(BORDES) + clases,
+                                       minlength=n_series * len(BORDES)).reshape(n_series, len(BORDES))
+
+    def _amplia(self, n_series: int) -> None:
+        faltan = n_series - len(self.n)
+        if faltan > 0:
+            self.n = np.concatenate([self.n, np.zeros(faltan, dtype=np.int64)])
+            self.media = np.concatenate([self.media, np.zeros(faltan)])
+            self.m2 = np.concatenate([self.m2, np.zeros(faltan)])
+            self.histograma = np.vstack([self.histograma, np.zeros((faltan, len(BORDES)), dtype=np.int64)])
+
+    def varianza(self, serie: int = 0) -> float:
+        '''
+        Devuelve la varianza muestral de una serie, o NaN si tiene menos de dos valores.
+        '''
+        if serie >= len(self.n) or self.n[serie] < 2:
+            return float('nan')
+        return float(self.m2[serie] / (self.n[serie] - 1))
+
+    def percentil(self, q: float, serie: int = 0) -> float:
+        '''
+        Devuelve un percentil aproximado de una serie, o NaN si no tiene valores.
+
+        :param q: Percentil, entre 0 y 100
+        :type q: float
+        :param serie: Serie, por defecto 0
+        :type serie: int
+        :return: Valor aproximado del percentil
+        :rtype: float
+
+        Dentro de una clase del histograma se interpola linealmente. Por debajo de
+        una hora el resultado es exacto.
+        '''
+        if serie >= len(self.n) or self.n[serie] == 0:
+            return float('nan')
+        acumulado = np.cumsum(self.histograma[serie])
+        objetivo = q / 100 * acumulado[-1]
+        clase = min(int(np.searchsorted(acumulado, objetivo, side='left')), len(BORDES) - 1)
+        if clase < 60:
+            return float(BORDES[clase])
+        anteriores = acumulado[clase - 1] if clase else 0
+        fraccion = (objetivo - anteriores) / max(acumulado[clase] - anteriores, 1)
+        fin = BORDES[clase + 1] if clase + 1 < len(BORDES) else BORDES[clase]
+        return float(BORDES[clase] + fraccion * (fin - BORDES[clase]))
+
+    def resumen(self, serie: int = 0, escala: float = 1 / 60) -> dict[str, float]:
+        '''
+        Devuelve las estadísticas de una serie como diccionario.
+
+        :param serie: Serie, por defecto 0
+        :type serie: int
+        :param escala: Factor por el que se multiplican los valores, por defecto 1/60 (de minutos a horas)
+        :type escala: float
+        :return: Diccionario con 'n', 'media', 'desviacion' y un percentil 'pNN' por cada uno de PERCENTILES
+        :rtype: dict[str, float]
+        '''
+        n = int(self.n[serie]) if serie < len(self.n) else 0
+        res = {'n': n,
+               'media': float(self.media[serie]) * escala if n else float('nan'),
+               'desviacion': self.varianza(serie) ** 0.5 * escala}
+        for q in PERCENTILES:
+            res[f'p{q}'] = self.percentil(q, serie) * escala
+        return res
+
+class EstadisticasTiempos:
+    '''
+    Distribución de los intervalos entre mensajes y de los tiempos de respuesta
+    de cada usuario, en minutos.
+
+    - nombres: lista de usuarios; la serie i de respuestas corresponde a nombres[i].
+    - huecos: distribución de los intervalos entre mensajes consecutivos.
+    - respuestas: distribución, para cada usuario, del tiempo que tarda en escribir
+      después de un mensaje de otro usuario.
+    '''
+    def __init__(self):
+        self.nombres = []
+        self._codigos = {}
+        self.huecos = Distribucion()
+        self.respuestas = Distribucion(0)
+        self._ultimo_minuto = None
+        self._ultimo_usuario = None
+
+    def añade(self, minutos: np.ndarray, usuarios: np.ndarray, nombres: list[str]) -> None:
+        '''
+        Añade un bloque de mensajes, posteriores a los ya añadidos.
+
+        :param minutos: Instante de cada mensaje, en minutos desde 1/1/1970
+        :type minutos: np.ndarray
+        :param usuarios: Código de usuario de cada mensaje
+        :type usuarios: np.ndarray
+        :param nombres: Nombres de usuario; el código i corresponde a nombres[i]
+        :type nombres: list[str]
+        '''
+        if len(minutos) == 0:
+            return
+        traduccion = np.array([self._codigos.setdefault(nombre, len(self._codigos)) for nombre in nombres],
+                              dtype=np.intp)
+        self.nombres = list(self._codigos)
+        usuarios = traduccion[usuarios]
+        if self._ultimo_minuto is not None:
+            minutos = np.concatenate([[self._ultimo_minuto], minutos])
+            usuarios = np.concatenate([[self._ultimo_usuario], usuarios])
+        huecos = np.diff(minutos)
+        self.huecos.añade(huecos)
+        respuesta = usuarios[1:] != usuarios[:-1]
+        self.respuestas.añade(huecos[respuesta], usuarios[1:][respuesta])
+        self.respuestas._amplia(len(self.nombres))
+        self._ultimo_minuto = int(minutos[-1])
+        self._ultimo_usuario = int(usuarios[-1])
+
+    def resumen_huecos(self) -> dict[str, float]:
+        '''
+        Devuelve las estadísticas de los intervalos entre mensajes, en horas.
+        '''
+        return self.huecos.resumen()
+
+    def resumen_respuestas(self) -> dict[str, dict[str, float]]:
+        '''
+        Devuelve las estadísticas del tiempo de respuesta de cada usuario, en horas.
+        '''
+        return {nombre: self.respuestas.resumen(i) for i, nombre in enumerate(self.nombres)}
+
+@perfil_whatsapp.perfilado('estadisticas_tiempos')
+def calcula_estadisticas_tiempos(log: 'Iterable[Mensaje] | LogColumnar | VistaLog',
+                                 tam_bloque: int = TAM_BLOQUE) -> EstadisticasTiempos:
+    '''
+    Calcula en una pasada la distribución de los intervalos entre mensajes y de los
+    tiempos de respuesta de todos los usuarios.
+
+    :param log: Lista o iterador de mensajes (por ejemplo, itera_log), log columnar o vista
+    :type log: Iterable[Mensaje] | LogColumnar | VistaLog
+    :param tam_bloque: Mensajes que se procesan de una vez, por defecto TAM_BLOQUE
+    :type tam_bloque: int
+    :return: Estadísticas de los tiempos del log
+    :rtype: EstadisticasTiempos
+
+    Con un iterador de mensajes la memoria usada no depende del tamaño del log:
+    sólo se guardan las columnas de un bloque cada vez. El tiempo de respuesta de
+    un mensaje es el intervalo desde el mensaje anterior, si lo escribió otro usuario.
+    '''
+    estadisticas = EstadisticasTiempos()
+    if isinstance(log, (LogColumnar, VistaLog)):
+        minutos, usuarios, nombres = columnas(log)
+        for inicio in range(0, len(minutos), tam_bloque):
+            estadisticas.añade(minutos[inicio:inicio + tam_bloque], usuarios[inicio:inicio + tam_bloque], nombres)
+        return estadisticas
+
+    minutos = array('q')
+    usuarios = array('i')
+    codigos = {}
+    dias = {}
+    for m in log:
+        dia = dias.get(m.fecha)
+        if dia is None:
+            dia = dias[m.fecha] = (m.fecha.toordinal() - EPOCA.toordinal()) * MINUTOS_DIA
+        minutos.append(dia + m.hora.hour * 60 + m.hora.minute)
+        usuarios.append(codigos.setdefault(m.usuario, len(codigos)))
+        if len(minutos) == tam_bloque:
+            estadisticas.añade(np.frombuffer(minutos, dtype=np.int64), np.frombuffer(usuarios, dtype=np.int32),
+                               list(codigos))
+            minutos = array('q')
+            usuarios = array('i')
+    estadisticas.añade(np.frombuffer(minutos, dtype=np.int64), np.frombuffer(usuarios, dtype=np.int32),
+                       list(codigos))
+    return estadisticas
@@ -1,42 +1,127 @@
-from wordcloud import WordCloud
 from analisis_whatsapp import *
-import matplotlib.pyplot as plt
+from agregados_whatsapp import AgregadoLog, agregado_de
+import perfil_whatsapp
 
-def muestra_word_cloud(log: list[Mensaje], usuario: str, max_words: int = 150) -> None:
+# matplotlib y wordcloud tardan en importarse, así que cada función los importa
+# cuando se usa por primera vez: cargar un log no debe pagar ese tiempo
+
+# Tamaño en píxeles de las word clouds y en pulgadas de los informes
+TAMAÑO_NUBE = (1800, 1400)
+TAMAÑO_INFORME = (10, 15)
+
+def muestra_word_cloud(log: list[Mensaje], usuario: str, max_words: int = 150, fichero: str | None = None) -> None:
     '''
     Muestra una word cloud (nube de palabras) para un usuario específico a partir de un log de mensajes.
 
-    :param log: Lista de mensajes
-    :type log: List[Mensaje]
+    :param log: Lista de mensajes, log columnar o índice de palabras
+    :type log: List[Mensaje] | LogColumnar | IndicePalabras
     :param usuario: Usuario específico para generar la word cloud
     :type usuario: str
     :param max_words: Número máximo de palabras a mostrar en la word cloud, por defecto 150
     :type max_words: int
+    :param fichero: Si no es None, la word cloud se guarda en este fichero en lugar de mostrarse
+    :type fichero: str | None
+    '''
+    # WordCloud sólo dibuja max_words palabras: no hace falta pasarle el resto
+    dicc_palabras_caracteristicas = genera_palabras_caracteristicas_usuario(log, usuario, max_palabras=max_words)
+    muestra_word_cloud_importancias(dicc_palabras_caracteristicas, max_words, fichero)
+
+def muestra_word_cloud_importancias(dicc_palabras_caracteristicas: dict[str, float], max_words: int = 150,
+                                    fichero: str | None = None) -> None:
+    '''
+    Muestra una word cloud a partir de la importancia de cada palabra, ya calculada.
+
+    :param dicc_palabras_caracteristicas: Diccionario de importancia de las palabras
+    :type dicc_palabras_caracteristicas: dict[str, float]
+    :param max_words: Número máximo de palabras a mostrar en la word cloud, por defecto 150
+    :type max_words: int
+    :param fichero: Si no es None, la word cloud se guarda en este fichero en lugar de mostrarse
+    :type fichero: str | None
     '''
-    dicc_palabras_caracteristicas = genera_palabras_caracteristicas_usuario(log, usuario)
-    wordcloud = WordCloud(
-                        font_path='data/seguiemj.ttf',                        
-                        background_color='white',
-                        width=1800,
-                        height=1400,
-                        normalize_plurals=False,
-                        max_words=max_words
-                        ).generate_from_frequencies(dicc_palabras_caracteristicas)
-    plt.imshow(wordcloud)
+    import matplotlib.pyplot as plt
+    plt.imshow(genera_word_cloud(dicc_palabras_caracteristicas, max_words))
     plt.axis('off')
-    plt.show()
+    muestra_o_guarda(fichero)
+
+@perfil_whatsapp.perfilado('word_cloud')
+def genera_word_cloud(dicc_palabras_caracteristicas: dict[str, float], max_words: int = 150,
+                      tamaño: tuple[int, int] = TAMAÑO_NUBE) -> 'WordCloud':
+    '''
+    Genera una word cloud sin dibujarla.
+
+    :param dicc_palabras_caracteristicas: Diccionario de importancia de las palabras
+    :type dicc_palabras_caracteristicas: dict[str, float]
+    :param max_words: Número máximo de palabras de la word cloud, por defecto 150
+    :type max_words: int
+    :param tamaño: Ancho y alto en píxeles, por defecto TAMAÑO_NUBE
+    :type tamaño: tuple[int, int]
+    :return: Word cloud, que puede dibujarse con imshow o convertirse en imagen con to_image
+    :rtype: WordCloud
+
+    No usa pyplot, así que puede llamarse desde cualquier hilo.
+    '''
+    from wordcloud import WordCloud
+    return WordCloud(
+                    font_path='data/seguiemj.ttf',                        
+                    background_color='white',
+                    width=tamaño[0],
+                    height=tamaño[1],
+                    normalize_plurals=False,
+                    max_words=max_words
+                    ).generate_from_frequencies(dicc_palabras_caracteristicas)
+
+def muestra_o_guarda(fichero: str | None = None) -> None:
+    '''
+    Muestra la figura actual o, si se indica un fichero, la guarda en él y la cierra.
+
+    :param fichero: Fichero de imagen; el formato (png, svg...) se deduce de la extensión
+    :type fichero: str | None
+
+    Guardar en fichero no necesita pantalla, así que sirve con el backend Agg de
+    matplotlib en un servidor.
+    '''
+    import matplotlib.pyplot as plt
+    if fichero is None:
+        plt.show()
+    else:
+        with perfil_whatsapp.etapa('guarda_figura'):
+            plt.savefig(fichero)
+        plt.close(plt.gcf())
 
 def grafica_mensajes_por_meses(ax, log):
-    mensajes_por_meses = cuenta_mensajes_por_meses(log)
+    grafica_linea_temporal(ax, cuenta_mensajes_por_meses(log))
+
+def grafica_linea_temporal(ax, mensajes_por_meses: dict[str, int], titulo: str = 'Evolución mensajes por meses'):
+    ax.set_title(titulo)
+    ax.grid(True)
+    if not mensajes_por_meses:
+        # Sin meses (un log vacío) se deja el eje vacío
+        return
     meses, num_mensajes_por_meses = zip(*mensajes_por_meses.items())
     ax.plot(meses, num_mensajes_por_meses, marker='o', color='b', linestyle='-', linewidth=2, markersize=6)
         
     step = max(1, len(meses) // 10)
     ax.set_xticks(meses[::step])
     ax.set_xticklabels(meses[::step], rotation=60, fontsize=10)
-    
-    ax.set_title('Evolución mensajes por meses')
-    ax.grid(True)
+
+def muestra_linea_temporal(mensajes_por_meses: dict[str, int], titulo: str = 'Evolución mensajes por meses',
+                           fichero: str | None = None) -> None:
+    '''
+    Muestra la evolución por meses de unos conteos, como la gráfica de meses del informe.
+
+    :param mensajes_por_meses: Conteo de cada mes, con claves "mes/año" (por ejemplo,
+        IndiceInvertido.linea_temporal de busqueda_whatsapp)
+    :type mensajes_por_meses: dict[str, int]
+    :param titulo: Título de la gráfica, por defecto 'Evolución mensajes por meses'
+    :type titulo: str
+    :param fichero: Si no es None, la gráfica se guarda en este fichero en lugar de mostrarse
+    :type fichero: str | None
+    '''
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(10, 5))
+    grafica_linea_temporal(ax, mensajes_por_meses, titulo)
+    fig.tight_layout()
+    muestra_o_guarda(fichero)
 
 def grafica_mensajes_por_dia_semana(ax, log):
     mensajes_por_dia = cuenta_mensajes_por_dia_semana(log)
@@ -54,7 +139,9 @@ def grafica_mensajes_por_momento_del_dia(ax, log):
     ax.set_title('Mensajes por momento del día')
     ax.grid(True, axis='y')
 
-def genera_informe(log: list[Mensaje], titulo: str = "Informe", usuario: str | None = None) -> None:
+@perfil_whatsapp.perfilado('genera_informe')
+def genera_informe(log: list[Mensaje], titulo: str = "Informe", usuario: str | None = None,
+                   fichero: str | None = None) -> None:
     '''
     Muestra un conjunto de gráficas, incluyendo:
      - La evolución del número de mensajes mensualmente.
@@ -64,22 +151,48 @@ def genera_informe(log: list[Mensaje], titulo: str = "Informe", usuario: str | N
     Si el parámetro usuario no es None, sólo se usarán los mensajes del usuario indicado 
     para generar el informe.
 
-    :param log: Lista de mensajes
-    :type log: List[Mensaje]
+    Todas las gráficas se obtienen de un único AgregadoLog. Si se recibe uno ya
+    calculado, el informe de cualquier usuario no vuelve a recorrer el log.
+
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: List[Mensaje] | LogColumnar | AgregadoLog
     :param titulo: Título del informe, por defecto "Informe"
     :type titulo: str
     :param usuario: Usuario específico para filtrar los mensajes, por defecto None
     :type usuario: Optional[str]
+    :param fichero: Si no es None, el informe se guarda en este fichero en lugar de mostrarse
+    :type fichero: Optional[str]
     '''    
+    import matplotlib.pyplot as plt
+    dibuja_informe(plt.figure(figsize=TAMAÑO_INFORME), log, titulo, usuario)
+    muestra_o_guarda(fichero)
+
+@perfil_whatsapp.perfilado('dibuja_informe')
+def dibuja_informe(fig, log: list[Mensaje], titulo: str = "Informe", usuario: str | None = None) -> None:
+    '''
+    Dibuja en una figura vacía las gráficas de genera_informe.
+
+    :param fig: Figura de matplotlib
+    :type fig: matplotlib.figure.Figure
+    :param log: Lista de mensajes, log columnar o agregado
+    :type log: List[Mensaje] | LogColumnar | AgregadoLog
+    :param titulo: Título del informe, por defecto "Informe"
+    :type titulo: str
+    :param usuario: Usuario específico para filtrar los mensajes, por defecto None
+    :type usuario: Optional[str]
+
+    Si la figura no se ha creado con pyplot (por ejemplo, matplotlib.figure.Figure
+    con un FigureCanvasAgg), puede dibujarse desde cualquier hilo.
+    '''
+    log = agregado_de(log)
     if usuario != None:
-        log = [m for m in log if m.usuario == usuario]
+        log = log.filtra(usuario)
 
-    fig, axs = plt.subplots(3, figsize=(10, 15))
+    axs = fig.subplots(3)
     fig.suptitle(titulo+f"\nMedia de horas entre mensajes: {calcula_media_horas_entre_mensajes(log):.2f}", fontsize=16)       
     
     grafica_mensajes_por_meses(axs[0], log)
     grafica_mensajes_por_dia_semana(axs[1], log)
     grafica_mensajes_por_momento_del_dia(axs[2], log)
 
-    plt.tight_layout(rect=[0, 0, 1, 0.96])    
-    plt.show()
\ No newline at end of file
+    fig.tight_layout(rect=[0, 0, 1, 0.96])
\ No newline at end of file
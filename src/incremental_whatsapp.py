@@ -0,0 +1,145 @@
+from collections import Counter
+from itertools import islice
+from typing import Iterator, NamedTuple
+import hashlib
+import io
+import json
+import os as so
+from analisis_whatsapp import (LINEAS_DETECCION, SO, Mensaje, abre_log, cuenta_palabras_por_usuario,
+                               detecta_so, itera_log, parsea_lineas, tipo_contenedor)
+from agregados_whatsapp import AgregadoLog
+from cache_whatsapp import ruta_cache
+from columnar_whatsapp import columnas
+
+VERSION_ESTADO = 2
+EXTENSION_ESTADO = '.teoestado'
+# Bytes que se leen de una vez al resumir la parte ya analizada
+TAM_BLOQUE = 1 << 20
+
+EstadoAnalisis = NamedTuple('EstadoAnalisis', [('os', str), ('offset', int), ('huella_prefijo', str),
+                                               ('ultimo_minuto', int), ('agregado', AgregadoLog),
+                                               ('palabras', dict[str, Counter])])
+
+def huella_prefijo(fichero: str, offset: int) -> str:
+    '''
+    Calcula un resumen de los primeros offset bytes de un fichero.
+
+    :param fichero: Nombre del fichero
+    :type fichero: str
+    :param offset: Número de bytes que se resumen
+    :type offset: int
+    :return: Resumen en hexadecimal
+    :rtype: str
+
+    Se resume todo el prefijo, en una pasada como hash_contenido: un export que
+    añade mensajes al final lo conserva, y uno que recorta o reescribe el
+    historial, aunque sea en medio y sin cambiar de longitud, no.
+    '''
+    resumen = hashlib.blake2b(str(offset).encode('ascii'), digest_size=16)
+    with open(fichero, 'rb') as f:
+        pendientes = offset
+        while pendientes > 0 and (bloque := f.read(min(TAM_BLOQUE, pendientes))):
+            resumen.update(bloque)
+            pendientes -= len(bloque)
+    return resumen.hexdigest()
+
+def analiza_log_incremental(fichero: str, os: str = SO, directorio: str | None = None) -> EstadoAnalisis:
+    '''
+    Analiza un log de Whatsapp reutilizando el análisis guardado de una versión
+    anterior del mismo export.
+
+    :param fichero: Nombre del fichero del que se quieren leer los datos
+    :type fichero: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param directorio: Directorio donde guardar el estado; si es None, se guarda junto al log
+    :type directorio: str | None
+    :return: Estado con el agregado y los conteos de palabras de todo el log
+    :rtype: EstadoAnalisis
+
+    Si el fichero es el analizado la última vez con mensajes añadidos al final,
+    sólo se parsean los bytes nuevos y sus estadísticas se suman a las guardadas.
+    Si el fichero ha cambiado de cualquier otra forma, o los mensajes nuevos son
+    anteriores al último analizado, se analiza el log completo.
+    El estado se guarda en un fichero JSON junto al log para la próxima ejecución.
+    Un log comprimido (véase abre_log) sólo se reutiliza si no ha cambiado; si no,
+    se analiza completo, porque al añadir mensajes cambian también los bytes
+    comprimidos de los anteriores.
+    '''
+    ruta = ruta_cache(fichero, directorio, EXTENSION_ESTADO)
+    tamaño = so.path.getsize(fichero)
+    estado = lee_estado(ruta)
+    if estado is not None and os in ('auto', estado.os) and estado.offset <= tamaño \
+            and huella_prefijo(fichero, estado.offset) == estado.huella_prefijo:
+        if estado.offset == tamaño:
+            return estado
+        if tipo_contenedor(fichero) is None:
+            nuevos = list(_mensajes_desde(fichero, estado.offset, estado.os))
+            minutos, _, _ = columnas(nuevos)
+            if len(minutos) == 0 or minutos[0] >= estado.ultimo_minuto:
+                estado = _amplia(estado, nuevos, fichero, tamaño)
+                _guarda_si_se_puede(ruta, estado)
+                return estado
+
+    if os == 'auto':
+        with abre_log(fichero) as (f, _):
+            os = detecta_so(islice(f, LINEAS_DETECCION))
+    vacio = EstadoAnalisis(os, 0, '', 0, AgregadoLog.vacio([]), {})
+    estado = _amplia(vacio, list(itera_log(fichero, os)), fichero, tamaño)
+    _guarda_si_se_puede(ruta, estado)
+    return estado
+
+def _mensajes_desde(fichero: str, offset: int, os: str) -> Iterator[Mensaje]:
+    with open(fichero, 'rb') as f:
+        f.seek(offset)
+        yield from parsea_lineas(io.TextIOWrapper(f, encoding='utf-8-sig' if offset == 0 else 'utf8'), os)
+
+def _amplia(estado: EstadoAnalisis, nuevos: list[Mensaje], fichero: str, tamaño: int) -> EstadoAnalisis:
+    minutos, _, _ = columnas(nuevos)
+    palabras = {usuario: Counter(conteo) for usuario, conteo in estado.palabras.items()}
+    for usuario, conteo in cuenta_palabras_por_usuario(nuevos).items():
+        palabras.setdefault(usuario, Counter()).update(conteo)
+    return EstadoAnalisis(estado.os, tamaño, huella_prefijo(fichero, tamaño),
+                          int(minutos[-1]) if len(minutos) else estado.ultimo_minuto,
+                          estado.agregado.combina(AgregadoLog.desde_log(nuevos)), palabras)
+
+def lee_estado(ruta: str) -> EstadoAnalisis | None:
+    '''
+    Lee un estado de análisis guardado.
+
+    :param ruta: Ruta del fichero de estado
+    :type ruta: str
+    :return: Estado leído, o None si no existe, no es legible o es de otra versión
+    :rtype: EstadoAnalisis | None
+    '''
+    try:
+        with open(ruta, encoding='utf8') as f:
+            datos = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if datos.get('version') != VERSION_ESTADO:
+        return None
+    return EstadoAnalisis(datos['os'], datos['offset'], datos['huella_prefijo'], datos['ultimo_minuto'],
+                          AgregadoLog.desde_dict(datos['agregado']),
+                          {usuario: Counter(conteo) for usuario, conteo in datos['palabras'].items()})
+
+def guarda_estado(ruta: str, estado: EstadoAnalisis) -> None:
+    '''
+    Guarda un estado de análisis en formato JSON.
+
+    :param ruta: Ruta del fichero de estado
+    :type ruta: str
+    :param estado: Estado a guardar
+    :type estado: EstadoAnalisis
+    '''
+    datos = dict(estado._asdict(), version=VERSION_ESTADO, agregado=estado.agregado.a_dict())
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf8') as f:
+        json.dump(datos, f, ensure_ascii=False)
+    so.replace(temporal, ruta)
+
+def _guarda_si_se_puede(ruta: str, estado: EstadoAnalisis) -> None:
+    try:
+        guarda_estado(ruta, estado)
+    except OSError:
+        pass
@@ -0,0 +1,228 @@
+import matplotlib
+matplotlib.use('Agg') # Sin pantalla: las gráficas sólo se guardan en ficheros
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from time import perf_counter
+import csv
+import json
+import math
+import os as so
+import re
+from analisis_whatsapp import SO
+from agregados_whatsapp import AgregadoLog
+from columnar_whatsapp import carga_log_columnar
+from estadisticas_whatsapp import calcula_estadisticas_tiempos
+from graficas_whatsapp import genera_informe, muestra_word_cloud_importancias
+from palabras_whatsapp import IndicePalabras
+
+# Palabras características que se guardan (y se dibujan) por usuario
+MAX_PALABRAS = 150
+# Caracteres que no pueden aparecer en un nombre de fichero
+CARACTERES_NO_VALIDOS_RE = re.compile(r'[\\/:*?"<>|]')
+# Ficheros que se analizan por defecto: exports de texto, el .zip que genera
+# Whatsapp y exports comprimidos, que se leen sin descomprimirlos en disco
+PATRONES_EXPORT = ('*.txt', '*.zip', '*.gz', '*.xz', '*.bz2')
+EXTENSIONES_COMPRESION = ('.zip', '.gz', '.xz', '.bz2')
+CAMPOS_CSV = ['chat', 'usuario', 'mensajes', 'media_horas_respuesta', 'p50_horas_respuesta',
+              'p90_horas_respuesta', 'palabras']
+
+def analiza_export(fichero: str, salida: str, os: str = SO, formatos: tuple[str, ...] = ('png',),
+                   informes_usuario: bool = False, nubes: bool = False, chat: str | None = None) -> dict:
+    '''
+    Analiza un export de Whatsapp y guarda sus estadísticas y sus informes.
+
+    :param fichero: Nombre del fichero del export
+    :type fichero: str
+    :param salida: Directorio donde se escriben los resultados
+    :type salida: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param formatos: Formatos de imagen de los informes, por defecto ('png',)
+    :type formatos: tuple[str, ...]
+    :param informes_usuario: Si es True se genera también el informe de cada usuario, por defecto False
+    :type informes_usuario: bool
+    :param nubes: Si es True se genera la nube de palabras de cada usuario, por defecto False
+    :type nubes: bool
+    :param chat: Nombre del chat en los resultados; si es None, nombre_chat(fichero)
+    :type chat: str | None
+    :return: Estadísticas del chat, las mismas que se guardan en <chat>.json
+    :rtype: dict
+
+    Se escriben <chat>.json y, para cada formato, informe_<chat>.<formato> (y, si se
+    piden, informe_<chat>_<usuario>.<formato> y nube_<chat>_<usuario>.<formato>),
+    donde <chat> es, por defecto, el nombre del fichero sin extensiones (nombre_chat).
+    '''
+    inicio = perf_counter()
+    chat = nombre_chat(fichero) if chat is None else chat
+    log = carga_log_columnar(fichero, os)
+    agregado = AgregadoLog.desde_log(log)
+    indice = IndicePalabras.desde_log(log)
+    tiempos = calcula_estadisticas_tiempos(log)
+    palabras = indice.palabras_caracteristicas_todos(max_palabras=MAX_PALABRAS)
+    respuestas = tiempos.resumen_respuestas()
+
+    estadisticas = {
+        'chat': chat,
+        'fichero': so.path.abspath(fichero),
+        'mensajes': len(log),
+        'usuarios': agregado.usuarios(),
+        'mensajes_por_usuario': agregado.mensajes_por_usuario(),
+        'mensajes_por_meses': agregado.mensajes_por_meses(),
+        'mensajes_por_dia_semana': agregado.mensajes_por_dia_semana(),
+        'mensajes_por_momento_del_dia': agregado.mensajes_por_momento_del_dia(),
+        'media_horas_entre_mensajes': agregado.media_horas_entre_mensajes(),
+        'horas_entre_mensajes': tiempos.resumen_huecos(),
+        'horas_respuesta': respuestas,
+        'palabras_por_usuario': {usuario: int(n) for usuario, n in zip(indice.nombres, indice.totales_usuario)},
+        'palabras_caracteristicas': palabras,
+    }
+    with open(so.path.join(salida, chat + '.json'), 'w', encoding='utf8') as f:
+        json.dump(_sin_nan(estadisticas), f, ensure_ascii=False, indent=2)
+
+    for formato in formatos:
+        genera_informe(agregado, titulo=f"Informe {chat}",
+                       fichero=so.path.join(salida, f'informe_{chat}.{formato}'))
+        for usuario in agregado.usuarios():
+            nombre = CARACTERES_NO_VALIDOS_RE.sub('_', usuario)
+            if informes_usuario:
+                genera_informe(agregado, titulo=f"Informe {chat}: {usuario}", usuario=usuario,
+                               fichero=so.path.join(salida, f'informe_{chat}_{nombre}.{formato}'))
+            if nubes and palabras.get(usuario):
+                muestra_word_cloud_importancias(palabras[usuario], MAX_PALABRAS,
+                                                so.path.join(salida, f'nube_{chat}_{nombre}.{formato}'))
+
+    estadisticas['segundos'] = perf_counter() - inicio
+    return estadisticas
+
+def nombre_chat(fichero: str) -> str:
+    '''
+    Devuelve el nombre de un chat a partir del nombre de su fichero, sin la
+    extensión de compresión ni la del texto (por ejemplo, 'familia.txt.gz' -> 'familia').
+    '''
+    nombre = so.path.basename(fichero)
+    base, extension = so.path.splitext(nombre)
+    if extension.lower() in EXTENSIONES_COMPRESION:
+        nombre = base
+    base, extension = so.path.splitext(nombre)
+    return base if extension.lower() == '.txt' else nombre
+
+def nombres_chats(ficheros: list[str]) -> dict[str, str]:
+    '''
+    Asigna a cada fichero un nombre de chat distinto.
+
+    :param ficheros: Nombres de los ficheros de los exports, de un mismo directorio
+    :type ficheros: list[str]
+    :return: Diccionario que asocia a cada fichero el nombre de su chat
+    :rtype: dict[str, str]
+
+    Se usa nombre_chat, salvo cuando varios ficheros darían el mismo nombre (por
+    ejemplo, 'familia.txt' y 'familia.zip'): entonces cada uno usa su nombre de
+    fichero completo, para que sus resultados no se sobrescriban.
+    '''
+    nombres = {fichero: nombre_chat(fichero) for fichero in ficheros}
+    repetidos = Counter(nombres.values())
+    return {fichero: nombre if repetidos[nombre] == 1 else so.path.basename(fichero)
+            for fichero, nombre in nombres.items()}
+
+def _sin_nan(valor):
+    # JSON estándar no admite NaN: se escribe null
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    if isinstance(valor, dict):
+        return {clave: _sin_nan(v) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [_sin_nan(v) for v in valor]
+    return valor
+
+def filas_csv(estadisticas: dict) -> list[dict]:
+    '''
+    Devuelve las filas del resumen CSV de un chat, una por usuario.
+
+    :param estadisticas: Estadísticas devueltas por analiza_export
+    :type estadisticas: dict
+    :return: Lista de diccionarios con las claves de CAMPOS_CSV
+    :rtype: list[dict]
+    '''
+    filas = []
+    for usuario in estadisticas['usuarios']:
+        respuesta = estadisticas['horas_respuesta'].get(usuario, {})
+        filas.append({'chat': estadisticas['chat'], 'usuario': usuario,
+                      'mensajes': estadisticas['mensajes_por_usuario'][usuario],
+                      'media_horas_respuesta': respuesta.get('media'),
+                      'p50_horas_respuesta': respuesta.get('p50'),
+                      'p90_horas_respuesta': respuesta.get('p90'),
+                      'palabras': estadisticas['palabras_por_usuario'].get(usuario, 0)})
+    return filas
+
+def procesa_directorio(directorio: str, salida: str, patrones: tuple[str, ...] = PATRONES_EXPORT,
+                       procesos: int | None = None, **opciones) -> list[dict]:
+    '''
+    Analiza en paralelo todos los exports de un directorio.
+
+    :param directorio: Directorio con los exports
+    :type directorio: str
+    :param salida: Directorio donde se escriben los resultados; se crea si no existe
+    :type salida: str
+    :param patrones: Patrones de los nombres de fichero a analizar, por defecto PATRONES_EXPORT
+    :type patrones: tuple[str, ...]
+    :param procesos: Número de procesos; si es None, tantos como núcleos
+    :type procesos: int | None
+    :param opciones: Resto de parámetros de analiza_export (os, formatos, informes_usuario, nubes)
+    :return: Estadísticas de cada chat analizado correctamente
+    :rtype: list[dict]
+
+    Cada export se analiza en un proceso distinto del pool. Además de los ficheros
+    de cada chat, se escribe resumen.csv con una fila por chat y usuario. Los
+    nombres de los chats se asignan con nombres_chats. Un export que no puede
+    analizarse se informa y no interrumpe el resto.
+    '''
+    so.makedirs(salida, exist_ok=True)
+    ficheros = sorted({fichero for patron in patrones for fichero in glob(so.path.join(directorio, patron))})
+    # Los ficheros más grandes primero, para que no queden para el final en un solo proceso
+    ficheros.sort(key=so.path.getsize, reverse=True)
+    chats = nombres_chats(ficheros)
+    resultados = []
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        futuros = {ejecutor.submit(analiza_export, fichero, salida, chat=chats[fichero], **opciones): fichero for fichero in ficheros}
+        for futuro in as_completed(futuros):
+            try:
+                estadisticas = futuro.result()
+            except Exception as e:
+                print(f"{futuros[futuro]}: error, {e}")
+                continue
+            print(f"{estadisticas['chat']}: {estadisticas['mensajes']} mensajes en {estadisticas['segundos']:.2f} s")
+            resultados.append(estadisticas)
+
+    resultados.sort(key=lambda estadisticas: estadisticas['chat'])
+    with open(so.path.join(salida, 'resumen.csv'), 'w', encoding='utf8', newline='') as f:
+        escritor = csv.DictWriter(f, CAMPOS_CSV)
+        escritor.writeheader()
+        for estadisticas in resultados:
+            escritor.writerows(_sin_nan(filas_csv(estadisticas)))
+    return resultados
+
+if __name__ == '__main__':
+    # Ejemplo: python src/lote_whatsapp.py exports/ resultados/ --formatos png svg --procesos 8
+    import argparse
+    parser = argparse.ArgumentParser(description='Analiza en lote un directorio de exports de Whatsapp')
+    parser.add_argument('directorio', help='directorio con los exports')
+    parser.add_argument('salida', help='directorio donde escribir los resultados')
+    parser.add_argument('--patrones', nargs='+', default=list(PATRONES_EXPORT),
+                        help='patrones de los ficheros a analizar')
+    parser.add_argument('--procesos', type=int, help='número de procesos; por defecto, tantos como núcleos')
+    parser.add_argument('--os', choices=['auto', 'android', 'ios'], default=SO)
+    parser.add_argument('--formatos', nargs='+', default=['png'], help='formatos de imagen (png, svg...)')
+    parser.add_argument('--informes-usuario', action='store_true', help='genera un informe por usuario')
+    parser.add_argument('--nubes', action='store_true', help='genera una nube de palabras por usuario')
+    args = parser.parse_args()
+
+    inicio = perf_counter()
+    resultados = procesa_directorio(args.directorio, args.salida, tuple(args.patrones), args.procesos, os=args.os,
+                                    formatos=tuple(args.formatos), informes_usuario=args.informes_usuario,
+                                    nubes=args.nubes)
+    segundos = perf_counter() - inicio
+    procesos = args.procesos or so.cpu_count() or 1
+    mensajes = sum(estadisticas['mensajes'] for estadisticas in resultados)
+    print(f"{len(resultados)} chats, {mensajes} mensajes en {segundos:.1f} s "
+          f"({mensajes / segundos / procesos:.0f} mensajes por segundo y núcleo)")
@@ -0,0 +1,228 @@
+from collections import Counter
+import numpy as np
+from analisis_whatsapp import Mensaje, cuenta_palabras_por_usuario
+from columnar_whatsapp import LogColumnar
+import perfil_whatsapp
+
+# Valor que se usa como conteo del resto cuando una palabra sólo la usa el usuario
+CONTEO_MINIMO_RESTO = 0.00000001
+
+class IndicePalabras:
+    '''
+    Conteos de palabras de un log de Whatsapp para todos los usuarios a la vez.
+
+    - vocabulario: lista de palabras; la palabra j es vocabulario[j].
+    - ids: diccionario que asocia a cada palabra su posición en vocabulario.
+    - nombres: lista de usuarios; el usuario i es nombres[i].
+    - indptr, indices, datos: conteos de cada usuario en formato CSR. Las palabras
+      que usó el usuario i son indices[indptr[i]:indptr[i + 1]], en orden, y las
+      veces que usó cada una, datos[indptr[i]:indptr[i + 1]].
+    - totales: array con las veces que se usó cada palabra en todo el log.
+    - totales_usuario: array con el número de palabras de cada usuario.
+
+    El log se tokeniza una sola vez. Sólo se guardan las palabras que usa cada
+    usuario, así que la memoria no crece con usuarios x vocabulario. Los conteos
+    del resto para las palabras de un usuario son totales[indices] - datos, sin
+    volver a recorrer los textos.
+    '''
+    def __init__(self, vocabulario: list[str], nombres: list[str], indptr: np.ndarray, indices: np.ndarray,
+                 datos: np.ndarray):
+        self.vocabulario = vocabulario
+        self.ids = {palabra: j for j, palabra in enumerate(vocabulario)}
+        self.nombres = nombres
+        self.indptr = indptr
+        self.indices = indices
+        self.datos = datos
+        self.totales = np.zeros(len(vocabulario), dtype=np.int64)
+        np.add.at(self.totales, indices, datos)
+        acumulados = np.concatenate([[0], np.cumsum(datos)])
+        self.totales_usuario = acumulados[indptr[1:]] - acumulados[indptr[:-1]]
+
+    @classmethod
+    def desde_log(cls, log: 'list[Mensaje] | LogColumnar', minusculas: bool = False,
+                  sin_tildes: bool = False) -> 'IndicePalabras':
+        '''
+        Construye el índice de palabras de un log.
+
+        :param log: Lista de mensajes o log columnar
+        :type log: list[Mensaje] | LogColumnar
+        :param minusculas: Si es True las palabras se pasan a minúsculas, por defecto False
+        :type minusculas: bool
+        :param sin_tildes: Si es True se quitan las tildes, por defecto False
+        :type sin_tildes: bool
+        :return: Índice con los conteos de todos los usuarios
+        :rtype: IndicePalabras
+
+        Las palabras se obtienen igual que en genera_conteos_palabras_usuario_y_resto.
+        '''
+        return cls.desde_conteos(cuenta_palabras_por_usuario(log, minusculas, sin_tildes))
+
+    @classmethod
+    @perfil_whatsapp.perfilado('indice_palabras')
+    def desde_conteos(cls, palabras: dict[str, Counter]) -> 'IndicePalabras':
+        '''
+        Construye el índice a partir de los conteos de palabras de cada usuario,
+        como los que devuelve cuenta_palabras_por_usuario.
+
+        :param palabras: Diccionario que asocia a cada usuario el conteo de sus palabras
+        :type palabras: dict[str, Counter]
+        :return: Índice con los conteos de todos los usuarios
+        :rtype: IndicePalabras
+        '''
+        ids = {}
+        por_usuario = {usuario: {ids.setdefault(palabra, len(ids)): n for palabra, n in conteo.items()}
+                       for usuario, conteo in palabras.items()}
+        return cls._desde_ids(list(ids), por_usuario)
+
+    @classmethod
+    def _desde_ids(cls, vocabulario: list[str], por_usuario: dict[str, dict[int, int]]) -> 'IndicePalabras':
+        indices = []
+        datos = []
+        for conteo in por_usuario.values():
+            palabras = np.fromiter(conteo.keys(), dtype=np.int64, count=len(conteo))
+            veces = np.fromiter(conteo.values(), dtype=np.int64, count=len(conteo))
+            orden = np.argsort(palabras)
+            indices.append(palabras[orden])
+            datos.append(veces[orden])
+        indptr = np.concatenate([[0], np.cumsum([len(fila) for fila in indices], dtype=np.int64)])
+        return cls(vocabulario, list(por_usuario), indptr,
+                   np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+                   np.concatenate(datos) if datos else np.zeros(0, dtype=np.int64))
+
+    def _tramo(self, usuario: str) -> slice:
+        # Posiciones en indices y datos de las palabras de un usuario; vacío si no está en el log
+        if usuario not in self.nombres:
+            return slice(0, 0)
+        i = self.nombres.index(usuario)
+        return slice(int(self.indptr[i]), int(self.indptr[i + 1]))
+
+    def fila(self, usuario: str) -> np.ndarray:
+        '''
+        Devuelve los conteos de las palabras de un usuario.
+
+        :param usuario: Usuario
+        :type usuario: str
+        :return: Array con las veces que el usuario usó cada palabra del vocabulario
+        :rtype: np.ndarray
+        '''
+        tramo = self._tramo(usuario)
+        res = np.zeros(len(self.vocabulario), dtype=np.int64)
+        res[self.indices[tramo]] = self.datos[tramo]
+        return res
+
+    def conteos_usuario_y_resto(self, usuario: str) -> tuple[Counter, Counter]:
+        '''
+        Devuelve el conteo de las palabras usadas por un usuario y el de las usadas
+        por el resto de usuarios.
+
+        :param usuario: Usuario
+        :type usuario: str
+        :return: Tupla con el conteo del usuario y el del resto
+        :rtype: tuple[Counter, Counter]
+        '''
+        tramo = self._tramo(usuario)
+        resto = self.totales.copy()
+        resto[self.indices[tramo]] -= self.datos[tramo]
+        vocabulario = self.vocabulario
+        propios = Counter({vocabulario[j]: n for j, n in zip(self.indices[tramo].tolist(),
+                                                             self.datos[tramo].tolist())})
+        usadas = np.flatnonzero(resto)
+        return propios, Counter({vocabulario[j]: n for j, n in zip(usadas.tolist(), resto[usadas].tolist())})
+
+    def palabras_caracteristicas(self, usuario: str, umbral: int = 2,
+                                 max_palabras: int | None = None) -> dict[str, float]:
+        '''
+        Calcula la importancia de las palabras usadas por un usuario.
+
+        :param usuario: Usuario
+        :type usuario: str
+        :param umbral: Frecuencia mínima para tener en cuenta una palabra, por defecto 2
+        :type umbral: int
+        :param max_palabras: Si no es None, sólo se devuelven las max_palabras más importantes
+        :type max_palabras: int | None
+        :return: Diccionario de importancia de las palabras del usuario
+        :rtype: dict[str, float]
+
+        Sólo recorre las palabras que usó el usuario, no el vocabulario ni los mensajes del log.
+        '''
+        tramo = self._tramo(usuario)
+        propios = self.datos[tramo]
+        total_usuario = int(propios.sum())
+        importancia = _importancia(propios, self.totales[self.indices[tramo]] - propios, total_usuario,
+                                   int(self.totales.sum()) - total_usuario, umbral)
+        return self._diccionario(self.indices[tramo], importancia, max_palabras)
+
+    def importancias(self, umbral: int = 2) -> np.ndarray:
+        '''
+        Calcula la importancia de cada palabra usada por cada usuario.
+
+        :param umbral: Frecuencia mínima para tener en cuenta una palabra, por defecto 2
+        :type umbral: int
+        :return: Array alineado con indices y datos (la importancia de la palabra
+            indices[k] para su usuario es la posición k); NaN en las palabras que el
+            usuario usó menos de umbral veces
+        :rtype: np.ndarray
+        '''
+        total_usuario = np.repeat(self.totales_usuario, np.diff(self.indptr))
+        return _importancia(self.datos, self.totales[self.indices] - self.datos, total_usuario,
+                            int(self.totales_usuario.sum()) - total_usuario, umbral)
+
+    @perfil_whatsapp.perfilado('palabras_caracteristicas')
+    def palabras_caracteristicas_todos(self, umbral: int = 2,
+                                       max_palabras: int | None = None) -> dict[str, dict[str, float]]:
+        '''
+        Calcula a la vez las palabras características de todos los usuarios.
+
+        :param umbral: Frecuencia mínima para tener en cuenta una palabra, por defecto 2
+        :type umbral: int
+        :param max_palabras: Si no es None, sólo se devuelven las max_palabras más importantes
+            de cada usuario
+        :type max_palabras: int | None
+        :return: Diccionario que asocia a cada usuario la importancia de sus palabras
+        :rtype: dict[str, dict[str, float]]
+
+        Las importancias se calculan de una vez para las palabras que usó cada usuario
+        (no para todo el vocabulario), y las max_palabras mejores de cada usuario se
+        eligen entre las suyas con una selección parcial (argpartition), sin ordenarlas todas.
+        '''
+        importancia = self.importancias(umbral)
+        indptr = self.indptr.tolist()
+        return {nombre: self._diccionario(self.indices[inicio:fin], importancia[inicio:fin], max_palabras)
+                for nombre, inicio, fin in zip(self.nombres, indptr[:-1], indptr[1:])}
+
+    def _diccionario(self, palabras: np.ndarray, importancia: np.ndarray, max_palabras: int | None) -> dict[str, float]:
+        # Diccionario de las palabras con importancia; con max_palabras, sólo las
+        # mejores y ordenado de mayor a menor importancia (a igualdad, por palabra)
+        validas = np.flatnonzero(~np.isnan(importancia))
+        if max_palabras is not None:
+            k = max(max_palabras, 0)
+            if k < len(validas):
+                # argpartition da la k-ésima importancia; se conservan todas las que la
+                # igualan para que el desempate no dependa de la selección parcial
+                corte = importancia[validas][np.argpartition(-importancia[validas], k - 1)[k - 1]] if k else np.inf
+                validas = validas[importancia[validas] >= corte]
+            validas = validas[np.lexsort((palabras[validas], -importancia[validas]))][:k]
+        vocabulario = self.vocabulario
+        return {vocabulario[j]: valor for j, valor in zip(palabras[validas].tolist(), importancia[validas].tolist())}
+
+def _importancia(propios: np.ndarray, resto: np.ndarray, total_usuario, total_resto, umbral: int) -> np.ndarray:
+    # Sirve igual para un usuario que para todos: arrays alineados, con los totales
+    # como número o como array de la misma longitud
+    conteo_resto = np.where(resto > 0, resto, CONTEO_MINIMO_RESTO)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        importancia = np.sqrt((propios / total_usuario) / (conteo_resto / total_resto))
+    importancia[propios < max(umbral, 1)] = np.nan
+    return importancia
+
+def indice_de(log: 'list[Mensaje] | LogColumnar | IndicePalabras') -> IndicePalabras:
+    '''
+    Devuelve el índice de palabras de un log, calculándolo sólo si no se ha recibido ya uno.
+
+    :param log: Lista de mensajes, log columnar o índice de palabras
+    :type log: list[Mensaje] | LogColumnar | IndicePalabras
+    :return: Índice de palabras del log
+    :rtype: IndicePalabras
+    '''
+    if isinstance(log, IndicePalabras):
+        return log
+    return IndicePalabras.desde_log(log)
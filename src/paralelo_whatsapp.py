@@ -0,0 +1,152 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import io
+import mmap
+import os as so
+import re
+from analisis_whatsapp import (FORMATOS, LINEAS_DETECCION, SO, Mensaje, abre_log, carga_log, detecta_so,
+                               parsea_lineas, tipo_contenedor)
+from columnar_whatsapp import LogColumnar
+import perfil_whatsapp
+
+# Por debajo de este tamaño no compensa arrancar procesos
+TAM_MINIMO_PARALELO = 4 << 20
+# Trozos por proceso: más de uno reparte mejor la carga si unos trozos son más lentos
+TROZOS_POR_PROCESO = 4
+
+@perfil_whatsapp.perfilado('carga_log_paralelo')
+def carga_log_paralelo(fichero: str, os: str = SO, procesos: int | None = None,
+                       columnar: bool = False) -> list[Mensaje] | LogColumnar:
+    '''
+    Carga un log de Whatsapp repartiendo el parseo entre varios procesos.
+
+    :param fichero: Nombre del fichero del que se quieren leer los datos
+    :type fichero: str
+    :param os: Tipo de sistema operativo del log ('android', 'ios' o 'auto'), por defecto 'auto'
+    :type os: str
+    :param procesos: Número de procesos; si es None, tantos como núcleos
+    :type procesos: int | None
+    :param columnar: Si es True se devuelve un LogColumnar en lugar de una lista
+    :type columnar: bool
+    :return: Mensajes del log, en el mismo orden que devuelve carga_log
+    :rtype: list[Mensaje] | LogColumnar
+
+    El fichero se divide en rangos de bytes cuyos límites son siempre el principio
+    de una línea con fecha, de modo que ningún mensaje (ni sus líneas de continuación)
+    queda partido entre dos trozos. Cada proceso parsea sus trozos y devuelve un
+    LogColumnar, que viaja entre procesos mucho más barato que una lista de tuplas.
+    Los trozos se unen en orden, así que el resultado es idéntico al de carga_log.
+
+    Un log comprimido (véase abre_log) no puede dividirse por bytes, así que se
+    parsea en un solo proceso, descomprimiéndolo al vuelo.
+
+    Como usa multiprocessing, en Windows y macOS hay que llamarla desde un script
+    protegido con if __name__ == '__main__'.
+    '''
+    procesos = procesos or so.cpu_count() or 1
+    if os == 'auto':
+        with abre_log(fichero) as (f, _):
+            os = detecta_so(islice(f, LINEAS_DETECCION))
+    elif os not in FORMATOS:
+        raise Exception('OS no permitido') # Lanza una excepción
+
+    tamaño = so.path.getsize(fichero)
+    if procesos == 1 or tamaño < TAM_MINIMO_PARALELO or tipo_contenedor(fichero) is not None:
+        log = carga_log(fichero, os)
+        return LogColumnar.desde_mensajes(log) if columnar else log
+
+    limites = calcula_limites(fichero, procesos * TROZOS_POR_PROCESO, os)
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        trozos = list(ejecutor.map(_parsea_trozo, [fichero] * (len(limites) - 1),
+                                   limites[:-1], limites[1:], [os] * (len(limites) - 1)))
+    log = LogColumnar.concatena(trozos)
+    return log if columnar else list(log)
+
+def calcula_limites(fichero: str, n_trozos: int, os: str) -> list[int]:
+    '''
+    Divide un fichero de log en rangos de bytes alineados con el inicio de los mensajes.
+
+    :param fichero: Nombre del fichero de log
+    :type fichero: str
+    :param n_trozos: Número de trozos deseado
+    :type n_trozos: int
+    :param os: Tipo de sistema operativo del log ('android' o 'ios')
+    :type os: str
+    :return: Posiciones de inicio de cada trozo, seguidas del tamaño del fichero
+    :rtype: list[int]
+
+    Puede devolver menos trozos de los pedidos si el fichero tiene pocos mensajes.
+
+    El fichero se proyecta en memoria y cada límite se busca con una expresión
+    regular sobre la proyección, sin copiar ni decodificar el texto.
+    '''
+    # Un salto de línea seguido del principio de una línea con fecha
+    inicio = re.compile(b'\n' + _re_bytes(FORMATOS[os][1]).pattern)
+    tamaño = so.path.getsize(fichero)
+    limites = [0]
+    if tamaño > 0:
+        with open(fichero, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+            for i in range(1, n_trozos):
+                m = inicio.search(datos, i * tamaño // n_trozos - 1)
+                posicion = m.start() + 1 if m else tamaño
+                if posicion > limites[-1]:
+                    limites.append(posicion)
+    if limites[-1] < tamaño:
+        limites.append(tamaño)
+    return limites
+
+def _re_bytes(regex: re.Pattern) -> re.Pattern:
+    # Versión para bytes de una expresión regular compilada sobre str
+    return re.compile(regex.pattern.encode('utf8'), regex.flags & ~re.UNICODE)
+
+def _parsea_trozo(fichero: str, inicio: int, fin: int, os: str) -> LogColumnar:
+    with open(fichero, 'rb') as f:
+        f.seek(inicio)
+        datos = f.read(fin - inicio)
+    texto = datos.decode('utf-8-sig' if inicio == 0 else 'utf8')
+    # StringIO con newline=None trata los saltos de línea igual que open() en modo texto
+    return LogColumnar.desde_mensajes(parsea_lineas(io.StringIO(texto, newline=None), os))
+
+def benchmark(fichero: str, procesos: list[int], repeticiones: int = 1) -> dict[int, float]:
+    '''
+    Mide el tiempo de carga de un log con distintos números de procesos.
+
+    :param fichero: Nombre del fichero de log
+    :type fichero: str
+    :param procesos: Números de procesos a probar
+    :type procesos: list[int]
+    :param repeticiones: Veces que se repite cada medida; se toma la mejor, por defecto 1
+    :type repeticiones: int
+    :return: Diccionario que asocia a cada número de procesos los segundos que tardó la carga
+    :rtype: dict[int, float]
+    '''
+    from time import perf_counter
+    tiempos = {}
+    for n in procesos:
+        mejor = float('inf')
+        for _ in range(repeticiones):
+            inicio = perf_counter()
+            carga_log_paralelo(fichero, procesos=n, columnar=True)
+            mejor = min(mejor, perf_counter() - inicio)
+        tiempos[n] = mejor
+    return tiempos
+
+if __name__ == '__main__':
+    # Ejemplo, en una máquina de 8 núcleos con un log sintético de unos 2 GB:
+    #   python src/paralelo_whatsapp.py --mensajes 30000000 --procesos 1 2 4 8
+    import argparse
+    import tempfile
+    from sintetico_whatsapp import genera_log
+    parser = argparse.ArgumentParser(description='Benchmark de carga_log_paralelo')
+    parser.add_argument('--mensajes', type=int, default=4_000_000, help='mensajes del log sintético')
+    parser.add_argument('--procesos', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeticiones', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        sintetico = so.path.join(directorio, 'sintetico.txt')
+        genera_log(sintetico, args.mensajes)
+        print(f"Log sintético: {so.path.getsize(sintetico) / (1 << 20):.0f} MB, {so.cpu_count()} núcleos")
+        tiempos = benchmark(sintetico, args.procesos, args.repeticiones)
+        for n, segundos in tiempos.items():
+            print(f"{n} procesos: {segundos:.2f} s (x{tiempos[args.procesos[0]] / segundos:.2f})")
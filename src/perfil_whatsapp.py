@@ -0,0 +1,301 @@
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Iterator
+import os as so
+import threading
+
+# Si esta variable de entorno tiene un valor distinto de '' y '0', la
+# instrumentación está activa desde que se importa el módulo
+VARIABLE_ENTORNO = 'WHATSAPP_PERFIL'
+
+class Perfil:
+    '''
+    Tiempos y contadores de cada etapa del análisis.
+
+    - etapas: diccionario que asocia al nombre de cada etapa un diccionario con el
+      número de llamadas ('llamadas'), los segundos acumulados ('segundos') y un
+      Counter con sus contadores ('contadores').
+
+    Los tiempos son inclusivos: si una etapa se ejecuta dentro de otra (por ejemplo,
+    carga_log_columnar dentro de carga_log_cacheado), su tiempo cuenta en las dos.
+    Cada contador se suma a la etapa más interna en curso en el mismo hilo.
+    '''
+    def __init__(self):
+        self.etapas = {}
+        self._cerrojo = threading.Lock()
+
+    def suma(self, etapa: str, segundos: float = 0.0, llamadas: int = 0, contadores: dict | None = None) -> None:
+        '''
+        Suma tiempo, llamadas y contadores a una etapa.
+        '''
+        with self._cerrojo:
+            datos = self.etapas.get(etapa)
+            if datos is None:
+                datos = self.etapas[etapa] = {'llamadas': 0, 'segundos': 0.0, 'contadores': Counter()}
+            datos['llamadas'] += llamadas
+            datos['segundos'] += segundos
+            if contadores:
+                datos['contadores'].update(contadores)
+
+    def combina(self, otro: 'Perfil') -> None:
+        '''
+        Suma a este perfil todas las etapas de otro.
+        '''
+        for etapa, datos in otro.etapas.items():
+            self.suma(etapa, datos['segundos'], datos['llamadas'], datos['contadores'])
+
+    def informe(self) -> dict[str, dict]:
+        '''
+        Devuelve las etapas en un diccionario que puede guardarse como JSON.
+
+        :return: Diccionario que asocia a cada etapa 'llamadas', 'ms', 'contadores' y
+            'por_segundo' (cada contador dividido entre los segundos de la etapa)
+        :rtype: dict[str, dict]
+        '''
+        res = {}
+        with self._cerrojo:
+            for etapa, datos in self.etapas.items():
+                segundos = datos['segundos']
+                res[etapa] = {'llamadas': datos['llamadas'], 'ms': segundos * 1000,
+                              'contadores': dict(datos['contadores']),
+                              'por_segundo': {nombre: n / segundos for nombre, n in datos['contadores'].items()
+                                              if segundos > 0}}
+        return res
+
+    def texto(self) -> str:
+        '''
+        Devuelve el informe como texto, una línea por etapa, de la más lenta a la más rápida.
+        '''
+        lineas = []
+        for etapa, datos in sorted(self.informe().items(), key=lambda item: -item[1]['ms']):
+            linea = f"{etapa}: {datos['ms']:.1f} ms, llamadas={datos['llamadas']}"
+            for nombre, n in datos['contadores'].items():
+                linea += f", {nombre}={n}"
+                if nombre in datos['por_segundo']:
+                    linea += f" ({datos['por_segundo'][nombre]:.0f}/s)"
+            lineas.append(linea)
+        return '\n'.join(lineas)
+
+_activo = so.environ.get(VARIABLE_ENTORNO, '') not in ('', '0')
+_perfil = Perfil()
+_hilos = threading.local()
+
+def activo() -> bool:
+    '''
+    Indica si la instrumentación está activa.
+    '''
+    return _activo
+
+def activa(perfil: Perfil | None = None) -> Perfil:
+    '''
+    Activa la instrumentación.
+
+    :param perfil: Perfil donde se recogen los datos; si es None, se sigue usando el actual
+    :type perfil: Perfil | None
+    :return: Perfil donde se recogen los datos
+    :rtype: Perfil
+    '''
+    global _activo, _perfil
+    _activo = True
+    if perfil is not None:
+        _perfil = perfil
+    return _perfil
+
+def desactiva() -> None:
+    '''
+    Desactiva la instrumentación; los datos ya recogidos se conservan en perfil_actual().
+    '''
+    global _activo
+    _activo = False
+
+def perfil_actual() -> Perfil:
+    '''
+    Devuelve el perfil donde se recogen los datos.
+    '''
+    return _perfil
+
+@contextmanager
+def perfilando() -> Iterator[Perfil]:
+    '''
+    Activa la instrumentación durante un bloque with, recogiendo los datos en un perfil nuevo.
+
+    Al salir se restaura el estado anterior y, si la instrumentación ya estaba
+    activa, los datos del bloque se suman también al perfil anterior.
+    '''
+    global _activo, _perfil
+    anterior_activo, anterior = _activo, _perfil
+    nuevo = activa(Perfil())
+    try:
+        yield nuevo
+    finally:
+        _activo, _perfil = anterior_activo, anterior
+        if anterior_activo:
+            anterior.combina(nuevo)
+
+@contextmanager
+def _mide(etapa: str) -> Iterator[None]:
+    pila = getattr(_hilos, 'pila', None)
+    if pila is None:
+        pila = _hilos.pila = []
+    pila.append(etapa)
+    perfil = _perfil
+    inicio = perf_counter()
+    try:
+        yield
+    finally:
+        perfil.suma(etapa, perf_counter() - inicio, 1)
+        pila.pop()
+
+_NADA = nullcontext()
+
+def etapa(nombre: str):
+    '''
+    Devuelve un gestor de contexto que mide el tiempo de un bloque with como una
+    etapa; si la instrumentación no está activa, no hace nada.
+
+    :param nombre: Nombre de la etapa
+    :type nombre: str
+    '''
+    return _mide(nombre) if _activo else _NADA
+
+def perfilado(nombre: str) -> Callable[[Callable], Callable]:
+    '''
+    Decorador que mide cada llamada a una función como una etapa.
+
+    :param nombre: Nombre de la etapa
+    :type nombre: str
+
+    Si la instrumentación no está activa, el único coste es comprobarlo en cada llamada.
+    '''
+    def decorador(funcion: Callable) -> Callable:
+        @wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            if not _activo:
+                return funcion(*args, **kwargs)
+            with _mide(nombre):
+                return funcion(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+def cuenta(nombre: str, n: int = 1) -> None:
+    '''
+    Suma n a un contador de la etapa en curso (o de la etapa '' si no hay ninguna).
+
+    :param nombre: Nombre del contador (por ejemplo, 'mensajes' o 'tokens')
+    :type nombre: str
+    :param n: Cantidad a sumar, por defecto 1
+    :type n: int
+
+    Se llama una vez por bloque de trabajo, no por elemento: si la instrumentación
+    no está activa, no hace nada.
+    '''
+    if _activo:
+        pila = getattr(_hilos, 'pila', None)
+        _perfil.suma(pila[-1] if pila else '', contadores={nombre: n})
+
+def captura(funcion: Callable[..., Any], *args, cprofile: bool = True, memoria: bool = True,
+            n_lineas: int = 25, **kwargs) -> dict:
+    '''
+    Ejecuta una función recogiendo sus etapas y, opcionalmente, un perfil de cProfile
+    y las asignaciones de memoria de tracemalloc.
+
+    :param funcion: Función a ejecutar (por ejemplo, genera_informe)
+    :type funcion: Callable[..., Any]
+    :param args: Argumentos posicionales de la función
+    :param cprofile: Si es True se ejecuta bajo cProfile, por defecto True
+    :type cprofile: bool
+    :param memoria: Si es True se miden las asignaciones con tracemalloc, por defecto True
+    :type memoria: bool
+    :param n_lineas: Funciones y líneas de código que se incluyen en cada listado, por defecto 25
+    :type n_lineas: int
+    :param kwargs: Argumentos con nombre de la función
+    :return: Diccionario con 'resultado', 'segundos', 'etapas' (Perfil.informe), 'texto'
+        (Perfil.texto) y, si se pidieron, 'cprofile' (listado por tiempo acumulado),
+        'memoria_pico' (bytes) y 'memoria_lineas' (líneas de código que más memoria asignan)
+    :rtype: dict
+
+    cProfile y tracemalloc ralentizan mucho la ejecución, así que 'segundos' sólo
+    sirve para comparar capturas hechas con las mismas opciones.
+    '''
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+
+    perfilador = cProfile.Profile() if cprofile else None
+    if memoria:
+        tracemalloc.start()
+    with perfilando() as perfil:
+        inicio = perf_counter()
+        if perfilador is not None:
+            perfilador.enable()
+        try:
+            resultado = funcion(*args, **kwargs)
+        finally:
+            if perfilador is not None:
+                perfilador.disable()
+            segundos = perf_counter() - inicio
+            if memoria:
+                instantanea = tracemalloc.take_snapshot()
+                pico = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    res = {'resultado': resultado, 'segundos': segundos, 'etapas': perfil.informe(), 'texto': perfil.texto()}
+    if perfilador is not None:
+        salida = io.StringIO()
+        pstats.Stats(perfilador, stream=salida).sort_stats('cumulative').print_stats(n_lineas)
+        res['cprofile'] = salida.getvalue()
+    if memoria:
+        res['memoria_pico'] = pico
+        res['memoria_lineas'] = [str(estadistica) for estadistica in
+                                 instantanea.statistics('lineno')[:n_lineas]]
+    return res
+
+if __name__ == '__main__':
+    # Ejemplo: python src/perfil_whatsapp.py data/bigbangtheory_es.txt --usuario Penny --cprofile
+    import argparse
+    import json
+    import tempfile
+    import matplotlib
+    matplotlib.use('Agg') # Las gráficas se dibujan en un fichero, sin abrir ventanas
+    # El resto de módulos usan perfil_whatsapp, no este __main__
+    import perfil_whatsapp
+    from analisis_whatsapp import SO, carga_log
+    from agregados_whatsapp import AgregadoLog
+    from graficas_whatsapp import genera_informe, genera_word_cloud
+    from palabras_whatsapp import IndicePalabras
+
+    parser = argparse.ArgumentParser(description='Mide las etapas de la carga de un log y de su informe')
+    parser.add_argument('fichero')
+    parser.add_argument('--os', choices=['auto', 'android', 'ios'], default=SO)
+    parser.add_argument('--usuario', help='usuario del informe; por defecto, todo el log')
+    parser.add_argument('--nube', action='store_true', help='genera también la word cloud del usuario')
+    parser.add_argument('--cprofile', action='store_true', help='muestra el perfil de cProfile')
+    parser.add_argument('--memoria', action='store_true', help='muestra las líneas que más memoria asignan')
+    parser.add_argument('--json', help='fichero donde guardar el informe en JSON')
+    args = parser.parse_args()
+
+    def analiza():
+        log = carga_log(args.fichero, args.os)
+        agregado = AgregadoLog.desde_log(log)
+        indice = IndicePalabras.desde_log(log)
+        with tempfile.TemporaryDirectory() as directorio:
+            genera_informe(agregado, usuario=args.usuario, fichero=so.path.join(directorio, 'informe.png'))
+            if args.nube and args.usuario:
+                genera_word_cloud(indice.palabras_caracteristicas(args.usuario, max_palabras=150))
+
+    # Sin cProfile ni tracemalloc los tiempos de las etapas son los reales
+    resultados = perfil_whatsapp.captura(analiza, cprofile=args.cprofile, memoria=args.memoria)
+    print(resultados['texto'])
+    print(f"Total: {resultados['segundos']:.3f} s")
+    if args.cprofile:
+        print(resultados['cprofile'])
+    if args.memoria:
+        print(f"Pico de memoria: {resultados['memoria_pico'] / (1 << 20):.1f} MB")
+        print('\n'.join(resultados['memoria_lineas']))
+    if args.json:
+        with open(args.json, 'w', encoding='utf8') as f:
+            json.dump({clave: valor for clave, valor in resultados.items() if clave != 'resultado'}, f,
+                      ensure_ascii=False, indent=2)
@@ -0,0 +1,336 @@
+from collections import OrderedDict
+from typing import Callable
+import hashlib
+import io
+import json
+import os as so
+import threading
+import numpy as np
+from analisis_whatsapp import Mensaje
+from agregados_whatsapp import AgregadoLog
+from columnar_whatsapp import LogColumnar
+from graficas_whatsapp import TAMAÑO_INFORME, TAMAÑO_NUBE, dibuja_informe, genera_word_cloud, muestra_o_guarda
+import perfil_whatsapp
+
+# Bytes de imágenes PNG que se guardan en memoria como máximo
+TAM_MAXIMO_CACHE = 256 << 20
+# Bytes de imágenes PNG que se guardan en disco como máximo
+TAM_MAXIMO_DISCO = 512 << 20
+# Puntos por pulgada de los informes renderizados
+DPI_INFORME = 100
+# Usuarios (los que más mensajes escriben) cuyas imágenes se renderizan por adelantado
+USUARIOS_PRERENDERIZADOS = 5
+
+class CacheRender:
+    '''
+    Caché de imágenes PNG ya renderizadas (word clouds e informes).
+
+    - directorio: si no es None, las imágenes también se guardan en este directorio,
+      una por fichero, y sobreviven al cierre del programa.
+    - tam_maximo: bytes que pueden ocupar las imágenes en memoria.
+    - tam_maximo_disco: bytes que pueden ocupar las imágenes en el directorio.
+
+    En memoria se descartan primero las imágenes usadas hace más tiempo (LRU). En
+    disco también: cada lectura actualiza la fecha de modificación del fichero, y
+    al crear la caché y tras cada escritura se borran los ficheros más antiguos
+    hasta no superar tam_maximo_disco. Puede usarse a la vez desde varios hilos;
+    si dos hilos piden la misma imagen, sólo uno la renderiza y el otro espera el
+    resultado.
+    '''
+    def __init__(self, directorio: str | None = None, tam_maximo: int = TAM_MAXIMO_CACHE,
+                 tam_maximo_disco: int = TAM_MAXIMO_DISCO):
+        self.directorio = directorio
+        self.tam_maximo = tam_maximo
+        self.tam_maximo_disco = tam_maximo_disco
+        self._imagenes = OrderedDict()
+        self._tam = 0
+        self._en_curso = {}
+        self._cerrojo = threading.Lock()
+        self._cerrojo_disco = threading.Lock()
+        self._poda_disco()
+
+    @staticmethod
+    def clave(huella: str, tipo: str, usuario: str | None = None, **parametros) -> str:
+        '''
+        Devuelve la clave de una imagen.
+
+        :param huella: Huella del log (huella_log)
+        :type huella: str
+        :param tipo: Tipo de imagen ('nube' o 'informe')
+        :type tipo: str
+        :param usuario: Usuario de la imagen, o None si es de todo el log
+        :type usuario: str | None
+        :param parametros: Resto de parámetros de los que depende la imagen (max_words, tamaño...)
+        :return: Clave en hexadecimal, que sirve también como nombre de fichero
+        :rtype: str
+        '''
+        datos = json.dumps([huella, tipo, usuario, parametros], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(datos.encode('utf8'), digest_size=16).hexdigest()
+
+    def obtiene(self, clave: str) -> bytes | None:
+        '''
+        Devuelve la imagen PNG de una clave, o None si no está en la caché.
+        '''
+        with self._cerrojo:
+            png = self._imagenes.get(clave)
+            if png is not None:
+                self._imagenes.move_to_end(clave)
+                return png
+        if self.directorio is None:
+            return None
+        try:
+            with open(self._ruta(clave), 'rb') as f:
+                png = f.read()
+            so.utime(self._ruta(clave))
+        except OSError:
+            return None
+        with self._cerrojo:
+            self._añade(clave, png)
+        return png
+
+    def guarda(self, clave: str, png: bytes) -> None:
+        '''
+        Guarda la imagen PNG de una clave en memoria y, si hay directorio, en disco.
+        '''
+        with self._cerrojo:
+            self._añade(clave, png)
+        if self.directorio is not None:
+            try:
+                so.makedirs(self.directorio, exist_ok=True)
+                temporal = self._ruta(clave) + '.tmp'
+                with open(temporal, 'wb') as f:
+                    f.write(png)
+                so.replace(temporal, self._ruta(clave))
+            except OSError:
+                pass
+            self._poda_disco()
+
+    def obtiene_o_renderiza(self, clave: str, renderiza: Callable[[], bytes]) -> bytes:
+        '''
+        Devuelve la imagen de una clave, renderizándola y guardándola si no está en la caché.
+
+        :param clave: Clave de la imagen (CacheRender.clave)
+        :type clave: str
+        :param renderiza: Función sin parámetros que devuelve la imagen PNG
+        :type renderiza: Callable[[], bytes]
+        :return: Imagen PNG
+        :rtype: bytes
+        '''
+        while True:
+            png = self.obtiene(clave)
+            if png is not None:
+                return png
+            with self._cerrojo:
+                evento = self._en_curso.get(clave)
+                if evento is None:
+                    evento = self._en_curso[clave] = threading.Event()
+                    break
+            # Otro hilo la está renderizando: se espera y se vuelve a buscar
+            evento.wait()
+        try:
+            png = renderiza()
+            self.guarda(clave, png)
+            return png
+        finally:
+            with self._cerrojo:
+                del self._en_curso[clave]
+            evento.set()
+
+    def _añade(self, clave: str, png: bytes) -> None:
+        # Se llama con el cerrojo tomado
+        anterior = self._imagenes.pop(clave, None)
+        if anterior is not None:
+            self._tam -= len(anterior)
+        self._imagenes[clave] = png
+        self._tam += len(png)
+        while self._tam > self.tam_maximo and len(self._imagenes) > 1:
+            _, descartada = self._imagenes.popitem(last=False)
+            self._tam -= len(descartada)
+
+    def _poda_disco(self) -> None:
+        # Borra las imágenes del directorio usadas hace más tiempo hasta no superar tam_maximo_disco
+        if self.directorio is None:
+            return
+        with self._cerrojo_disco:
+            try:
+                entradas = [entrada for entrada in so.scandir(self.directorio)
+                            if entrada.name.endswith('.png') and entrada.is_file()]
+            except OSError:
+                return
+            ficheros = []
+            for entrada in entradas:
+                try:
+                    estado = entrada.stat()
+                except OSError:
+                    continue
+                ficheros.append((estado.st_mtime_ns, estado.st_size, entrada.path))
+            tam = sum(tamaño for _, tamaño, _ in ficheros)
+            for _, tamaño, ruta in sorted(ficheros):
+                if tam <= self.tam_maximo_disco:
+                    break
+                try:
+                    so.remove(ruta)
+                    tam -= tamaño
+                except OSError:
+                    pass
+
+    def _ruta(self, clave: str) -> str:
+        return so.path.join(self.directorio, clave + '.png')
+
+def huella_log(log: 'list[Mensaje] | LogColumnar') -> str:
+    '''
+    Devuelve un resumen BLAKE2 de los mensajes de un log: dos logs con los mismos
+    mensajes tienen la misma huella, vengan del fichero o de la caché que vengan.
+
+    :param log: Lista de mensajes o log columnar
+    :type log: list[Mensaje] | LogColumnar
+    :return: Resumen en hexadecimal
+    :rtype: str
+    '''
+    if not isinstance(log, LogColumnar):
+        log = LogColumnar.desde_mensajes(log)
+    resumen = hashlib.blake2b(digest_size=16)
+    resumen.update(json.dumps(log.nombres, ensure_ascii=False).encode('utf8'))
+    resumen.update(np.ascontiguousarray(log.minutos, dtype='<i8').tobytes())
+    resumen.update(np.ascontiguousarray(log.usuarios, dtype='<i4').tobytes())
+    resumen.update(np.ascontiguousarray(log.offsets - log.offsets[0], dtype='<i8').tobytes())
+    resumen.update(log.texto[log.offsets[0]:log.offsets[-1]])
+    return resumen.hexdigest()
+
+@perfil_whatsapp.perfilado('render_nube')
+def renderiza_nube(dicc_palabras_caracteristicas: dict[str, float], max_words: int = 150,
+                   tamaño: tuple[int, int] = TAMAÑO_NUBE) -> bytes:
+    '''
+    Renderiza una word cloud como imagen PNG. Puede llamarse desde cualquier hilo.
+
+    :param dicc_palabras_caracteristicas: Diccionario de importancia de las palabras
+    :type dicc_palabras_caracteristicas: dict[str, float]
+    :param max_words: Número máximo de palabras de la word cloud, por defecto 150
+    :type max_words: int
+    :param tamaño: Ancho y alto en píxeles, por defecto TAMAÑO_NUBE
+    :type tamaño: tuple[int, int]
+    :return: Imagen PNG
+    :rtype: bytes
+    '''
+    salida = io.BytesIO()
+    genera_word_cloud(dicc_palabras_caracteristicas, max_words, tamaño).to_image().save(salida, format='png')
+    return salida.getvalue()
+
+@perfil_whatsapp.perfilado('render_informe')
+def renderiza_informe(agregado: AgregadoLog, titulo: str = "Informe", usuario: str | None = None,
+                      tamaño: tuple[float, float] = TAMAÑO_INFORME, dpi: int = DPI_INFORME) -> bytes:
+    '''
+    Renderiza el informe de genera_informe como imagen PNG. Puede llamarse desde cualquier hilo.
+
+    :param agregado: Agregado del log
+    :type agregado: AgregadoLog
+    :param titulo: Título del informe, por defecto "Informe"
+    :type titulo: str
+    :param usuario: Usuario específico para filtrar los mensajes, por defecto None
+    :type usuario: str | None
+    :param tamaño: Ancho y alto en pulgadas, por defecto TAMAÑO_INFORME
+    :type tamaño: tuple[float, float]
+    :param dpi: Puntos por pulgada, por defecto DPI_INFORME
+    :type dpi: int
+    :return: Imagen PNG
+    :rtype: bytes
+
+    La figura se crea sin pyplot, con el backend Agg, así que no interfiere con las
+    ventanas que esté mostrando el hilo principal.
+    '''
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=tamaño, dpi=dpi)
+    FigureCanvasAgg(fig)
+    dibuja_informe(fig, agregado, titulo, usuario)
+    salida = io.BytesIO()
+    fig.savefig(salida, format='png')
+    return salida.getvalue()
+
+def muestra_png(png: bytes, figsize: tuple[float, float] | None = None, fichero: str | None = None) -> None:
+    '''
+    Muestra una imagen PNG ya renderizada en una ventana de matplotlib.
+
+    :param png: Imagen PNG
+    :type png: bytes
+    :param figsize: Ancho y alto de la ventana en pulgadas; si es None, el de matplotlib por defecto
+    :type figsize: tuple[float, float] | None
+    :param fichero: Si no es None, la imagen se guarda en este fichero en lugar de mostrarse
+    :type fichero: str | None
+    '''
+    import matplotlib.pyplot as plt
+    imagen = plt.imread(io.BytesIO(png), format='png')
+    fig = plt.figure(figsize=figsize)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.imshow(imagen)
+    ax.axis('off')
+    muestra_o_guarda(fichero)
+
+def prerenderiza(cache: CacheRender, huella: str, agregado: AgregadoLog,
+                 palabras: dict[str, dict[str, float]], max_words: int = 150,
+                 n_usuarios: int = USUARIOS_PRERENDERIZADOS,
+                 cancelado: Callable[[], bool] = lambda: False) -> int:
+    '''
+    Renderiza y guarda en la caché el informe completo y el informe y la word cloud
+    de los usuarios que más mensajes escriben.
+
+    :param cache: Caché donde se guardan las imágenes
+    :type cache: CacheRender
+    :param huella: Huella del log (huella_log)
+    :type huella: str
+    :param agregado: Agregado del log
+    :type agregado: AgregadoLog
+    :param palabras: Palabras características de cada usuario
+    :type palabras: dict[str, dict[str, float]]
+    :param max_words: Número máximo de palabras de las word clouds, por defecto 150
+    :type max_words: int
+    :param n_usuarios: Número de usuarios, por defecto USUARIOS_PRERENDERIZADOS
+    :type n_usuarios: int
+    :param cancelado: Función que se consulta antes de cada imagen; si devuelve True se para
+    :type cancelado: Callable[[], bool]
+    :return: Número de imágenes renderizadas o encontradas en la caché
+    :rtype: int
+
+    Está pensada para ejecutarse en un hilo aparte. Si una imagen no puede
+    renderizarse (por ejemplo, porque falta la fuente de la word cloud), se pasa a
+    la siguiente: el error aparecerá cuando el usuario pida la imagen.
+    '''
+    usuarios = [usuario for usuario, _ in agregado.mensajes_por_usuario().most_common(n_usuarios)]
+    trabajos = []
+    for usuario in [None] + usuarios:
+        trabajos.append((clave_informe(huella, usuario),
+                         lambda usuario=usuario: renderiza_informe(agregado, titulo_informe(usuario), usuario)))
+        if usuario is None:
+            continue
+        if palabras.get(usuario):
+            trabajos.append((clave_nube(huella, usuario, max_words),
+                             lambda usuario=usuario: renderiza_nube(palabras[usuario], max_words)))
+    hechas = 0
+    for clave, renderiza in trabajos:
+        if cancelado():
+            break
+        try:
+            cache.obtiene_o_renderiza(clave, renderiza)
+            hechas += 1
+        except Exception:
+            pass
+    return hechas
+
+def titulo_informe(usuario: str | None) -> str:
+    '''
+    Devuelve el título del informe de un usuario (o del log completo si es None).
+    '''
+    return "Informe completo" if usuario is None else "Informe " + usuario
+
+def clave_informe(huella: str, usuario: str | None) -> str:
+    '''
+    Devuelve la clave de la caché del informe de un usuario (o del log completo si es None).
+    '''
+    return CacheRender.clave(huella, 'informe', usuario, titulo=titulo_informe(usuario),
+                             tamaño=TAMAÑO_INFORME, dpi=DPI_INFORME)
+
+def clave_nube(huella: str, usuario: str, max_words: int = 150) -> str:
+    '''
+    Devuelve la clave de la caché de la word cloud de un usuario.
+    '''
+    return CacheRender.clave(huella, 'nube', usuario, max_words=max_words, tamaño=TAMAÑO_NUBE)
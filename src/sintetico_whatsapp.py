@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+import numpy as np
+from analisis_whatsapp import FORMATOS
+
+NOMBRES = ['Ana', 'Luis', 'Carmen', 'Javier', 'Lucía', 'Pablo', 'Marta', 'Sergio', 'Elena', 'Diego',
+           'Paula', 'Raúl', 'Sara', 'Álvaro', 'Irene', 'Jorge', 'Nuria', 'Hugo', 'Rocío', 'Iván']
+
+PALABRAS = ('de la que el en y a los se del las un por con no una su para es al lo como más pero '
+            'sus le ya o este sí porque esta entre cuando muy sin sobre también me hasta hay donde '
+            'quien desde todo nos durante todos uno les ni contra otros ese eso ante ellos e esto mí '
+            'antes algunos qué unos yo otro otras otra él tanto esa estos mucho quienes nada muchos '
+            'cual poco ella estar estas algunas algo nosotros mi mis tú te ti tu tus ellas vosotros '
+            'hola vale jaja jajaja bueno gracias mañana hoy ayer noche casa trabajo clase examen '
+            'cena comida café cerveza fútbol partido película serie música viaje playa fiesta '
+            'quedamos luego ahora después tarde pronto genial guay perfecto claro venga vamos '
+            'oye mira sabes creo pienso quiero puedo tengo voy vienes estás dónde cuándo cómo '
+            'Sheldon Leonard física cuántica teoría universidad laboratorio cómic ordenador').split()
+
+# Además de PALABRAS, el vocabulario incluye palabras inventadas con estas sílabas,
+# para que su tamaño se parezca al de un chat real
+SILABAS = ['ma', 'te', 'ri', 'so', 'lu', 'ca', 'no', 'pe', 'di', 'ga', 'bre', 'tor', 'ción', 'lla', 'fi', 'mun']
+TAM_VOCABULARIO = 20_000
+
+EMOJIS = ['😂', '👍', '❤️', '😊', '🙏', '😍', '🤣', '😅', '🎉', '😢', '🔥', '👏', '😉', '🤔', '🍻']
+
+AVISOS = ['Se añadió a {}', '{} salió del grupo', '{} cambió el asunto a "Quedada"']
+
+FORMATO_LINEA = {
+    'android': lambda instante: instante.strftime('%d/%m/%y, %H:%M - '),
+    'ios': lambda instante: f'[{instante.day}/{instante.month}/{instante:%y}, {instante:%H:%M:%S}] ',
+}
+
+# Mensajes que se generan y escriben de una vez
+TAM_BLOQUE = 100_000
+
+def genera_log(fichero: str, n_mensajes: int, n_usuarios: int = 5, os: str = 'android',
+               inicio: datetime = datetime(2020, 1, 1), dias: int = 365,
+               prob_multilinea: float = 0.05, prob_emoji: float = 0.2,
+               prob_aviso: float = 0.001, semilla: int = 0) -> None:
+    '''
+    Escribe un log de Whatsapp sintético, con el formato de un export real.
+
+    :param fichero: Nombre del fichero que se creará
+    :type fichero: str
+    :param n_mensajes: Número de mensajes de usuario del log
+    :type n_mensajes: int
+    :param n_usuarios: Número de participantes, por defecto 5
+    :type n_usuarios: int
+    :param os: Formato del export ('android' o 'ios'), por defecto 'android'
+    :type os: str
+    :param inicio: Instante del primer mensaje, por defecto el 1 de enero de 2020
+    :type inicio: datetime
+    :param dias: Días que abarca el log, por defecto 365
+    :type dias: int
+    :param prob_multilinea: Probabilidad de que un mensaje tenga varias líneas, por defecto 0.05
+    :type prob_multilinea: float
+    :param prob_emoji: Probabilidad de que un mensaje acabe con un emoji, por defecto 0.2
+    :type prob_emoji: float
+    :param prob_aviso: Probabilidad de que un mensaje vaya precedido de un aviso del sistema, por defecto 0.001
+    :type prob_aviso: float
+    :param semilla: Semilla del generador aleatorio, por defecto 0
+    :type semilla: int
+
+    Los mensajes están en orden cronológico, con intervalos aleatorios entre ellos.
+    Unos usuarios escriben mucho más que otros y unas palabras son mucho más
+    frecuentes que otras (siguiendo una ley de Zipf), como en un chat real.
+    Con la misma semilla se genera siempre el mismo fichero.
+    '''
+    if os not in FORMATOS:
+        raise Exception('OS no permitido') # Lanza una excepción
+    aleatorio = np.random.default_rng(semilla)
+    nombres = [NOMBRES[i % len(NOMBRES)] + (f' {i // len(NOMBRES) + 1}' if i >= len(NOMBRES) else '')
+               for i in range(n_usuarios)]
+    pesos_usuarios = _pesos_zipf(n_usuarios)
+    vocabulario = _vocabulario(TAM_VOCABULARIO)
+    pesos_palabras = _pesos_zipf(len(vocabulario))
+    segundos_medios = dias * 86400 / max(n_mensajes, 1)
+    formato = FORMATO_LINEA[os]
+
+    instante = inicio
+    with open(fichero, 'w', encoding='utf8', newline='\n') as f:
+        for primero in range(0, n_mensajes, TAM_BLOQUE):
+            n = min(TAM_BLOQUE, n_mensajes - primero)
+            saltos = aleatorio.exponential(segundos_medios, n)
+            usuarios = aleatorio.choice(n_usuarios, n, p=pesos_usuarios)
+            longitudes = aleatorio.geometric(0.12, n)
+            palabras = aleatorio.choice(len(vocabulario), int(longitudes.sum()), p=pesos_palabras)
+            multilinea = aleatorio.random(n) < prob_multilinea
+            emojis = np.where(aleatorio.random(n) < prob_emoji, aleatorio.integers(len(EMOJIS), size=n), -1)
+            avisos = aleatorio.random(n) < prob_aviso
+
+            lineas = []
+            fin = 0
+            for i in range(n):
+                instante += timedelta(seconds=float(saltos[i]))
+                nombre = nombres[usuarios[i]]
+                if avisos[i]:
+                    lineas.append(formato(instante) + AVISOS[i % len(AVISOS)].format(nombre))
+                texto_palabras = [vocabulario[j] for j in palabras[fin:fin + longitudes[i]]]
+                fin += longitudes[i]
+                if multilinea[i] and len(texto_palabras) > 1:
+                    mitad = len(texto_palabras) // 2
+                    texto = ' '.join(texto_palabras[:mitad]) + '\n' + ' '.join(texto_palabras[mitad:])
+                else:
+                    texto = ' '.join(texto_palabras)
+                if emojis[i] >= 0:
+                    texto += ' ' + EMOJIS[emojis[i]]
+                lineas.append(f'{formato(instante)}{nombre}: {texto}')
+            f.write('\n'.join(lineas))
+            f.write('\n')
+
+def _vocabulario(n: int) -> list[str]:
+    # PALABRAS primero, que son las más frecuentes, y después combinaciones de sílabas
+    vocabulario = list(PALABRAS)
+    longitud = 2
+    while len(vocabulario) < n:
+        for i in range(len(SILABAS) ** longitud):
+            silabas = []
+            for _ in range(longitud):
+                i, resto = divmod(i, len(SILABAS))
+                silabas.append(SILABAS[resto])
+            vocabulario.append(''.join(silabas))
+            if len(vocabulario) == n:
+                break
+        longitud += 1
+    return vocabulario
+
+def _pesos_zipf(n: int) -> np.ndarray:
+    pesos = 1 / np.arange(1, n + 1)
+    return pesos / pesos.sum()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Genera un log de Whatsapp sintético')
+    parser.add_argument('fichero')
+    parser.add_argument('--mensajes', type=int, default=10_000)
+    parser.add_argument('--usuarios', type=int, default=5)
+    parser.add_argument('--os', choices=list(FORMATOS), default='android')
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args()
+    genera_log(args.fichero, args.mensajes, args.usuarios, args.os, dias=args.dias, semilla=args.semilla)
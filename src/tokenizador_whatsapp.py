@@ -0,0 +1,113 @@
+from collections import Counter
+from itertools import islice
+from typing import Iterable
+import sys
+from analisis_whatsapp import SIGNOS_PUNTUACION
+import perfil_whatsapp
+
+# Textos que se unen y se dividen de una vez al contar palabras
+TAM_BLOQUE = 1 << 16
+
+# Quita las tildes y diéresis, pero conserva la ñ
+TABLA_TILDES = str.maketrans('áéíóúàèìòùäëïöüâêîôûÁÉÍÓÚÀÈÌÒÙÄËÏÖÜÂÊÎÔÛ',
+                             'aeiouaeiouaeiouaeiouAEIOUAEIOUAEIOUAEIOU')
+
+def normaliza(palabra: str, minusculas: bool = False, sin_tildes: bool = False) -> str:
+    '''
+    Normaliza una palabra ya separada del texto.
+
+    :param palabra: Palabra tal como aparece en el texto
+    :type palabra: str
+    :param minusculas: Si es True se pasa a minúsculas, por defecto False
+    :type minusculas: bool
+    :param sin_tildes: Si es True se quitan las tildes, por defecto False
+    :type sin_tildes: bool
+    :return: Palabra sin signos de puntuación al principio ni al final
+    :rtype: str
+    '''
+    palabra = palabra.strip(SIGNOS_PUNTUACION)
+    if minusculas:
+        palabra = palabra.casefold()
+    if sin_tildes:
+        palabra = palabra.translate(TABLA_TILDES)
+    return palabra
+
+def tokeniza(texto: str, minusculas: bool = False, sin_tildes: bool = False) -> list[str]:
+    '''
+    Divide un texto en palabras.
+
+    :param texto: Texto de un mensaje
+    :type texto: str
+    :param minusculas: Si es True las palabras se pasan a minúsculas, por defecto False
+    :type minusculas: bool
+    :param sin_tildes: Si es True se quitan las tildes, por defecto False
+    :type sin_tildes: bool
+    :return: Lista de palabras, en el orden del texto
+    :rtype: list[str]
+
+    Por defecto da el mismo resultado que aplicar palabra.strip(".,:();¿?¡!") a
+    cada palabra de texto.split().
+    '''
+    return [normaliza(palabra, minusculas, sin_tildes) for palabra in texto.split()]
+
+@perfil_whatsapp.perfilado('tokenizacion')
+def cuenta_palabras(textos: Iterable[str], minusculas: bool = False, sin_tildes: bool = False) -> Counter:
+    '''
+    Cuenta las palabras de una secuencia de textos.
+
+    :param textos: Textos de los mensajes
+    :type textos: Iterable[str]
+    :param minusculas: Si es True las palabras se pasan a minúsculas, por defecto False
+    :type minusculas: bool
+    :param sin_tildes: Si es True se quitan las tildes, por defecto False
+    :type sin_tildes: bool
+    :return: Conteo de las palabras
+    :rtype: Counter
+
+    Equivale a contar tokeniza(texto) para cada texto, pero primero se cuentan las
+    palabras tal como aparecen, con split y Counter (ambos implementados en C), y
+    después se normaliza una sola vez cada palabra distinta. Los textos se unen y
+    se dividen por bloques de TAM_BLOQUE, así que la memoria depende del bloque y
+    del vocabulario, no del número de mensajes. Las palabras resultantes se
+    internan, de modo que los conteos de distintos usuarios comparten las cadenas.
+    '''
+    crudas = Counter()
+    textos = iter(textos)
+    while bloque := list(islice(textos, TAM_BLOQUE)):
+        crudas.update('\n'.join(bloque).split())
+    if perfil_whatsapp.activo():
+        perfil_whatsapp.cuenta('tokens', sum(crudas.values()))
+        perfil_whatsapp.cuenta('palabras_distintas', len(crudas))
+    conteo = Counter()
+    for cruda, n in crudas.items():
+        conteo[sys.intern(normaliza(cruda, minusculas, sin_tildes))] += n
+    return conteo
+
+def _cuenta_palabras_strip(textos: Iterable[str]) -> Counter:
+    # Versión original, mensaje a mensaje, que se usa como referencia en el benchmark
+    conteo = Counter()
+    for texto in textos:
+        conteo.update(palabra.strip(SIGNOS_PUNTUACION) for palabra in texto.split())
+    return conteo
+
+if __name__ == '__main__':
+    import argparse
+    from time import perf_counter
+    from analisis_whatsapp import carga_log
+    parser = argparse.ArgumentParser(description='Benchmark de cuenta_palabras')
+    parser.add_argument('fichero', nargs='?', default='data/bigbangtheory_es.txt')
+    parser.add_argument('--repeticiones', type=int, default=50,
+                        help='veces que se repiten los textos del log para aumentar su tamaño')
+    args = parser.parse_args()
+
+    textos = [m.texto for m in carga_log(args.fichero)] * args.repeticiones
+    print(f"{len(textos)} mensajes, {sum(map(len, textos)) / (1 << 20):.1f} MB de texto")
+    resultados = {}
+    for nombre, funcion in [('strip por mensaje', _cuenta_palabras_strip),
+                            ('cuenta_palabras', cuenta_palabras),
+                            ('cuenta_palabras (minúsculas, sin tildes)',
+                             lambda t: cuenta_palabras(t, minusculas=True, sin_tildes=True))]:
+        inicio = perf_counter()
+        resultados[nombre] = funcion(textos)
+        print(f"{nombre}: {perf_counter() - inicio:.3f} s, {len(resultados[nombre])} palabras distintas")
+    print("Mismos conteos:", resultados['strip por mensaje'] == resultados['cuenta_palabras'])